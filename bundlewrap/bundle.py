@@ -104,8 +104,8 @@ class Bundle:
                 'node': self.node,
                 'repo': self.repo,
             }
-            for item_class in self.repo.item_classes:
-                base_env[item_class.BUNDLE_ATTRIBUTE_NAME] = {}
+            for attribute_name in self.repo.item_attribute_names:
+                base_env[attribute_name] = {}
 
             return self.repo.get_all_attrs_from_file(
                 self.items_file,
@@ -115,38 +115,36 @@ class Bundle:
     @cached_property_set
     @io.job_wrapper(_("{}  {}  creating items").format(bold("{0.node.name}"), bold("{0.name}")))
     def items(self):
-        for item_class in self.repo.item_classes:
-            attribute_value = self.bundle_item_attrs.get(
-                item_class.BUNDLE_ATTRIBUTE_NAME,
-                {},
-            )
+        for attribute_name in self.repo.item_attribute_names:
+            attribute_value = self.bundle_item_attrs.get(attribute_name, {})
             if not isinstance(attribute_value, dict):
                 raise BundleError(_(
                     "`{attr}` in bundle {bundle} is not a dict for {node}"
                 ).format(
-                    attr=item_class.BUNDLE_ATTRIBUTE_NAME,
+                    attr=attribute_name,
                     bundle=self.name,
                     node=self.node.name,
                 ))
             for item_name, item_attrs in attribute_value.items():
                 yield self.make_item(
-                    item_class.BUNDLE_ATTRIBUTE_NAME,
+                    attribute_name,
                     item_name,
                     item_attrs,
                 )
 
     def make_item(self, attribute_name, item_name, item_attrs):
-        for item_class in self.repo.item_classes:
-            if item_class.BUNDLE_ATTRIBUTE_NAME == attribute_name:
-                return item_class(self, item_name, item_attrs)
-        raise RuntimeError(
-            _("bundle '{bundle}' tried to generate item '{item}' from "
-              "unknown attribute '{attr}'").format(
-                attr=attribute_name,
-                bundle=self.name,
-                item=item_name,
+        try:
+            item_class = self.repo.item_class(attribute_name)
+        except KeyError:
+            raise RuntimeError(
+                _("bundle '{bundle}' tried to generate item '{item}' from "
+                  "unknown attribute '{attr}'").format(
+                    attr=attribute_name,
+                    bundle=self.name,
+                    item=item_name,
+                )
             )
-        )
+        return item_class(self, item_name, item_attrs)
 
     @cached_property
     def _metadata_defaults_and_reactors(self):
@@ -1,7 +1,7 @@
 from datetime import datetime
 from sys import exit
 
-from ..concurrency import WorkerPool
+from ..concurrency import Scheduler, WorkerPool
 from ..exceptions import GracefulApplyException
 from ..utils import SkipList
 from ..utils.cmdline import count_items, get_target_nodes
@@ -47,6 +47,14 @@ def bw_apply(repo, args):
     results = []
     skip_list = SkipList(args['resume_file'])
 
+    # all nodes share the same workers for their items, so workers not
+    # needed by one node (e.g. one that is almost done) can be used by
+    # another if item_workers_max allows it
+    scheduler = Scheduler(
+        workers=max(1, min(args['node_workers'], len(pending_nodes)) * args['item_workers']),
+    )
+    item_workers = item_workers_per_node(args, scheduler)
+
     def tasks_available():
         return bool(pending_nodes)
 
@@ -62,7 +70,8 @@ def bw_apply(repo, args):
                 'interactive': args['interactive'],
                 'show_diff': args['show_diff'],
                 'skip_list': skip_list,
-                'workers': args['item_workers'],
+                'scheduler': scheduler,
+                'workers': item_workers,
             },
         }
 
@@ -95,7 +104,8 @@ def bw_apply(repo, args):
         pool_id="apply",
         workers=args['node_workers'],
     )
-    worker_pool.run()
+    with scheduler:
+        worker_pool.run()
 
     total_duration = datetime.now() - start_time
     totals = stats(results)
@@ -114,6 +124,17 @@ def bw_apply(repo, args):
     exit(1 if errors or totals['failed'] else 0)
 
 
+def item_workers_per_node(args, scheduler):
+    """
+    Nodes are limited to -P workers unless --parallel-items-max allows
+    them to use more of the shared workers.
+    """
+    return min(
+        args['item_workers_max'] or args['item_workers'],
+        scheduler.number_of_workers,
+    )
+
+
 def stats(results):
     totals = {
         'items': 0,
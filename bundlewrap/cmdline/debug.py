@@ -1,9 +1,12 @@
 from code import interact
+from subprocess import PIPE, run
+from sys import executable
 
 from .. import VERSION_STRING
 from ..utils.cmdline import get_node
-from ..utils.text import mark_for_translation as _
-from ..utils.ui import io
+from ..utils.table import ROW_SEPARATOR, render_table
+from ..utils.text import bold, mark_for_translation as _
+from ..utils.ui import io, page_lines
 
 
 DEBUG_BANNER = _("BundleWrap {version} interactive repository inspector\n"
@@ -13,8 +16,70 @@ DEBUG_BANNER = _("BundleWrap {version} interactive repository inspector\n"
 DEBUG_BANNER_NODE = DEBUG_BANNER + "\n" + \
     _("> You can access the selected node as 'node'.")
 
+# run in a fresh interpreter by --startup-profile
+STARTUP_PROFILE_SCRIPT = """
+from sys import argv
+from time import perf_counter
+start = perf_counter()
+import bundlewrap.cmdline
+imported = perf_counter()
+bundlewrap.cmdline.Repository(argv[1])
+print(imported - start, perf_counter() - imported)
+"""
+
+
+def startup_profile(repo_path):
+    """
+    Imports bw and loads the given repo in a new Python process.
+    Returns the time spent importing, the time spent loading the repo
+    and a dict mapping top-level package names to the number of modules
+    imported from them and the time that took.
+    """
+    result = run(
+        [executable, "-X", "importtime", "-c", STARTUP_PROFILE_SCRIPT, repo_path],
+        check=True,
+        stderr=PIPE,
+        stdout=PIPE,
+    )
+    import_time, repo_time = (float(value) for value in result.stdout.split())
+    packages = {}
+    for line in result.stderr.decode('utf-8').splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_time, _cumulative, module = line[len("import time:"):].split("|")
+            self_time = int(self_time)
+        except ValueError:
+            continue
+        package = module.strip().split(".")[0]
+        modules, time = packages.get(package, (0, 0.0))
+        packages[package] = (modules + 1, time + self_time / 1000000)
+    return import_time, repo_time, packages
+
 
 def bw_debug(repo, args):
+    if args['startup_profile']:
+        import_time, repo_time, packages = startup_profile(repo.path)
+        rows = [
+            [
+                bold(_("package")),
+                bold(_("modules")),
+                bold(_("time")),
+            ],
+            ROW_SEPARATOR,
+        ]
+        for package, (modules, time) in sorted(
+            packages.items(),
+            key=lambda package: (-package[1][1], package[0]),
+        ):
+            rows.append([package, str(modules), "{:.3f}s".format(time)])
+        rows.append(ROW_SEPARATOR)
+        rows.append([_("importing bw"), "", "{:.3f}s".format(import_time)])
+        rows.append([_("loading repo"), "", "{:.3f}s".format(repo_time)])
+        page_lines(render_table(rows, alignments={1: 'right', 2: 'right'}))
+        return
+
     if args['node'] is None:
         env = {'repo': repo}
         banner = DEBUG_BANNER
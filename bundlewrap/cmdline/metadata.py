@@ -4,7 +4,12 @@ from sys import exit
 
 from ..metadata import metadata_to_json
 from ..utils import Fault, list_starts_with
-from ..utils.cmdline import exit_on_keyboardinterrupt, get_target_nodes
+from ..utils.cmdline import (
+    enable_reactor_profile,
+    exit_on_keyboardinterrupt,
+    get_target_nodes,
+    report_reactor_profile,
+)
 from ..utils.dicts import (
     delete_key_at_path,
     replace_key_at_path,
@@ -91,6 +96,7 @@ def _sort_dict_colorblind(old_dict):
 
 @exit_on_keyboardinterrupt
 def bw_metadata(repo, args):
+    enable_reactor_profile(repo, args)
     target_nodes = get_target_nodes(repo, args['targets'])
     key_paths = sorted([
         tuple(path.strip().split("/")) for path in args['keys'] if path
@@ -180,3 +186,5 @@ def bw_metadata(repo, args):
                     sort_keys=False,
                 ).splitlines()
             ])
+
+    report_reactor_profile(repo, args)
@@ -23,6 +23,35 @@ from .verify import bw_verify
 from .zen import bw_zen
 
 
+def add_reactor_profile_arguments(parser):
+    parser.add_argument(
+        "--reactor-profile",
+        action='store_true',
+        default=environ.get("BW_METADATA_PROFILE", "0") == "1",
+        dest='reactor_profile',
+        help=_("show how much time each metadata reactor took and how often it ran, "
+               "changed, raised KeyError, called metadata.get() and triggered other "
+               "reactors (defaults to $BW_METADATA_PROFILE)"),
+    )
+    parser.add_argument(
+        "--reactor-profile-json",
+        default=None,
+        dest='reactor_profile_json',
+        metavar=_("FILE"),
+        help=_("write metadata reactor profile to FILE as JSON"),
+        type=str,
+    )
+    parser.add_argument(
+        "--reactor-profile-trace",
+        default=None,
+        dest='reactor_profile_trace',
+        metavar=_("FILE"),
+        help=_("write individual metadata reactor runs to FILE in Chrome's "
+               "trace event format (for chrome://tracing or speedscope)"),
+        type=str,
+    )
+
+
 def build_parser_bw():
     parser = ArgumentParser(
         prog="bw",
@@ -149,6 +178,18 @@ dependencies of selected items will NOT be skipped
                "(defaults to {})").format(bw_apply_p_items_default),
         type=int,
     )
+    bw_apply_p_items_max_default = int(environ.get("BW_ITEM_WORKERS_MAX", "0")) or None
+    parser_apply.add_argument(
+        "--parallel-items-max",
+        default=bw_apply_p_items_max_default,
+        dest='item_workers_max',
+        help=_("number of items to apply simultaneously on a single node while "
+               "other nodes don't need all of their share "
+               "(defaults to {})").format(
+            bw_apply_p_items_max_default or _("the value of --parallel-items"),
+        ),
+        type=int,
+    )
     parser_apply.add_argument(
         "-s",
         "--skip",
@@ -208,6 +249,13 @@ bundle:my_bundle  # items in this bundle
         type=str,
         help=_("name of node to inspect"),
     )
+    parser_debug.add_argument(
+        "--startup-profile",
+        action='store_true',
+        dest='startup_profile',
+        help=_("show how long it takes to import bw and load this repository, "
+               "broken down by imported package"),
+    )
 
     # bw diff
     help_diff = _("Show differences between nodes")
@@ -616,6 +664,7 @@ will exit with code 47 if any matching items are locked
         dest='hide_reactors',
         help=_("hide values set by reactors in metadata.py"),
     )
+    add_reactor_profile_arguments(parser_metadata)
 
     # bw nodes
     help_nodes = _("List nodes in this repository")
@@ -1029,6 +1078,16 @@ will exit with code 47 if any matching items are locked
         dest='items',
         help=_("run item-level tests (like rendering templates)"),
     )
+    bw_test_p_default = int(environ.get("BW_NODE_WORKERS", "1"))
+    parser_test.add_argument(
+        "-j",
+        "--node-workers",
+        default=bw_test_p_default,
+        dest='node_workers',
+        help=_("number of nodes to test simultaneously "
+               "(defaults to {})").format(bw_test_p_default),
+        type=int,
+    )
     parser_test.add_argument(
         "-J",
         "--hooks-node",
@@ -1088,6 +1147,7 @@ will exit with code 47 if any matching items are locked
         dest='subgroup_loops',
         help=_("check for loops in subgroup hierarchies"),
     )
+    add_reactor_profile_arguments(parser_test)
 
     # bw verify
     help_verify = _("Inspect the health or 'correctness' of a node without changing it")
@@ -1,26 +1,100 @@
 from copy import copy
 from sys import exit
+from threading import Lock
 
+from ..concurrency import WorkerPool
 from ..deps import ItemDependencyLoop
 from ..exceptions import FaultUnavailable
 from ..itemqueue import ItemTestQueue
 from ..metadata import check_for_metadata_conflicts, metadata_to_json
 from ..repo import Repository
-from ..utils.cmdline import count_items, get_target_nodes
+from ..utils.cmdline import (
+    count_items,
+    enable_reactor_profile,
+    get_target_nodes,
+    report_reactor_profile,
+)
 from ..utils.dicts import diff_dict, diff_text
-from ..utils.text import bold, green, mark_for_translation as _, prefix_lines, red, yellow
+from ..utils.text import (
+    bold,
+    error_summary,
+    green,
+    mark_for_translation as _,
+    prefix_lines,
+    red,
+    yellow,
+)
 from ..utils.ui import io, QUIT_EVENT
 
+OUTPUT_LOCK = Lock()
 
-def test_items(nodes, ignore_missing_faults, quiet):
-    io.progress_set_total(count_items(nodes))
-    for node in nodes:
-        if QUIT_EVENT.is_set():
-            break
-        if not node.items:
-            io.stdout(_("{x} {node}  has no items").format(node=bold(node.name), x=yellow("!")))
-            continue
-        item_queue = ItemTestQueue(node)
+
+def for_each_node(nodes, target, workers, pool_id):
+    """
+    Calls target(node) for all given nodes, using the given number of
+    threads. Returns a dict mapping node names to return values.
+
+    Exceptions raised by target are reported as they come in. Once all
+    nodes are done, we exit(1) if there were any.
+    """
+    pending_nodes = list(nodes)
+    pending_nodes.reverse()
+    results = {}
+    errors = []
+
+    def tasks_available():
+        return bool(pending_nodes)
+
+    def next_task():
+        node = pending_nodes.pop()
+        return {
+            'target': target,
+            'task_id': node.name,
+            'args': (node,),
+        }
+
+    def handle_result(task_id, return_value, duration):
+        results[task_id] = return_value
+
+    def handle_exception(task_id, exception, traceback):
+        msg = "{}  {}".format(bold(task_id), exception)
+        io.stderr(traceback)
+        io.stderr(repr(exception))
+        io.stderr("{} {}".format(red("!"), msg))
+        errors.append(msg)
+
+    worker_pool = WorkerPool(
+        tasks_available,
+        next_task,
+        handle_result=handle_result,
+        handle_exception=handle_exception,
+        pool_id=pool_id,
+        workers=workers,
+    )
+    worker_pool.run()
+    if errors:
+        error_summary(errors)
+        exit(1)
+    return results
+
+
+def test_items_of_node(node, ignore_missing_faults, quiet, buffer_output=False):
+    if not node.items:
+        io.stdout(_("{x} {node}  has no items").format(node=bold(node.name), x=yellow("!")))
+        return
+
+    # when testing multiple nodes at once, we hold back output until
+    # we're done with each node so it isn't mixed up with other nodes
+    output = []
+
+    def write(stream, msg):
+        if buffer_output:
+            output.append((stream, msg))
+        else:
+            stream(msg)
+
+    item_queue = ItemTestQueue(node)
+    try:
         while not QUIT_EVENT.is_set():
             try:
                 item = item_queue.pop()
@@ -31,7 +105,7 @@ def test_items(nodes, ignore_missing_faults, quiet):
             except FaultUnavailable:
                 if ignore_missing_faults:
                     io.progress_advance()
-                    io.stderr(_("{x} {node}  {bundle}  {item}  ({msg})").format(
+                    write(io.stderr, _("{x} {node}  {bundle}  {item}  ({msg})").format(
                         bundle=bold(item.bundle.name),
                         item=item.id,
                         msg=yellow(_("Fault unavailable")),
@@ -39,7 +113,7 @@ def test_items(nodes, ignore_missing_faults, quiet):
                         x=yellow("»"),
                     ))
                 else:
-                    io.stderr(_("{x} {node}  {bundle}  {item}  missing Fault:").format(
+                    write(io.stderr, _("{x} {node}  {bundle}  {item}  missing Fault:").format(
                         bundle=bold(item.bundle.name),
                         item=item.id,
                         node=bold(node.name),
@@ -47,7 +121,7 @@ def test_items(nodes, ignore_missing_faults, quiet):
                     ))
                     raise
             except Exception:
-                io.stderr(_("{x} {node}  {bundle}  {item}").format(
+                write(io.stderr, _("{x} {node}  {bundle}  {item}").format(
                     bundle=bold(item.bundle.name),
                     item=item.id,
                     node=bold(node.name),
@@ -59,14 +133,33 @@ def test_items(nodes, ignore_missing_faults, quiet):
                     # don't count canned actions
                     io.progress_advance()
                 if not quiet:
-                    io.stdout("{x} {node}  {bundle}  {item}".format(
+                    write(io.stdout, "{x} {node}  {bundle}  {item}".format(
                         bundle=bold(item.bundle.name),
                         item=item.id,
                         node=bold(node.name),
                         x=green("✓"),
                     ))
-        if item_queue.items_with_deps and not QUIT_EVENT.is_set():
-            raise ItemDependencyLoop(item_queue.items_with_deps)
+    finally:
+        with OUTPUT_LOCK:
+            for stream, msg in output:
+                stream(msg)
+    if item_queue.items_with_deps and not QUIT_EVENT.is_set():
+        raise ItemDependencyLoop(item_queue.items_with_deps)
+
+
+def test_items(nodes, ignore_missing_faults, quiet, workers=1):
+    io.progress_set_total(count_items(nodes))
+    for_each_node(
+        nodes,
+        lambda node: test_items_of_node(
+            node,
+            ignore_missing_faults,
+            quiet,
+            buffer_output=workers > 1,
+        ),
+        workers,
+        "test_items",
+    )
     io.progress_set_total(0)
 
 
@@ -94,6 +187,7 @@ def test_metadata_conflicts(node, quiet):
             x=green("✓"),
             node=bold(node.name),
         ))
+    io.progress_advance()
 
 
 def test_orphaned_bundles(repo):
@@ -130,7 +224,7 @@ def test_empty_groups(repo):
         exit(1)
 
 
-def test_determinism(repo, nodes, iterations_config, iterations_metadata, quiet):
+def test_determinism(repo, nodes, iterations_config, iterations_metadata, quiet, workers=1):
     """
     Generate configuration a couple of times for every node and see if
     anything changes between iterations
@@ -146,8 +240,24 @@ def test_determinism(repo, nodes, iterations_config, iterations_metadata, quiet)
             break
 
         iteration_repo = Repository(repo.path)
+        # cached metadata would always be deterministic
+        iteration_repo._metadata_cache = None
 
         iteration_nodes = [iteration_repo.get_node(node.name) for node in nodes]
+        if workers > 1:
+            # generate everything in parallel, comparing results below
+            # will then just hit the caches
+            def generate(node):
+                if iter_config_todo > 0:
+                    node.hash()
+                if iter_metadata_todo > 0:
+                    node.metadata_hash()
+            for_each_node(
+                iteration_nodes,
+                generate,
+                workers,
+                "test_determinism",
+            )
         for node in iteration_nodes:
             if QUIT_EVENT.is_set():
                 break
@@ -232,13 +342,10 @@ def test_determinism(repo, nodes, iterations_config, iterations_metadata, quiet)
             ))
 
 
-def test_reactor_provides(repo, nodes, quiet):
+def test_reactor_provides(repo, nodes, quiet, workers=1):
     repo._verify_reactor_provides = True
-    for node in nodes:
-        if QUIT_EVENT.is_set():
-            break
-        node.metadata.get(())
-    else:
+    for_each_node(nodes, lambda node: node.metadata.get(()), workers, "test_reactor_provides")
+    if not QUIT_EVENT.is_set():
         if not quiet:
             io.stdout(_("{x} No reactors violated their declared keys").format(
                 x=green("✓"),
@@ -246,6 +353,7 @@ def test_reactor_provides(repo, nodes, quiet):
 
 
 def bw_test(repo, args):
+    enable_reactor_profile(repo, args)
     options_selected = (
         args['determinism_config'] > 1 or
         args['determinism_metadata'] > 1 or
@@ -277,50 +385,61 @@ def bw_test(repo, args):
             args['reactor_provides'] = True
             args['subgroup_loops'] = True
 
-    if args['reactor_provides'] and not QUIT_EVENT.is_set():
-        test_reactor_provides(repo, nodes, args['quiet'])
-
-    if args['subgroup_loops'] and not QUIT_EVENT.is_set():
-        test_subgroup_loops(repo, args['quiet'])
-
-    if args['empty_groups'] and not QUIT_EVENT.is_set():
-        test_empty_groups(repo)
-
-    if args['orphaned_bundles'] and not QUIT_EVENT.is_set():
-        test_orphaned_bundles(repo)
-
-    if args['metadata_conflicts'] and not QUIT_EVENT.is_set():
-        io.progress_set_total(len(nodes))
-        for node in nodes:
-            if QUIT_EVENT.is_set():
-                break
-            test_metadata_conflicts(node, args['quiet'])
-            io.progress_advance()
-        io.progress_set_total(0)
-
-    if args['items']:
-        test_items(nodes, args['ignore_missing_faults'], args['quiet'])
-
-    if (
-        (args['determinism_config'] > 1 or args['determinism_metadata'] > 1) and
-        not QUIT_EVENT.is_set()
-    ):
-        test_determinism(
-            repo,
-            nodes,
-            args['determinism_config'],
-            args['determinism_metadata'],
-            args['quiet'],
-        )
-
-    if args['hooks_node'] and not QUIT_EVENT.is_set():
-        io.progress_set_total(len(nodes))
-        for node in nodes:
-            if QUIT_EVENT.is_set():
-                break
-            repo.hooks.test_node(repo, node)
-            io.progress_advance()
-        io.progress_set_total(0)
+    try:
+        if args['reactor_provides'] and not QUIT_EVENT.is_set():
+            test_reactor_provides(repo, nodes, args['quiet'], workers=args['node_workers'])
+
+        if args['subgroup_loops'] and not QUIT_EVENT.is_set():
+            test_subgroup_loops(repo, args['quiet'])
+
+        if args['empty_groups'] and not QUIT_EVENT.is_set():
+            test_empty_groups(repo)
+
+        if args['orphaned_bundles'] and not QUIT_EVENT.is_set():
+            test_orphaned_bundles(repo)
+
+        if args['metadata_conflicts'] and not QUIT_EVENT.is_set():
+            io.progress_set_total(len(nodes))
+            for_each_node(
+                nodes,
+                lambda node: test_metadata_conflicts(node, args['quiet']),
+                args['node_workers'],
+                "test_metadata_conflicts",
+            )
+            io.progress_set_total(0)
+
+        if args['items'] and not QUIT_EVENT.is_set():
+            test_items(
+                nodes,
+                args['ignore_missing_faults'],
+                args['quiet'],
+                workers=args['node_workers'],
+            )
+
+        if (
+            (args['determinism_config'] > 1 or args['determinism_metadata'] > 1) and
+            not QUIT_EVENT.is_set()
+        ):
+            test_determinism(
+                repo,
+                nodes,
+                args['determinism_config'],
+                args['determinism_metadata'],
+                args['quiet'],
+                workers=args['node_workers'],
+            )
+
+        if args['hooks_node'] and not QUIT_EVENT.is_set():
+            io.progress_set_total(len(nodes))
+            for node in nodes:
+                if QUIT_EVENT.is_set():
+                    break
+                repo.hooks.test_node(repo, node)
+                io.progress_advance()
+            io.progress_set_total(0)
 
-    if args['hooks_repo'] and not QUIT_EVENT.is_set():
-        repo.hooks.test(repo)
+        if args['hooks_repo'] and not QUIT_EVENT.is_set():
+            repo.hooks.test(repo)
+    finally:
+        # failed checks exit right away, but we still want the profile
+        report_reactor_profile(repo, args)
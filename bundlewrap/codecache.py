@@ -0,0 +1,73 @@
+from hashlib import sha1
+from importlib.util import MAGIC_NUMBER
+from marshal import dumps, loads
+from os import replace, stat
+from os.path import exists, join
+from struct import pack
+from tempfile import mkstemp
+
+from .metacache import DIRNAME_CACHE, make_cache_dir
+from .utils import error_context, get_file_contents
+from .utils.ui import io
+
+
+DIRNAME_CODE_CACHE = "code"
+
+
+class CodeCache:
+    """
+    Stores the compiled code of files loaded through
+    Repository.get_all_attrs_from_file() (nodes.py, groups.py and the
+    items.py and metadata.py of each bundle) on disk, much like Python
+    does for regular modules in __pycache__.
+
+    Cache entries are only used if the modification time and size of
+    the source file as well as the Python bytecode version match.
+    """
+    def __init__(self, repo):
+        self.path = join(repo.path, DIRNAME_CACHE, DIRNAME_CODE_CACHE)
+        self.repo_path = repo.path
+
+    def _cache_file(self, path):
+        return join(self.path, sha1(path.encode('utf-8')).hexdigest() + ".marshal")
+
+    def compile(self, path):
+        """
+        Returns the code object for the given source file.
+        """
+        # stat before reading the source so we never store code for a
+        # newer version of the file under the header of an older one
+        with error_context(path=path):
+            source_stat = stat(path)
+        header = MAGIC_NUMBER + pack("<QQ", source_stat.st_mtime_ns, source_stat.st_size)
+        cache_file = self._cache_file(path)
+
+        try:
+            with open(cache_file, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            io.debug(f"unable to read code cache for {path}: {repr(exc)}")
+        else:
+            if data.startswith(header):
+                try:
+                    return loads(data[len(header):])
+                except (EOFError, TypeError, ValueError) as exc:
+                    io.debug(f"unable to load code cache for {path}: {repr(exc)}")
+
+        source = get_file_contents(path)
+        with error_context(path=path):
+            code = compile(source, path, mode='exec')
+
+        try:
+            if not exists(self.path):
+                make_cache_dir(self.repo_path, DIRNAME_CODE_CACHE)
+            handle, tmp_path = mkstemp(dir=self.path, prefix=".tmp_")
+            with open(handle, 'wb') as f:
+                f.write(header + dumps(code))
+            replace(tmp_path, cache_file)
+        except OSError as exc:
+            io.debug(f"unable to write code cache for {path}: {repr(exc)}")
+
+        return code
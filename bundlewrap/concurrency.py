@@ -1,7 +1,8 @@
-from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from random import randint
 from sys import exit
+from threading import Lock
 from traceback import format_tb
 
 from .utils.text import mark_for_translation as _
@@ -10,9 +11,85 @@ from .utils.ui import io, QUIT_EVENT
 JOIN_TIMEOUT = 5  # seconds
 
 
+class Scheduler:
+    """
+    Shares a fixed number of worker threads between many WorkerPools,
+    e.g. one per node. Pools take a worker whenever they have a task
+    ready, so workers left idle by one pool can be used by another.
+    When workers are scarce, pools currently running fewer tasks than
+    others get to go first.
+    """
+    def __init__(self, workers=16):
+        if workers < 1:
+            raise ValueError(_("at least one worker is required"))
+
+        self.number_of_workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = Lock()
+        self._running = {}
+        self._running_total = 0
+        self._waiting = {}
+
+    def acquire(self, pool_id):
+        """
+        Reserves a worker for the given pool and returns None. If there
+        is no worker available for the pool right now, it returns a
+        Future that completes when it might be worth trying again.
+        """
+        with self._lock:
+            running = self._running.get(pool_id, 0)
+            if self._running_total < self.number_of_workers and not any(
+                self._running.get(other_pool_id, 0) < running
+                for other_pool_id in self._waiting
+            ):
+                self._running[pool_id] = running + 1
+                self._running_total += 1
+                self._waiting.pop(pool_id, None)
+                self._notify()
+                return None
+            if pool_id not in self._waiting or self._waiting[pool_id].done():
+                self._waiting[pool_id] = Future()
+            return self._waiting[pool_id]
+
+    def release(self, pool_id):
+        """
+        Returns a worker previously reserved with acquire().
+        """
+        with self._lock:
+            self._running[pool_id] -= 1
+            self._running_total -= 1
+            self._notify()
+
+    def stop_waiting(self, pool_id):
+        """
+        Must be called by pools that are no longer interested in the
+        worker they asked for, so others don't wait for them.
+        """
+        with self._lock:
+            if self._waiting.pop(pool_id, None) is not None:
+                self._notify()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def _notify(self):
+        for future in self._waiting.values():
+            if not future.done():
+                future.set_result(None)
+
+
 class WorkerPool:
     """
     Manages a bunch of worker threads.
+
+    If a Scheduler is given, this pool will run at most `workers` tasks
+    at once, but only as long as the scheduler has workers to spare.
     """
     def __init__(
         self,
@@ -23,6 +100,7 @@ class WorkerPool:
         cleanup=None,
         pool_id=None,
         workers=4,
+        scheduler=None,
     ):
         if workers < 1:
             raise ValueError(_("at least one worker is required"))
@@ -32,12 +110,15 @@ class WorkerPool:
         self.handle_result = handle_result
         self.handle_exception = handle_exception
         self.cleanup = cleanup
+        self.scheduler = scheduler
 
         self.number_of_workers = workers
         self.idle_workers = set(range(self.number_of_workers))
 
         self.pool_id = "unnamed_pool_{}".format(randint(1, 99999)) if pool_id is None else pool_id
         self.pending_futures = {}
+        self._wakeup = None
+        self._wakeup_fired = False
 
     def _get_result(self):
         """
@@ -46,10 +127,20 @@ class WorkerPool:
         io.debug(_("worker pool {pool} waiting for next task to complete").format(
             pool=self.pool_id,
         ))
+        futures = set(self.pending_futures.keys())
+        if self._wakeup is not None:
+            futures.add(self._wakeup)
         completed, pending = wait(
-            self.pending_futures.keys(),
+            futures,
             return_when=FIRST_COMPLETED,
         )
+        if self._wakeup in completed:
+            # the scheduler might have a worker for us now
+            completed.remove(self._wakeup)
+            self._wakeup = None
+            self._wakeup_fired = True
+        if not completed:
+            return None
         future = completed.pop()
 
         start_time = self.pending_futures[future]['start_time']
@@ -103,17 +194,32 @@ class WorkerPool:
             task=task_id,
             worker=worker_id,
         ))
-        self.pending_futures[self.executor.submit(target, *args, **kwargs)] = {
+        future = self.executor.submit(target, *args, **kwargs)
+        if self.scheduler is not None:
+            future.add_done_callback(lambda future: self.scheduler.release(self.pool_id))
+        self.pending_futures[future] = {
             'start_time': datetime.now(),
             'task_id': task_id,
             'worker_id': worker_id,
         }
 
+    def _reserve_worker(self):
+        """
+        Returns True if we may start another task.
+        """
+        if self.scheduler is None:
+            return True
+        self._wakeup = self.scheduler.acquire(self.pool_id)
+        return self._wakeup is None
+
     def run(self):
         io.debug(_("spinning up worker pool {pool}").format(pool=self.pool_id))
         processed_results = []
         exit_code = None
-        self.executor = ThreadPoolExecutor(max_workers=self.number_of_workers)
+        if self.scheduler is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.number_of_workers)
+        else:
+            self.executor = self.scheduler.executor
         try:
             while (
                 (self.tasks_available() and not QUIT_EVENT.is_set()) or
@@ -122,13 +228,30 @@ class WorkerPool:
                 while (
                     self.tasks_available() and
                     self.workers_are_available and
-                    not QUIT_EVENT.is_set()
+                    not QUIT_EVENT.is_set() and
+                    self._reserve_worker()
                 ):
                     task = self.next_task()
                     if task is not None:
                         self.start_task(**task)
+                    elif self.scheduler is not None:
+                        self.scheduler.release(self.pool_id)
+
+                if self._wakeup_fired:
+                    self._wakeup_fired = False
+                    if self._wakeup is None:
+                        # We didn't ask for another worker, but the
+                        # scheduler still thinks we're waiting. That
+                        # would hold back all other pools.
+                        self.scheduler.stop_waiting(self.pool_id)
+
+                if self._wakeup is not None and (
+                    not self.tasks_available() or QUIT_EVENT.is_set()
+                ):
+                    self.scheduler.stop_waiting(self.pool_id)
+                    self._wakeup = None
 
-                if self.workers_are_running:
+                if self.workers_are_running or self._wakeup is not None:
                     try:
                         result = self._get_result()
                     except SystemExit as exc:
@@ -150,7 +273,7 @@ class WorkerPool:
                                 self.handle_exception(exc.__task_id, exc, traceback)
                             )
                     else:
-                        if self.handle_result is not None:
+                        if result is not None and self.handle_result is not None:
                             processed_results.append(self.handle_result(*result))
             if QUIT_EVENT.is_set():
                 # we have reaped all our workers, let's stop this thread
@@ -161,7 +284,10 @@ class WorkerPool:
             io.debug(_("shutting down worker pool {pool}").format(pool=self.pool_id))
             if self.cleanup:
                 self.cleanup()
-            self.executor.shutdown()
+            if self.scheduler is None:
+                self.executor.shutdown()
+            else:
+                self.scheduler.stop_waiting(self.pool_id)
             io.debug(_("worker pool {pool} has been shut down").format(pool=self.pool_id))
 
     @property
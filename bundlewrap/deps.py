@@ -30,6 +30,46 @@ class TagFillerItem(Item):
         return {}
 
 
+class ItemIndex:
+    """
+    A collection of items that can be looked up by ID, type, tag and
+    bundle without going through all of them. Can be used in place of
+    the list of items for resolve_selector() and find_item().
+
+    Items must not be renamed or moved to another bundle while they are
+    in the index. Tags added to an item must be announced with
+    add_tags().
+    """
+    def __init__(self, items=()):
+        self._items = set()
+        self.by_bundle = {}
+        self.by_id = {}
+        self.by_tag = {}
+        self.by_type = {}
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        self._items.add(item)
+        self.by_id[item.id] = item
+        self.by_bundle.setdefault(item.bundle.name, set()).add(item)
+        self.by_type.setdefault(item.ITEM_TYPE_NAME, set()).add(item)
+        self.add_tags(item, item.tags)
+
+    def add_tags(self, item, tags):
+        for tag in tags:
+            self.by_tag.setdefault(tag, set()).add(item)
+
+
 def resolve_selector(selector, items, originating_item_id=None, originating_tag=None):
     """
     Given an item selector (e.g. 'bundle:foo' or 'file:/bar'), return
@@ -38,13 +78,27 @@ def resolve_selector(selector, items, originating_item_id=None, originating_tag=
     if selector.startswith("!"):
         negate = lambda b: not b
         selector = selector[1:]
+        negated = True
     else:
         negate = lambda b: b
+        negated = False
     try:
         selector_type, selector_name = selector.split(":", 1)
     except ValueError:
         raise ValueError(_("invalid item selector: {}").format(selector))
 
+    if isinstance(items, ItemIndex) and not negated:
+        if selector_type == "bundle":
+            candidates = items.by_bundle.get(selector_name, ())
+        elif selector_type == "tag" and selector_name:
+            candidates = items.by_tag.get(selector_name, ())
+        elif selector_type != "tag" and not selector_name:
+            candidates = items.by_type.get(selector_type, ())
+        else:
+            candidates = None
+        if candidates is not None:
+            return [item for item in candidates if item.id != originating_item_id]
+
     if selector_type == "bundle":
         return filter(
             lambda item:
@@ -82,11 +136,15 @@ def find_item(item_id, items):
     Returns the first item with the given ID within the given list of
     items.
     """
-    try:
-        item = list(filter(lambda item: item.id == item_id, items))[0]
-    except IndexError:
-        raise NoSuchItem(_("item not found: {}").format(item_id))
-    return item
+    if isinstance(items, ItemIndex):
+        try:
+            return items.by_id[item_id]
+        except KeyError:
+            raise NoSuchItem(_("item not found: {}").format(item_id))
+    for item in items:
+        if item.id == item_id:
+            return item
+    raise NoSuchItem(_("item not found: {}").format(item_id))
 
 
 def _flatten_dependencies(items):
@@ -531,6 +589,7 @@ def _add_inherited_tags(items, bundles):
                     len_before = len(item.tags)
                     item.tags.update(inherited_tags)
                     if len_before < len(item.tags):
+                        items.add_tags(item, inherited_tags)
                         tags_added = True
 
 
@@ -544,78 +603,20 @@ def prepare_dependencies(node):
         
     items = set(node.items)  # might be a tuple from cached_property
     _inject_canned_actions(items)
-    _inject_tag_filler_items(items, node.bundles)
-    _add_inherited_tags(items, node.bundles)
-    _inject_tag_attrs(items, node.bundles)
+    # from here on, new items and tags must be added to the index
+    index = ItemIndex(items)
+    _inject_tag_filler_items(index, node.bundles)
+    _add_inherited_tags(index, node.bundles)
+    _inject_tag_attrs(index, node.bundles)
+    items = set(index)
     _prepare_auto_attrs(items)
-    _prepare_deps(items)
-    _inject_reverse_triggers(items)
-    _inject_reverse_dependencies(items)
-    _inject_trigger_dependencies(items)
-    _inject_preceded_by_dependencies(items)
+    _prepare_deps(index)
+    _inject_reverse_triggers(index)
+    _inject_reverse_dependencies(index)
+    _inject_trigger_dependencies(index)
+    _inject_preceded_by_dependencies(index)
     _flatten_dependencies(items)
     _add_incoming_needs(items)
     _inject_concurrency_blockers(items, node.os, node.os_version)
 
     return items
-
-
-def remove_dep_from_items(items, dep):
-    """
-    Removes the given item id (dep) from the temporary list of
-    dependencies of all items in the given list.
-    """
-    for item in items:
-        with suppress(KeyError):
-            item._deps.remove(dep)
-    return items
-
-
-def remove_item_dependents(items, dep_item):
-    """
-    Removes the items depending on the given item from the list of items.
-    """
-    removed_items = set()
-    for item in items:
-        if dep_item in item._deps_needs | item._deps_needed_by:
-            removed_items.add(item)
-        with suppress(KeyError):
-            item._deps.remove(dep_item)
-
-    for item in removed_items:
-        items.remove(item)
-
-    if removed_items:
-        io.debug(
-            "skipped these items because they depend on {item}, which was "
-            "skipped previously: {skipped}".format(
-                item=dep_item.id,
-                skipped=", ".join([item.id for item in removed_items]),
-            )
-        )
-
-    all_recursively_removed_items = set()
-    for removed_item in removed_items:
-        if removed_item.cascade_skip:
-            items, recursively_removed_items = \
-                remove_item_dependents(items, removed_item)
-            all_recursively_removed_items.update(recursively_removed_items)
-        else:
-            items = remove_dep_from_items(items, removed_item)
-
-    return (items, removed_items | all_recursively_removed_items)
-
-
-def split_items_without_deps(items):
-    """
-    Takes a list of items and extracts the ones that don't have any
-    dependencies. The extracted deps are returned as a list.
-    """
-    remaining_items = set()
-    removed_items = set()
-    for item in items:
-        if item._deps:
-            remaining_items.add(item)
-        else:
-            removed_items.add(item)
-    return (remaining_items, removed_items)
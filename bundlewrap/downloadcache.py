@@ -0,0 +1,217 @@
+from atexit import register as at_exit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_SH
+from os import close, environ, fstat, getpid, makedirs, replace, scandir, unlink, utime
+from os.path import join
+from shutil import rmtree
+from tempfile import gettempdir, mkstemp
+from threading import Lock
+from time import time_ns
+
+from .utils import download, sha1
+from .utils.text import mark_for_translation as _
+from .utils.ui import io
+
+
+DOWNLOAD_WORKERS = 4
+
+
+@contextmanager
+def _locked(path):
+    with open(path, 'a') as f:
+        flock(f, LOCK_EX)
+        yield
+
+
+class DownloadCache:
+    """
+    Stores files downloaded by file items with content_type 'download'.
+
+    Downloaded files are stored by their sha1 hash in objects/, urls/
+    maps the hash of each URL to the hash of the file last downloaded
+    from it. Processes downloading the same URL wait for each other
+    using flock() on a file in locks/. Each process holds a shared lock
+    on the objects it uses, so they are never evicted from underneath
+    it.
+    """
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+        self._executor = None
+        self._futures = {}
+        self._lock = Lock()
+        self._objects_in_use = {}
+        for subdir in ("locks", "objects", "tmp", "urls"):
+            makedirs(join(self.path, subdir), exist_ok=True)
+
+    def get(self, url, content_hash=None, timeout=60.0):
+        """
+        Returns the path to a local copy of the given URL and its sha1
+        hash. If content_hash is given, a file with that hash is
+        returned without downloading anything if it is already in the
+        cache, regardless of the URL it came from.
+        """
+        future = self._future(url, content_hash, timeout)
+        try:
+            return future.result()
+        except Exception:
+            # let the next caller try again
+            with self._lock:
+                if self._futures.get((url, content_hash)) is future:
+                    del self._futures[(url, content_hash)]
+            raise
+
+    def prefetch(self, url, content_hash=None, timeout=60.0):
+        """
+        Starts getting the given URL in the background, see get().
+        """
+        self._future(url, content_hash, timeout)
+
+    def _future(self, url, content_hash, timeout):
+        key = (url, content_hash)
+        with self._lock:
+            if key not in self._futures:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=DOWNLOAD_WORKERS,
+                        thread_name_prefix="bw-download",
+                    )
+                self._futures[key] = self._executor.submit(
+                    self._get, url, content_hash, timeout,
+                )
+            return self._futures[key]
+
+    def _get(self, url, content_hash, timeout):
+        if content_hash:
+            path = self._use_object(content_hash)
+            if path is not None:
+                io.debug(f"found {url} in download cache by content hash")
+                return path, content_hash
+
+        url_hash = sha1(url.encode('utf-8'))
+        with _locked(join(self.path, "locks", url_hash)):
+            object_hash = self._read_url_index(url_hash)
+            if object_hash and (not content_hash or object_hash == content_hash):
+                path = self._use_object(object_hash)
+                if path is not None:
+                    io.debug(f"found {url} in download cache")
+                    return path, object_hash
+
+            io.debug(f"starting download from {url}")
+            object_hash = self._download(url, timeout)
+            io.debug(f"finished download from {url}")
+            path = self._use_object(object_hash)
+            if path is None:
+                raise RuntimeError(_(
+                    "{url} was evicted from the download cache right after downloading it, "
+                    "BW_FILE_DOWNLOAD_CACHE_SIZE is probably too small"
+                ).format(url=url))
+            self._write_url_index(url_hash, object_hash)
+
+        self._evict()
+        return path, object_hash
+
+    def _download(self, url, timeout):
+        handle, tmp_path = mkstemp(dir=join(self.path, "tmp"))
+        close(handle)
+        try:
+            object_hash = download(url, tmp_path, timeout=timeout)
+            replace(tmp_path, join(self.path, "objects", object_hash))
+        finally:
+            with suppress(FileNotFoundError):
+                unlink(tmp_path)
+        return object_hash
+
+    def _evict(self):
+        """
+        Removes the least recently used objects until the cache is no
+        larger than max_size. Objects used by any process are kept.
+        """
+        if not self.max_size:
+            return
+        with open(join(self.path, "locks", ".evict"), 'a') as evict_lock:
+            try:
+                flock(evict_lock, LOCK_EX | LOCK_NB)
+            except BlockingIOError:
+                # someone else is already on it
+                return
+            objects = []
+            for entry in scandir(join(self.path, "objects")):
+                with suppress(FileNotFoundError):
+                    entry_stat = entry.stat()
+                    objects.append((entry_stat.st_atime_ns, entry_stat.st_size, entry.path))
+            total_size = sum(size for atime, size, path in objects)
+            for atime, size, path in sorted(objects):
+                if total_size <= self.max_size:
+                    break
+                try:
+                    with open(path, 'rb') as f:
+                        flock(f, LOCK_EX | LOCK_NB)
+                        io.debug(f"evicting {path} from download cache")
+                        unlink(path)
+                except BlockingIOError:
+                    continue
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+
+    def _read_url_index(self, url_hash):
+        try:
+            with open(join(self.path, "urls", url_hash)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _use_object(self, object_hash):
+        path = join(self.path, "objects", object_hash)
+        with self._lock:
+            if object_hash in self._objects_in_use:
+                return path
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        flock(f, LOCK_SH)
+        object_stat = fstat(f.fileno())
+        if not object_stat.st_nlink:
+            # evicted while we were waiting for the lock
+            f.close()
+            return None
+        # atime is what we use to find the least recently used objects,
+        # mtime is left alone so hash_local_file() can cache the hash
+        utime(path, ns=(time_ns(), object_stat.st_mtime_ns))
+        with self._lock:
+            # the lock is held until this process exits
+            if self._objects_in_use.setdefault(object_hash, f) is not f:
+                f.close()
+        return path
+
+    def _write_url_index(self, url_hash, object_hash):
+        handle, tmp_path = mkstemp(dir=join(self.path, "tmp"))
+        with open(handle, 'w') as f:
+            f.write(object_hash)
+        replace(tmp_path, join(self.path, "urls", url_hash))
+
+
+_DOWNLOAD_CACHE = None
+_DOWNLOAD_CACHE_LOCK = Lock()
+
+
+def get_download_cache():
+    """
+    Returns the DownloadCache for this process. Unless
+    BW_FILE_DOWNLOAD_CACHE is set, it lives in a temporary directory
+    that is removed when bw exits.
+    """
+    global _DOWNLOAD_CACHE
+    with _DOWNLOAD_CACHE_LOCK:
+        if _DOWNLOAD_CACHE is None:
+            path = environ.get("BW_FILE_DOWNLOAD_CACHE")
+            if not path:
+                path = join(gettempdir(), "bw-file-download-cache-{}".format(getpid()))
+                io.debug(_("registering {} for deletion on exit").format(path))
+                at_exit(rmtree, path, ignore_errors=True)
+            max_size = int(environ.get("BW_FILE_DOWNLOAD_CACHE_SIZE", "0")) * 1024 * 1024
+            _DOWNLOAD_CACHE = DownloadCache(path, max_size=max_size)
+        return _DOWNLOAD_CACHE
@@ -1,9 +1,8 @@
+from heapq import heapify, heappop, heappush
 from os import mkdir
 from os.path import exists, join
 import re
 
-from tomlkit import dumps as toml_dump, parse as toml_parse
-
 from .exceptions import NoSuchGroup, NoSuchNode, RepositoryError
 from .utils import (
     cached_property,
@@ -105,6 +104,253 @@ def _build_error_chain(loop_node, last_node, nodes_in_between):
     return error_chain
 
 
+# things we can't safely put into a larger regex next to other
+# patterns: backreferences and conditionals refer to groups by number
+# or name
+UNCOMBINABLE_PATTERN = re.compile(r"\\\d|\(\?P=|\(\?\(")
+
+
+def _combine_patterns(patterns):
+    """
+    Returns a single compiled regex that matches wherever any of the
+    given compiled regexes matches. Returns None if that's not possible.
+    """
+    if not patterns:
+        return None
+    for pattern in patterns:
+        if pattern.flags & ~re.UNICODE or UNCOMBINABLE_PATTERN.search(pattern.pattern):
+            return None
+    try:
+        return re.compile("|".join(
+            "(?:{})".format(pattern.pattern) for pattern in patterns
+        ))
+    except re.error:
+        # e.g. inline flags or names used for groups in more than one
+        # pattern
+        return None
+
+
+class GroupMembership:
+    """
+    Knows which nodes are in which groups and how groups are nested,
+    computed in one go for all groups and nodes of a repo.
+    """
+    def __init__(self, repo):
+        groups = repo.groups
+        self._group_by_name = {group.name: group for group in groups}
+
+        immediate_subgroup_names = {
+            group: set(group._attributes.get('subgroups', set())) |
+            set(group._subgroup_names_from_patterns)
+            for group in groups
+        }
+        for group in groups:
+            for supergroup in group._supergroups_from_attribute:
+                immediate_subgroup_names[supergroup].add(group.name)
+
+        self.immediate_subgroups = {}
+        for group in groups:
+            self.immediate_subgroups[group] = set()
+            for subgroup_name in immediate_subgroup_names[group]:
+                try:
+                    self.immediate_subgroups[group].add(self._group_by_name[subgroup_name])
+                except KeyError:
+                    raise RepositoryError(_(
+                        "Group '{group}' has '{subgroup}' listed as a subgroup in groups.py, "
+                        "but no such group could be found."
+                    ).format(
+                        group=group.name,
+                        subgroup=subgroup_name,
+                    ))
+
+        self.subgroups = {}
+        for group in groups:
+            self._find_subgroups(group, set())
+
+        self.immediate_parent_groups = {group: set() for group in groups}
+        self.parent_groups = {group: set() for group in groups}
+        for group in groups:
+            for subgroup in self.immediate_subgroups[group]:
+                self.immediate_parent_groups[subgroup].add(group)
+            for subgroup in self.subgroups[group]:
+                self.parent_groups[subgroup].add(group)
+
+        # only group attributes and node names are needed to figure
+        # out which groups claim which nodes, so we can do that for all
+        # nodes without loading their attributes (see LazyDict)
+        self._groups_from_group_attributes = {node: set() for node in repo.nodes}
+        for group in groups:
+            for node in group._nodes_from_members:
+                self._groups_from_group_attributes[node].add(group)
+        self._add_groups_from_member_patterns(groups)
+
+        self._repo = repo
+        self._immediate_groups = {}
+        self._groups = {}
+        self._nodes = None
+
+        # many nodes share the same set of groups, so these are
+        # keyed by frozensets of groups
+        self._attributes = {}
+        self._order = {}
+
+    def attributes(self, groups):
+        """
+        Returns a dict mapping attribute names to (value, group name)
+        tuples, with the value taken from the most specific of the
+        given groups that sets the attribute.
+        """
+        groups = frozenset(groups)
+        if groups not in self._attributes:
+            attributes = {}
+            for group_name in self.order(groups):
+                group = self._group_by_name[group_name]
+                for attr in GROUP_ATTR_DEFAULTS:
+                    value = getattr(group, attr)
+                    if value is not None:
+                        attributes[attr] = (value, group_name)
+            self._attributes[groups] = attributes
+        return self._attributes[groups]
+
+    def group_nodes(self, group):
+        """
+        Returns the set of all nodes in the given group, including
+        those in its subgroups.
+        """
+        if self._nodes is None:
+            nodes = {group: set() for group in self._group_by_name.values()}
+            for node in self._repo.nodes:
+                for node_group in self.node_groups(node):
+                    nodes[node_group].add(node)
+            self._nodes = nodes
+        return self._nodes[group]
+
+    def node_groups(self, node):
+        """
+        Returns the set of all groups the given node is in, including
+        parent groups.
+        """
+        if node not in self._groups:
+            groups = set(self.node_immediate_groups(node))
+            for group in self.node_immediate_groups(node):
+                groups.update(self.parent_groups[group])
+            self._groups[node] = groups
+        return self._groups[node]
+
+    def node_immediate_groups(self, node):
+        """
+        Returns the set of groups the given node is in because it
+        is listed in them or they are listed in the node itself.
+        """
+        if node not in self._immediate_groups:
+            immediate_groups = set(self._groups_from_group_attributes[node])
+            for group_name in node._attributes.get('groups', set()):
+                try:
+                    immediate_groups.add(self._group_by_name[group_name])
+                except KeyError:
+                    raise RepositoryError(_(
+                        "Node '{node}' has '{group}' listed as a group, "
+                        "but no such group could be found."
+                    ).format(
+                        node=node.name,
+                        group=group_name,
+                    ))
+            self._immediate_groups[node] = immediate_groups
+        return self._immediate_groups[node]
+
+    def order(self, groups):
+        """
+        Returns the names of the given groups ordered so that parent
+        groups appear before any of their subgroups. Unrelated groups
+        are ordered by name.
+        """
+        groups = frozenset(groups)
+        if groups not in self._order:
+            parent_count = {
+                group: len(self.parent_groups[group] & groups) for group in groups
+            }
+            available = [group.name for group, count in parent_count.items() if not count]
+            heapify(available)
+            order = []
+            while available:
+                group = self._group_by_name[heappop(available)]
+                order.append(group.name)
+                for subgroup in self.subgroups[group] & groups:
+                    parent_count[subgroup] -= 1
+                    if not parent_count[subgroup]:
+                        heappush(available, subgroup.name)
+            if len(order) != len(groups):
+                raise RuntimeError(
+                    _("encountered subgroup loop that should have been detected")
+                )
+            self._order[groups] = tuple(order)
+        return list(self._order[groups])
+
+    def _add_groups_from_member_patterns(self, groups):
+        matchers = []
+        all_patterns = []
+        for group in groups:
+            if not group._member_patterns:
+                continue
+            combined = _combine_patterns(group._member_patterns)
+            if combined is None:
+                matchers.append((group, group._member_patterns))
+            else:
+                matchers.append((group, (combined,)))
+            all_patterns.extend(group._member_patterns)
+        if not matchers:
+            return
+        # most nodes are probably not matched by any pattern, this lets
+        # us skip them quickly
+        any_pattern = _combine_patterns(all_patterns)
+
+        for node, immediate_groups in self._groups_from_group_attributes.items():
+            if any_pattern is not None and any_pattern.search(node.name) is None:
+                continue
+            for group, patterns in matchers:
+                if group in immediate_groups:
+                    continue
+                for pattern in patterns:
+                    if pattern.search(node.name) is not None:
+                        immediate_groups.add(group)
+                        break
+
+    def _find_subgroups(self, group, visiting):
+        if group in self.subgroups:
+            return self.subgroups[group]
+        if group in visiting:
+            self._raise_for_subgroup_loop(group, [group.name])
+        visiting.add(group)
+        result = set()
+        for subgroup in self.immediate_subgroups[group]:
+            result.add(subgroup)
+            result.update(self._find_subgroups(subgroup, visiting))
+        visiting.remove(group)
+        self.subgroups[group] = result
+        return result
+
+    def _raise_for_subgroup_loop(self, group, visited_names):
+        """
+        Walks subgroups of the given group until it finds the loop it
+        is part of and raises an error describing it.
+        """
+        for subgroup in self.immediate_subgroups[group]:
+            if subgroup.name in visited_names:
+                error_chain = _build_error_chain(
+                    subgroup.name,
+                    group.name,
+                    visited_names,
+                )
+                raise RepositoryError(_(
+                    "Group '{group}' can't be a subgroup of itself. "
+                    "({chain})"
+                ).format(
+                    group=subgroup.name,
+                    chain=" -> ".join(error_chain),
+                ))
+            self._raise_for_subgroup_loop(subgroup, visited_names + [group.name])
+
+
 class Group:
     """
     A group of nodes.
@@ -171,9 +417,7 @@ class Group:
 
     @cached_property_set
     def nodes(self):
-        for node in self.repo.nodes:
-            if node.in_group(self.name):
-                yield node
+        return self.repo._group_membership.group_nodes(self)
 
     @cached_property_set
     def _nodes_from_members(self):
@@ -222,66 +466,27 @@ class Group:
                 ))
             yield supergroup
 
-    def _check_subgroup_names(self, visited_names):
-        """
-        Recursively finds subgroups and checks for loops.
-        """
-        for name in self._immediate_subgroup_names:
-            if name not in visited_names:
-                try:
-                    group = self.repo.get_group(name)
-                except NoSuchGroup:
-                    raise RepositoryError(_(
-                        "Group '{group}' has '{subgroup}' listed as a subgroup in groups.py, "
-                        "but no such group could be found."
-                    ).format(
-                        group=self.name,
-                        subgroup=name,
-                    ))
-                for group_name in group._check_subgroup_names(
-                    visited_names + [self.name],
-                ):
-                    yield group_name
-            else:
-                error_chain = _build_error_chain(
-                    name,
-                    self.name,
-                    visited_names,
-                )
-                raise RepositoryError(_(
-                    "Group '{group}' can't be a subgroup of itself. "
-                    "({chain})"
-                ).format(
-                    group=name,
-                    chain=" -> ".join(error_chain),
-                ))
-        if self.name not in visited_names:
-            yield self.name
-
     @cached_property_set
     def parent_groups(self):
-        for group in self.repo.groups:
-            if self in group.subgroups:
-                yield group
+        return self.repo._group_membership.parent_groups[self]
 
     @cached_property_set
     def immediate_parent_groups(self):
-        for group in self.repo.groups:
-            if self in group.immediate_subgroups:
-                yield group
+        return self.repo._group_membership.immediate_parent_groups[self]
 
     @cached_property_set
     def subgroups(self):
         """
         Iterator over all subgroups as group objects.
         """
-        for group_name in set(self._check_subgroup_names([self.name])):
-            yield self.repo.get_group(group_name)
+        return self.repo._group_membership.subgroups[self]
 
     @cached_property
     def toml(self):
         if not self.file_path or not self.file_path.endswith(".toml"):
             raise ValueError(_("group {} not in TOML format").format(self.name))
+        from tomlkit import parse as toml_parse  # slow import, only needed here
+
         return toml_parse(get_file_contents(self.file_path))
 
     def toml_save(self):
@@ -294,6 +499,8 @@ class Group:
             self.file_path = join(self.repo.path, "groups", self.name + ".toml")
         if not exists(join(self.repo.path, "groups")):
             mkdir(join(self.repo.path, "groups"))
+        from tomlkit import dumps as toml_dump
+
         with open(self.file_path, 'w') as f:
             f.write(toml_clean(toml_dump(toml_doc)))
 
@@ -307,22 +514,4 @@ class Group:
         """
         Iterator over all immediate subgroups as group objects.
         """
-        for group_name in self._immediate_subgroup_names:
-            try:
-                yield self.repo.get_group(group_name)
-            except NoSuchGroup:
-                raise RepositoryError(_(
-                    "Group '{group}' has '{subgroup}' listed as a subgroup in groups.py, "
-                    "but no such group could be found."
-                ).format(
-                    group=self.name,
-                    subgroup=group_name,
-                ))
-
-    @cached_property_set
-    def _immediate_subgroup_names(self):
-        return (
-            list(self._attributes.get('subgroups', set())) +
-            list(self._subgroup_names_from_patterns) +
-            [group.name for group in self.repo.groups if self in group._supergroups_from_attribute]
-        )
+        return self.repo._group_membership.immediate_subgroups[self]
@@ -1,10 +1,4 @@
-from .deps import (
-    find_item,
-    prepare_dependencies,
-    remove_item_dependents,
-    remove_dep_from_items,
-    split_items_without_deps,
-)
+from .deps import find_item, ItemIndex, prepare_dependencies
 from .exceptions import NoSuchItem
 from .utils.text import mark_for_translation as _
 from .utils.ui import io
@@ -12,19 +6,93 @@ from .utils.ui import io
 
 class BaseQueue:
     def __init__(self, node):
-        self.items_with_deps = prepare_dependencies(node)
+        all_items = prepare_dependencies(node)
+        self.item_index = ItemIndex(all_items)
+        self.items_with_deps = set()
         self.items_without_deps = set()
-        self._split()
         self.pending_items = set()
-
-    def _split(self):
-        self.items_with_deps, self.items_without_deps = \
-            split_items_without_deps(self.all_items)
+        # maps each item to the items that have it in their _deps
+        self._dependents = {}
+        for item in all_items:
+            if item._deps:
+                self.items_with_deps.add(item)
+            else:
+                self.items_without_deps.add(item)
+            for dep_item in item._deps:
+                self._dependents.setdefault(dep_item, set()).add(item)
 
     @property
     def all_items(self):
         return self.items_with_deps | self.items_without_deps
 
+    def dependents(self, dep_item):
+        """
+        Returns all items still waiting for dep_item, directly or
+        through other items.
+        """
+        dependents = set()
+        todo = [dep_item]
+        while todo:
+            for item in self._dependents.get(todo.pop(), ()):
+                if item in self.items_with_deps and item not in dependents:
+                    dependents.add(item)
+                    todo.append(item)
+        return dependents
+
+    def _remove_dep(self, dep_item):
+        """
+        Removes dep_item from the _deps of all items still waiting for
+        it and moves those that have no deps left into
+        items_without_deps.
+        """
+        for item in self._dependents.pop(dep_item, ()):
+            if item not in self.items_with_deps:
+                # already skipped
+                continue
+            item._deps.discard(dep_item)
+            if not item._deps:
+                self.items_with_deps.remove(item)
+                self.items_without_deps.add(item)
+
+    def _skip_dependents(self, dep_item):
+        """
+        Removes all items from the queue that need dep_item (directly
+        or through a cascade of skipped items) and returns them.
+        """
+        skipped_items = set()
+        todo = [dep_item]
+        while todo:
+            current_item = todo.pop()
+            removed_items = set()
+            for item in self._dependents.get(current_item, ()):
+                if (
+                    item in self.items_with_deps and (
+                        current_item in item._deps_needs or
+                        current_item in item._deps_needed_by
+                    )
+                ):
+                    self.items_with_deps.remove(item)
+                    removed_items.add(item)
+            # other items merely waiting for current_item may proceed
+            self._remove_dep(current_item)
+
+            if removed_items:
+                io.debug(
+                    "skipped these items because they depend on {item}, which was "
+                    "skipped previously: {skipped}".format(
+                        item=current_item.id,
+                        skipped=", ".join([item.id for item in removed_items]),
+                    )
+                )
+
+            for removed_item in removed_items:
+                if removed_item.cascade_skip:
+                    todo.append(removed_item)
+                else:
+                    self._remove_dep(removed_item)
+            skipped_items.update(removed_items)
+        return skipped_items
+
 
 class ItemQueue(BaseQueue):
     def item_failed(self, item):
@@ -49,11 +117,7 @@ class ItemQueue(BaseQueue):
         self.pending_items.remove(item)
         # if an item is applied successfully, all dependencies on it can
         # be removed from the remaining items
-        self.items_with_deps = remove_dep_from_items(
-            self.items_with_deps,
-            item,
-        )
-        self._split()
+        self._remove_dep(item)
 
     def item_skipped(self, item):
         """
@@ -64,18 +128,10 @@ class ItemQueue(BaseQueue):
         if item.cascade_skip:  # TODO 5.0 always do this when removing cascade_skip
             # if an item fails or is skipped, all items that depend on
             # it shall be removed from the queue
-            self.items_with_deps, skipped_items = remove_item_dependents(
-                self.items_with_deps,
-                item,
-            )
-            for skipped_item in skipped_items:
+            for skipped_item in self._skip_dependents(item):
                 yield skipped_item
         else:
-            self.items_with_deps = remove_dep_from_items(
-                self.items_with_deps,
-                item,
-            )
-        self._split()
+            self._remove_dep(item)
 
     def pop(self):
         """
@@ -93,10 +149,12 @@ class ItemQueue(BaseQueue):
     def _fire_triggers_for_item(self, item):
         for triggered_item_id in item.triggers:
             try:
-                triggered_item = find_item(
-                    triggered_item_id,
-                    self.all_items,
-                )
+                triggered_item = find_item(triggered_item_id, self.item_index)
+                if (
+                    triggered_item not in self.items_with_deps and
+                    triggered_item not in self.items_without_deps
+                ):
+                    raise NoSuchItem
                 triggered_item.has_been_triggered = True
             except NoSuchItem:
                 io.debug(_(
@@ -115,6 +173,5 @@ class ItemTestQueue(BaseQueue):
     """
     def pop(self):
         item = self.items_without_deps.pop()
-        self.items_with_deps = remove_dep_from_items(self.items_with_deps, item)
-        self._split()
+        self._remove_dep(item)
         return item
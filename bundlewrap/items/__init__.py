@@ -1,12 +1,13 @@
 """
 Note that modules in this package have to use absolute imports because
-Repository.item_classes loads them as files.
+Repository.item_class() loads them as files.
 """
 from copy import copy
 from datetime import datetime
 from inspect import cleandoc
 from os.path import join
 from textwrap import TextWrapper
+from threading import Lock
 
 from bundlewrap.exceptions import (
     BundleError,
@@ -46,6 +47,60 @@ BUILTIN_ITEM_ATTRIBUTES = {
     'unless': "",
     'when_creating': {},
 }
+# Maps the bundle attribute name of each builtin item type to the file
+# in this package that defines it. This allows Repository to only load
+# the item types that are actually used.
+BUILTIN_ITEM_TYPES = {
+    'actions': "actions.py",
+    'dconf': "dconf.py",
+    'directories': "directories.py",
+    'files': "files.py",
+    'git_deploy': "git_deploy.py",
+    'groups': "groups.py",
+    'k8s_clusterrolebindings': "kubernetes.py",
+    'k8s_clusterroles': "kubernetes.py",
+    'k8s_configmaps': "kubernetes.py",
+    'k8s_crd': "kubernetes.py",
+    'k8s_cronjobs': "kubernetes.py",
+    'k8s_daemonsets': "kubernetes.py",
+    'k8s_deployments': "kubernetes.py",
+    'k8s_ingresses': "kubernetes.py",
+    'k8s_namespaces': "kubernetes.py",
+    'k8s_networkpolicies': "kubernetes.py",
+    'k8s_pvc': "kubernetes.py",
+    'k8s_raw': "kubernetes.py",
+    'k8s_rolebindings': "kubernetes.py",
+    'k8s_roles': "kubernetes.py",
+    'k8s_secrets': "kubernetes.py",
+    'k8s_serviceaccounts': "kubernetes.py",
+    'k8s_services': "kubernetes.py",
+    'k8s_statefulsets': "kubernetes.py",
+    'pkg_apk': "pkg_apk.py",
+    'pkg_apt': "pkg_apt.py",
+    'pkg_dnf': "pkg_dnf.py",
+    'pkg_freebsd': "pkg_freebsd.py",
+    'pkg_openbsd': "pkg_openbsd.py",
+    'pkg_opkg': "pkg_opkg.py",
+    'pkg_pacman': "pkg_pacman.py",
+    'pkg_pamac': "pkg_pamac.py",
+    'pkg_pip': "pkg_pip.py",
+    'pkg_snap': "pkg_snap.py",
+    'pkg_yum': "pkg_yum.py",
+    'pkg_zypper': "pkg_zypper.py",
+    'postgres_dbs': "postgres_dbs.py",
+    'postgres_roles': "postgres_roles.py",
+    'routeros': "routeros.py",
+    'svc_freebsd': "svc_freebsd.py",
+    'svc_openbsd': "svc_openbsd.py",
+    'svc_openrc': "svc_openrc.py",
+    'svc_systemd': "svc_systemd.py",
+    'svc_systemv': "svc_systemv.py",
+    'svc_upstart': "svc_upstart.py",
+    'symlinks': "symlinks.py",
+    'users': "users.py",
+    'zfs_datasets': "zfs_dataset.py",
+    'zfs_pools': "zfs_pool.py",
+}
 
 wrapper = TextWrapper(
     break_long_words=False,
@@ -98,6 +153,101 @@ class ItemStatus:
         return not self.must_be_deleted and not self.must_be_created and not bool(self.keys_to_fix)
 
 
+class ItemRun:
+    """
+    Holds state shared by the items of a node while they are being
+    applied, mostly about items that are fixed in a batch along with
+    another item. Items find the current run at node._item_run, which
+    is None at all other times:
+
+        with ItemRun(node, item_queue, apply_kwargs):
+            ...
+
+    Everything kept here is dropped once the run ends. Runs that only
+    get the status of items (e.g. `bw verify`) have no ItemQueue and
+    never batch items.
+    """
+    def __init__(self, node, item_queue, apply_kwargs):
+        self.apply_kwargs = apply_kwargs
+        self.item_queue = item_queue
+        self.node = node
+        # caches that are only valid during this run, see cache()
+        self.caches = {}
+        # maps IDs of items that have been picked for a batch to a
+        # dict with whatever their fix() needs to know about that batch
+        self.fixed_by_batch = {}
+        # items are applied in parallel
+        self.lock = Lock()
+
+    def __enter__(self):
+        self.node._item_run = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.node._item_run = None
+
+    def batch_candidates(self, item_types):
+        """
+        Returns all items of the given types that are still waiting in
+        the ItemQueue, haven't been picked for a batch yet and are
+        certain to be fixed if necessary once they are applied.
+        """
+        if self.item_queue is None or self.apply_kwargs.get('interactive'):
+            return set()
+        candidates = set()
+        for item_type in item_types:
+            for item in self.node._item_index.by_type.get(item_type, ()):
+                if (
+                    self.waiting(item) and
+                    item.id not in self.fixed_by_batch and
+                    not item._skipped_or_conditional(self.apply_kwargs)
+                ):
+                    candidates.add(item)
+        return candidates
+
+    def cache(self, name):
+        """
+        Returns a dict for caching anything by the given name until the
+        run ends.
+        """
+        with self.lock:
+            return self.caches.setdefault(name, {})
+
+    def waiting(self, item):
+        """
+        Returns True if the given item has not been applied, skipped
+        or started yet.
+        """
+        return (
+            item in self.item_queue.items_with_deps or
+            item in self.item_queue.items_without_deps
+        )
+
+
+def node_cache(node, name, factory=dict):
+    """
+    Returns the object cached about the given node by the given name,
+    creating it using factory() first if necessary. Unlike
+    ItemRun.cache(), it is also available before a run starts (e.g.
+    while prefetching), but it is cleared by clear_node_caches() at the
+    start of every run. Item types caching state of the node here must
+    discard it in Item.forget_node_state() when they change it.
+    """
+    with node._item_caches_lock:
+        if name not in node._item_caches:
+            node._item_caches[name] = factory()
+        return node._item_caches[name]
+
+
+def clear_node_caches(node):
+    """
+    Discards everything cached by node_cache(), so the next run sees
+    changes made to the node in the meantime.
+    """
+    with node._item_caches_lock:
+        node._item_caches.clear()
+
+
 def make_normalize(attribute_default):
     """
     This is to ensure you can pass filter() results and such in place of
@@ -160,6 +310,18 @@ class Item:
         """
         return []
 
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        """
+        Called for each item type on the node after changed_item has
+        been fixed, failed or raised an exception. Must discard any
+        state of the node cached for items of this type that
+        changed_item might have changed.
+
+        MAY be overridden by subclasses.
+        """
+        pass
+
     def __init__(
         self,
         bundle,
@@ -383,6 +545,62 @@ class Item:
                 return True
         return False
 
+    def _skipped_or_conditional(self, apply_kwargs):
+        """
+        Returns True unless apply() with the given keyword arguments is
+        certain to look at the status of this item and fix it if
+        necessary, i.e. it won't be skipped and doesn't depend on
+        triggers, 'unless' or preceding items.
+        """
+        return bool(
+            self.skip or
+            self.triggered or
+            self._precedes_items or
+            self.unless or
+            self._faults_missing_for_attributes or
+            not self.covered_by_autoonly_selector(apply_kwargs.get('autoonly_selector', ())) or
+            self.covered_by_autoskip_selector(apply_kwargs.get('autoskip_selector', ())) or
+            self._skip_with_soft_locks(
+                apply_kwargs.get('my_soft_locks', ()),
+                apply_kwargs.get('other_peoples_soft_locks', ()),
+            )
+        )
+
+    def _batch_candidates(self, item_types=None):
+        """
+        Returns other items of the given types (defaults to the type of
+        this item) that may be fixed in a batch along with this item.
+        Callers still have to check their dependencies.
+        """
+        run = self.node._item_run
+        if run is None:
+            return set()
+        return run.batch_candidates(item_types or [self.ITEM_TYPE_NAME]) - {self}
+
+    def _fixed_by_batch(self, forget=False):
+        """
+        Returns what has been recorded in ItemRun.fixed_by_batch for
+        this item or None. If forget is True, the record is removed.
+        """
+        run = self.node._item_run
+        if run is None:
+            return None
+        with run.lock:
+            if forget:
+                return run.fixed_by_batch.pop(self.id, None)
+            return run.fixed_by_batch.get(self.id)
+
+    def _mark_fixed_by_batch(self, sdict):
+        """
+        Records that this item has been fixed as part of another item's
+        batch. Until fix() is called for this item itself, its sdict()
+        should return the given sdict from before the batch so the item
+        shows up as fixed.
+        """
+        run = self.node._item_run
+        with run.lock:
+            run.fixed_by_batch[self.id] = {'sdict': sdict}
+
     def _test(self):
         with io.job(_("{node}  {bundle}  {item}").format(
             bundle=bold(self.bundle.name),
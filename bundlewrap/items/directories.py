@@ -4,7 +4,7 @@ from shlex import quote
 
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item
-from bundlewrap.utils.remote import PathInfo
+from bundlewrap.utils.remote import forget_path_info, PathInfo
 from bundlewrap.utils.text import mark_for_translation as _
 from bundlewrap.utils.text import is_subdirectory
 from bundlewrap.utils.ui import io
@@ -58,6 +58,10 @@ class Directory(Item):
             quote(self.name),
         )
 
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        forget_path_info(node, changed_item)
+
     def cdict(self):
         cdict = {
             'paths_to_purge': set(),
@@ -1,33 +1,25 @@
-from atexit import register as at_exit
 from base64 import b64decode
 from collections import defaultdict
-from contextlib import contextmanager, suppress
+from contextlib import contextmanager, ExitStack, suppress
 from datetime import datetime
 try:
     from functools import cache
 except ImportError:  # Python 3.8
     cache = lambda f: f
-from hashlib import md5
-from os import getenv, getpid, makedirs, mkdir, rmdir
-from os.path import basename, dirname, exists, isfile, join, normpath
+from os.path import basename, dirname, exists, join, normpath
 from shlex import quote
-from shutil import rmtree
 from subprocess import check_output, CalledProcessError, STDOUT
 from sys import exc_info
-from tempfile import gettempdir
-from time import sleep
+from threading import Event
 from traceback import format_exception
 
-from jinja2 import Environment, FileSystemLoader
-from mako.lookup import TemplateLookup
-from mako.template import Template
-from requests import head
-
+from bundlewrap.downloadcache import get_download_cache
 from bundlewrap.exceptions import BundleError, FaultUnavailable, TemplateError
 from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item
 from bundlewrap.items.directories import validator_mode
-from bundlewrap.utils import cached_property, download, hash_local_file, sha1, tempfile
-from bundlewrap.utils.remote import PathInfo
+from bundlewrap.templatecache import jinja2_template, mako_template
+from bundlewrap.utils import cached_property, hash_local_file, sha1, tempfile
+from bundlewrap.utils.remote import forget_path_info, PathInfo
 from bundlewrap.utils.text import bold, force_text, mark_for_translation as _
 from bundlewrap.utils.text import is_subdirectory
 from bundlewrap.utils.ui import io
@@ -38,6 +30,8 @@ DIFF_MAX_FILE_SIZE = 1024 * 1024 * 5  # bytes
 
 @cache
 def check_download(url, timeout):
+    from requests import head  # slow import, only needed here
+
     try:
         head(url, timeout=timeout).raise_for_status()
     except Exception as exc:
@@ -52,10 +46,11 @@ def content_processor_base64(item):
 
 
 def content_processor_jinja2(item):
-    loader = FileSystemLoader(searchpath=[item.item_data_dir, item.item_dir])
-    env = Environment(loader=loader)
-
-    template = env.from_string(item._template_content)
+    template = jinja2_template(
+        item._template_content,
+        [item.item_data_dir, item.item_dir],
+        cache_dir=item.node.repo._template_cache_dir,
+    )
 
     io.debug(f"{item.node.name}:{item.id}: rendering with Jinja2...")
     start = datetime.now()
@@ -90,11 +85,11 @@ def content_processor_jinja2(item):
 
 
 def content_processor_mako(item):
-    template = Template(
-        item._template_content.encode('utf-8'),
-        input_encoding='utf-8',
-        lookup=TemplateLookup(directories=[item.item_data_dir, item.item_dir]),
-        output_encoding=item.attributes['encoding'],
+    template = mako_template(
+        item._template_content,
+        [item.item_data_dir, item.item_dir],
+        item.attributes['encoding'],
+        cache_dir=item.node.repo._template_cache_dir,
     )
     io.debug(f"{item.node.name}:{item.id}: rendering with Mako...")
     start = datetime.now()
@@ -146,81 +141,34 @@ CONTENT_PROCESSORS = {
 
 
 def download_file(item):
-    file_name_hashed = md5(item.attributes['source'].encode('UTF-8')).hexdigest()
-
-    cache_path = getenv("BW_FILE_DOWNLOAD_CACHE")
-    if cache_path:
-        remove_dir = None
-        file_path = join(cache_path, file_name_hashed)
-        lock_dir = join(cache_path, "{}.bw_lock".format(file_name_hashed))
-
-        makedirs(cache_path, exist_ok=True)
-    else:
-        remove_dir = join(gettempdir(), "bw-file-download-cache-{}".format(getpid()))
-        file_path = join(remove_dir, file_name_hashed)
-        lock_dir = join(remove_dir, "{}.bw_lock".format(file_name_hashed))
-
-        makedirs(remove_dir, exist_ok=True)
-
-    io.debug(f"{item.node.name}:{item.id}: download lock dir is {lock_dir}")
-
-    # Since we only download the file once per process, there's no point
-    # in displaying the node name here. The file may be used on multiple
-    # nodes.
-    with io.job(_("{}  {}  waiting for download").format(bold(item.node.name), bold(item.id))):
-        while True:
-            try:
-                mkdir(lock_dir)
-                io.debug(f"{item.node.name}:{item.id}: have download lock")
-                break
-            except FileExistsError:
-                io.debug(f"{item.node.name}:{item.id}: waiting for download lock")
-                sleep(1)
-
-    try:
-        if not isfile(file_path):
-            io.debug(
-                f"{item.node.name}:{item.id}: "
-                f"starting download from {item.attributes['source']}"
-            )
-            with io.job(_("{node}  {item}  downloading from {url}").format(
-                node=bold(item.node.name), 
-                item=bold(item.id),
-                url=item.attributes['source'],
-            )):
-                download(
-                    item.attributes['source'],
-                    file_path,
-                    timeout=item.attributes['download_timeout'],
-                )
-            io.debug(
-                f"{item.node.name}:{item.id}: "
-                f"finished download from {item.attributes['source']}"
-            )
+    """
+    Returns the path to a local copy of the file downloaded for the
+    given item.
+    """
+    with io.job(_("{node}  {item}  downloading from {url}").format(
+        node=bold(item.node.name),
+        item=bold(item.id),
+        url=item.attributes['source'],
+    )):
+        file_path, local_hash = get_download_cache().get(
+            item.attributes['source'],
+            content_hash=item.attributes['content_hash'],
+            timeout=item.attributes['download_timeout'],
+        )
+    io.debug(f"{item.node.name}:{item.id}: content hash is {local_hash}")
 
-        # Always do hash verification, if requested.
-        if item.attributes['content_hash']:
-            with io.job(_("{}  {}  checking file integrity".format(
-                bold(item.node.name),
-                bold(item.id),
-            ))):
-                local_hash = hash_local_file(file_path)
-                io.debug(f"{item.node.name}:{item.id}: content hash is {local_hash}")
-                if local_hash != item.attributes['content_hash']:
-                    raise BundleError(_(
-                        "could not download correct file from {} - sha1sum mismatch "
-                        "(expected {}, got {})"
-                    ).format(
-                        item.attributes['source'],
-                        item.attributes['content_hash'],
-                        local_hash
-                    ))
-                io.debug(f"{item.node.name}:{item.id}: content hash matches")
-    finally:
-        rmdir(lock_dir)
-        io.debug(f"{item.node.name}:{item.id}: released download lock")
+    # Always do hash verification, if requested.
+    if item.attributes['content_hash'] and local_hash != item.attributes['content_hash']:
+        raise BundleError(_(
+            "could not download correct file from {} - sha1sum mismatch "
+            "(expected {}, got {})"
+        ).format(
+            item.attributes['source'],
+            item.attributes['content_hash'],
+            local_hash
+        ))
 
-    return file_path, remove_dir
+    return file_path
 
 
 def get_remote_file_contents(node, path):
@@ -273,6 +221,92 @@ class File(Item):
     def __repr__(self):
         return "<File path:{}>".format(quote(self.name))
 
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        forget_path_info(node, changed_item)
+
+    def _batch_needs_upload(self):
+        """
+        Returns True if this item can be fixed just by uploading it.
+        """
+        try:
+            status = self.cached_status
+        except Exception as exc:
+            # let the item deal with this once it is applied itself
+            io.debug(_("not uploading {item} on {node} in a batch: {exc}").format(
+                exc=repr(exc),
+                item=self.id,
+                node=self.node.name,
+            ))
+            return False
+        if status.must_be_created:
+            return True
+        keys_to_fix = set(status.keys_to_fix)
+        return 'content_hash' in keys_to_fix and keys_to_fix <= {
+            'content_hash',
+            'group',
+            'mode',
+            'owner',
+        }
+
+    def _batch(self):
+        """
+        Returns file items that can be uploaded together with this one:
+        they need new content, are not waiting for any item except each
+        other and would not be skipped. The returned dict maps these
+        items to the state their own fix() waits for.
+        """
+        if self.node.os not in self.node.OS_FAMILY_LINUX:
+            return {}
+
+        pending = {
+            item for item in self._batch_candidates()
+            if not item.attributes['delete'] and item.attributes['content_type'] != 'any'
+        }
+        # Only look at the status of an item once all of its
+        # dependencies are known to be part of the batch. Otherwise we
+        # would cache a status that may be changed by the time the item
+        # is actually applied.
+        batch = set()
+        changed = True
+        while changed:
+            changed = False
+            for item in sorted(pending, key=lambda item: item.id):
+                deps = item._deps - item._deps_concurrency
+                if deps <= batch | {self}:
+                    pending.remove(item)
+                    changed = True
+                    if item._batch_needs_upload():
+                        batch.add(item)
+                elif not deps <= batch | pending | {self}:
+                    pending.remove(item)
+                    changed = True
+        if not batch:
+            return {}
+
+        run = self.node._item_run
+        with run.lock:
+            # other workers may have started applying some of these
+            # items or picked them for their own batch in the meantime
+            batch = {
+                item for item in batch
+                if run.waiting(item) and item.id not in run.fixed_by_batch
+            }
+            changed = True
+            while changed:
+                changed = False
+                for item in batch.copy():
+                    if not item._deps - item._deps_concurrency <= batch | {self}:
+                        batch.remove(item)
+                        changed = True
+            upload_states = {}
+            for item in batch:
+                upload_states[item] = run.fixed_by_batch[item.id] = {
+                    'done': Event(),
+                    'ok': False,
+                }
+        return upload_states
+
     @property
     def _template_content(self):
         if self.attributes['source'] is not None:
@@ -295,14 +329,25 @@ class File(Item):
         else:
             return sha1(self.content)
 
+    def prefetch_download(self):
+        """
+        Starts downloading the file in the background if we're going to
+        need it to determine the status of this item.
+        """
+        if (
+            self.attributes['content_type'] == 'download'
+            and not self.attributes['delete']
+            and not self.attributes['content_hash']
+        ):
+            get_download_cache().prefetch(
+                self.attributes['source'],
+                timeout=self.attributes['download_timeout'],
+            )
+
     @cached_property
     def template(self):
         if self.attributes['content_type'] == 'download':
-            file_path, remove_dir = download_file(self)
-            if remove_dir:
-                io.debug(_("registering {} for deletion on exit").format(remove_dir))
-                at_exit(rmtree, remove_dir, ignore_errors=True)
-            return file_path
+            return download_file(self)
         data_template = join(self.item_data_dir, self.attributes['source'])
         if exists(data_template):
             return data_template
@@ -323,6 +368,18 @@ class File(Item):
         return cdict
 
     def fix(self, status):
+        upload_state = self._fixed_by_batch(forget=True)
+        if upload_state is not None:
+            upload_state['done'].wait()
+            if upload_state['ok']:
+                io.debug(_(
+                    "{item} on {node} has already been uploaded along with another item"
+                ).format(
+                    item=self.id,
+                    node=self.node.name,
+                ))
+                return
+
         if status.must_be_created or status.must_be_deleted or 'type' in status.keys_to_fix:
             self._fix_type(status)
         else:
@@ -339,6 +396,9 @@ class File(Item):
                     getattr(self, "_fix_" + fix_type)(status)
 
     def _fix_content_hash(self, status):
+        batch = self._batch()
+        if batch and self._fix_batch(batch):
+            return
         with self._write_local_file() as local_path:
             with io.job(_("{}  {}  uploading to node").format(
                 bold(self.node.name),
@@ -353,6 +413,67 @@ class File(Item):
                     may_fail=True,
                 )
 
+    def _fix_batch(self, upload_states):
+        """
+        Uploads this item along with the items returned by _batch().
+        Returns False if this item has not been uploaded.
+        """
+        batch = set(upload_states)
+        try:
+            with ExitStack() as stack:
+                uploads = []
+                for item in sorted(batch | {self}, key=lambda item: item.id):
+                    try:
+                        local_path = stack.enter_context(item._write_local_file())
+                    except BundleError:
+                        if item is self:
+                            raise
+                        # let the item report this error itself
+                        batch.remove(item)
+                        continue
+                    uploads.append({
+                        'local_path': local_path,
+                        'remote_path': item.name,
+                        'mode': item.attributes['mode'],
+                        'owner': item.attributes['owner'] or "",
+                        'group': item.attributes['group'] or "",
+                    })
+                if not batch:
+                    return False
+
+                # just like _fix_type() does for a single item
+                new_dirs = {
+                    dirname(item.name) for item in batch
+                    if item.cached_status.must_be_created
+                }
+                if new_dirs:
+                    self.run(
+                        "mkdir -p -- {}".format(" ".join(quote(path) for path in sorted(new_dirs))),
+                        may_fail=True,
+                    )
+
+                with io.job(_("{}  {}  uploading {} files to node").format(
+                    bold(self.node.name),
+                    bold(self.id),
+                    len(uploads),
+                )):
+                    if not self.node.upload_multiple(uploads, may_fail=True):
+                        io.debug(_(
+                            "uploading {count} files along with {item} to {node} failed"
+                        ).format(
+                            count=len(batch),
+                            item=self.id,
+                            node=self.node.name,
+                        ))
+                        return False
+
+            for item in batch:
+                upload_states[item]['ok'] = True
+            return True
+        finally:
+            for upload_state in upload_states.values():
+                upload_state['done'].set()
+
     def _fix_mode(self, status):
         if self.node.os in self.node.OS_FAMILY_BSD:
             command = "chmod {} {}"
@@ -431,6 +552,14 @@ class File(Item):
                     deps.append(item.id)
         return deps
 
+    @property
+    def remote_hash_needed(self):
+        """
+        Returns False if the content hash of the file on the node will
+        never be looked at.
+        """
+        return not self.attributes['delete'] and self.attributes['content_type'] != 'any'
+
     def sdict(self):
         path_info = PathInfo(self.node, self.name)
         if not path_info.exists:
@@ -438,7 +567,9 @@ class File(Item):
         else:
             return {
                 'type': 'file' if path_info.is_file else path_info.stat['type'],
-                'content_hash': path_info.sha1 if path_info.is_file else None,
+                'content_hash': (
+                    path_info.sha1 if path_info.is_file and self.remote_hash_needed else None
+                ),
                 'mode': path_info.mode,
                 'owner': path_info.owner,
                 'group': path_info.group,
@@ -1,6 +1,10 @@
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item
-from bundlewrap.items.users import _USERNAME_VALID_CHARACTERS
+from bundlewrap.items.users import (
+    _account_database,
+    _USERNAME_VALID_CHARACTERS,
+    forget_account_database,
+)
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -38,6 +42,11 @@ class Group(Item):
         else:
             return []
 
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        # any item might have added users or groups (e.g. packages)
+        forget_account_database(node)
+
     def __repr__(self):
         return "<Group name:{}>".format(self.name)
 
@@ -71,17 +80,15 @@ class Group(Item):
 
             command += f"{self.name}"
         self.run(command, may_fail=True)
+        forget_account_database(self.node)
 
     def sdict(self):
         # verify content of /etc/group
-        grep_result = self.run(
-            "grep -e '^{}:' /etc/group".format(self.name),
-            may_fail=True,
-        )
-        if grep_result.return_code != 0:
+        line = _account_database(self.node)['groups'].get(self.name)
+        if line is None:
             return None
         else:
-            return _parse_group_line(grep_result.stdout_text)
+            return _parse_group_line(line)
 
     def patch_attributes(self, attributes):
         if isinstance(attributes.get('gid'), int):
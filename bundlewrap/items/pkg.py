@@ -1,9 +1,10 @@
 from abc import ABCMeta, abstractmethod
 from contextlib import suppress
 
-from bundlewrap.exceptions import BundleError
-from bundlewrap.items import Item
+from bundlewrap.exceptions import BundleError, RemoteException
+from bundlewrap.items import Item, node_cache
 from bundlewrap.utils.text import mark_for_translation as _
+from bundlewrap.utils.ui import io
 
 
 class Pkg(Item, metaclass=ABCMeta):
@@ -13,7 +14,6 @@ class Pkg(Item, metaclass=ABCMeta):
     ITEM_ATTRIBUTES = {
         'installed': True,
     }
-    _pkg_install_cache = {}
 
     @classmethod
     def block_concurrent(cls, node_os, node_os_version):
@@ -26,36 +26,181 @@ class Pkg(Item, metaclass=ABCMeta):
             self.attributes['installed'],
         )
 
+    def _pkg_siblings(self):
+        """
+        Returns all items of this type on the same node, including this
+        one.
+        """
+        siblings = set(self.node._item_index.by_type.get(self.ITEM_TYPE_NAME, ()))
+        siblings.add(self)
+        return siblings
+
+    def _pkg_batch(self):
+        """
+        Returns items of this type that can be fixed in the same
+        transaction as this item: they need the same change, are not
+        waiting for any other item and would not be skipped.
+        """
+        batch_key = self.pkg_batch_key()
+        if batch_key is None:
+            return set()
+
+        batch = set()
+        for item in self._batch_candidates():
+            if (
+                item.attributes['installed'] == self.attributes['installed'] and
+                item.pkg_batch_key() == batch_key and
+                item.pkg_installed_cached() != item.attributes['installed'] and
+                # If an item depended on anything that hasn't been
+                # applied yet, including other items in the batch, a
+                # failure there would report it as skipped even though
+                # the transaction has already fixed it. _deps only
+                # contains items that haven't been applied yet.
+                # Dependencies added by block_concurrent() only
+                # serialize items of the same type, so they don't
+                # matter here.
+                not item._deps - item._deps_concurrency
+            ):
+                batch.add(item)
+        return batch
+
     def fix(self, status):
-        with suppress(KeyError):
-            self._pkg_install_cache.get(self.node.name, set()).remove(self.id)
+        if self._fixed_by_batch(forget=True) is not None:
+            io.debug(_("{item} on {node} has already been fixed by a previous transaction").format(
+                item=self.id,
+                node=self.node.name,
+            ))
+            return
+
+        batch = self._pkg_batch()
+        if batch:
+            self._pkg_fix_batch(batch)
+        else:
+            self._pkg_fix_single()
+
+    def _pkg_fix_batch(self, batch):
+        items = sorted(batch | {self}, key=lambda item: item.name)
+        io.debug(_("fixing {items} on {node} in a single transaction").format(
+            items=", ".join(item.id for item in items),
+            node=self.node.name,
+        ))
+        installed_before = {item.id: item.pkg_installed_cached() for item in items}
+        try:
+            if self.attributes['installed'] is False:
+                self.pkg_remove_multiple(items)
+            else:
+                self.pkg_install_multiple(items)
+        except RemoteException as exc:
+            # we'll find out below which packages made it
+            io.debug(_("transaction for {items} on {node} failed: {exc}").format(
+                exc=exc,
+                items=", ".join(item.id for item in items),
+                node=self.node.name,
+            ))
+
+        # only remember items whose state we can confirm from a single
+        # bulk query, everything else will be fixed individually
+        node_cache(self.node, 'pkg_installed').pop(self.ITEM_TYPE_NAME, None)
+        node_cache(self.node, 'pkg_probes').pop(self.ITEM_TYPE_NAME, None)
+        cache = self._pkg_all_installed_cached()
+        for item in batch:
+            if (
+                installed_before[item.id] != self.attributes['installed'] and
+                self.pkg_in_cache(item.id, cache) == self.attributes['installed']
+            ):
+                item._mark_fixed_by_batch({'installed': installed_before[item.id]})
+
+        if self.pkg_installed_cached() != self.attributes['installed']:
+            # package managers tend to give up on the whole transaction
+            # if a single package is broken, don't let other packages
+            # take this one down with them
+            io.debug(_("{item} on {node} not fixed by transaction, retrying on its own").format(
+                item=self.id,
+                node=self.node.name,
+            ))
+            self._pkg_fix_single()
+
+    def _pkg_fix_single(self):
+        self._pkg_forget()
         if self.attributes['installed'] is False:
             self.pkg_remove()
         else:
             self.pkg_install()
 
+    def _pkg_forget(self):
+        with suppress(KeyError):
+            node_cache(self.node, 'pkg_installed').get(self.ITEM_TYPE_NAME, set()).remove(self.id)
+        with suppress(KeyError):
+            del node_cache(self.node, 'pkg_probes').get(self.ITEM_TYPE_NAME, {})[self.id]
+
     @abstractmethod
     def pkg_all_installed(self):
         raise NotImplementedError
 
+    def pkg_batch_key(self):
+        """
+        Items of the same type with the same batch key can be installed
+        or removed together using pkg_install_multiple() and
+        pkg_remove_multiple(). Return None to always handle this item
+        individually.
+        """
+        if (
+            type(self).pkg_install_multiple is Pkg.pkg_install_multiple or
+            type(self).pkg_remove_multiple is Pkg.pkg_remove_multiple
+        ):
+            return None
+        return ()
+
     @abstractmethod
     def pkg_install(self):
         raise NotImplementedError
 
+    def pkg_install_multiple(self, items):
+        """
+        Installs all of the given items (including this one) in a
+        single transaction.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def pkg_installed(self):
         raise NotImplementedError
 
-    def pkg_installed_cached(self):
-        cache = self._pkg_install_cache.setdefault(self.node.name, set())
+    def pkg_installed_multiple(self, items):
+        """
+        Returns a dict mapping item IDs to the result of
+        pkg_installed() for each of the given items (including this
+        one).
 
+        MAY be overridden by subclasses to use a single command.
+        """
+        return {item.id: item.pkg_installed() for item in items}
+
+    def _pkg_all_installed_cached(self):
+        # keyed by item type
+        cache = node_cache(self.node, 'pkg_installed').setdefault(self.ITEM_TYPE_NAME, set())
         if not cache:
             cache.add(None)  # make sure we don't run into this if again
             for pkgid in self.pkg_all_installed():
                 cache.add(pkgid)
+        return cache
+
+    def pkg_installed_cached(self):
+        cache = self._pkg_all_installed_cached()
         if self.pkg_in_cache(self.id, cache):
             return True
-        return self.pkg_installed()
+
+        probes = node_cache(self.node, 'pkg_probes').setdefault(self.ITEM_TYPE_NAME, {})
+        if self.id not in probes:
+            if type(self).pkg_installed_multiple is Pkg.pkg_installed_multiple:
+                probes[self.id] = self.pkg_installed()
+            else:
+                # probe all packages of this type we couldn't find at once
+                probes.update(self.pkg_installed_multiple([
+                    item for item in self._pkg_siblings()
+                    if item.id not in probes and not self.pkg_in_cache(item.id, cache)
+                ]))
+        return probes[self.id]
 
     @staticmethod
     def pkg_in_cache(pkgid, cache):
@@ -68,7 +213,17 @@ class Pkg(Item, metaclass=ABCMeta):
     def pkg_remove(self):
         raise NotImplementedError
 
+    def pkg_remove_multiple(self, items):
+        """
+        Removes all of the given items (including this one) in a single
+        transaction.
+        """
+        raise NotImplementedError
+
     def sdict(self):
+        fixed_by_batch = self._fixed_by_batch()
+        if fixed_by_batch is not None:
+            return fixed_by_batch['sdict']
         return {
             'installed': self.pkg_installed_cached(),
         }
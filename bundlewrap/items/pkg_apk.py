@@ -22,11 +22,19 @@ class ApkPkg(Pkg):
             yield f"{self.ITEM_TYPE_NAME}:{pkg_name}"
 
     def pkg_install(self):
-        self.run(f"apk add {self.quoted}", may_fail=True)
+        self.pkg_install_multiple([self])
+
+    def pkg_install_multiple(self, items):
+        quoted = " ".join(item.quoted for item in items)
+        self.run(f"apk add {quoted}", may_fail=True)
 
     def pkg_installed(self):
         result = self.run(f"apk info --installed {self.quoted}", may_fail=True)
         return result.return_code == 0 and self.quoted in result.stdout_text
 
     def pkg_remove(self):
-        self.run(f"apk del {self.quoted}", may_fail=True)
+        self.pkg_remove_multiple([self])
+
+    def pkg_remove_multiple(self, items):
+        quoted = " ".join(item.quoted for item in items)
+        self.run(f"apk del {quoted}", may_fail=True)
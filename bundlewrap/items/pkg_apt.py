@@ -21,23 +21,45 @@ class AptPkg(Pkg):
             pkg_name = line[4:].split()[0].replace(":", "_")
             yield "{}:{}".format(self.ITEM_TYPE_NAME, pkg_name)
 
+    def pkg_batch_key(self):
+        batch_key = super().pkg_batch_key()
+        if batch_key is None:
+            return None
+        return batch_key + (self.when_creating['start_service'],)
+
     def pkg_install(self):
+        self.pkg_install_multiple([self])
+
+    def pkg_install_multiple(self, items):
         runlevel = "" if self.when_creating['start_service'] else "RUNLEVEL=1 "
         self.run(
             runlevel +
             "DEBIAN_FRONTEND=noninteractive "
             "apt-get -qy -o Dpkg::Options::=--force-confold --no-install-recommends "
-            "install {}".format(quote(self.name.replace("_", ":"))),
+            "install {}".format(" ".join(item.quoted for item in items)),
             may_fail=True,
         )
 
     def pkg_installed(self):
         result = self.run(
-            "dpkg -s {} | grep '^Status: '".format(quote(self.name.replace("_", ":"))),
+            "dpkg -s {} | grep '^Status: '".format(self.quoted),
             may_fail=True,
         )
         return result.return_code == 0 and " installed" in result.stdout_text
 
+    def pkg_installed_multiple(self, items):
+        # same as pkg_installed(), but prints the names of all installed
+        # packages in a single command
+        result = self.run(
+            "for pkg in {}; do "
+            "dpkg -s \"$pkg\" 2>/dev/null | grep '^Status: ' | grep -q ' installed' && "
+            "echo \"$pkg\"; "
+            "done; true".format(" ".join(item.quoted for item in items)),
+            may_fail=True,
+        )
+        installed = set(result.stdout_text.split())
+        return {item.id: item.name.replace("_", ":") in installed for item in items}
+
     @staticmethod
     def pkg_in_cache(pkgid, cache):
         pkgtype, pkgname = pkgid.split(":")
@@ -51,11 +73,18 @@ class AptPkg(Pkg):
                     return True
             return False
 
+    @property
+    def quoted(self):
+        return quote(self.name.replace("_", ":"))
+
     def pkg_remove(self):
+        self.pkg_remove_multiple([self])
+
+    def pkg_remove_multiple(self, items):
         self.run(
             "DEBIAN_FRONTEND=noninteractive "
             "apt-get -qy --allow-remove-essential "
-            "purge {}".format(quote(self.name.replace("_", ":")))
+            "purge {}".format(" ".join(item.quoted for item in items))
         )
 
     @classmethod
@@ -26,6 +26,11 @@ class PacmanPkg(Pkg):
         for line in pkgs.splitlines():
             yield "{}:{}".format(self.ITEM_TYPE_NAME, line.split()[0])
 
+    def pkg_batch_key(self):
+        if self.attributes['tarball']:
+            return None
+        return super().pkg_batch_key()
+
     def pkg_install(self):
         if self.attributes['tarball']:
             local_file = join(self.item_dir, self.attributes['tarball'])
@@ -34,7 +39,13 @@ class PacmanPkg(Pkg):
             self.run("pacman --noconfirm -U {}".format(quote(remote_file)), may_fail=True)
             self.run("rm -- {}".format(quote(remote_file)))
         else:
-            self.run("pacman --noconfirm -S {}".format(quote(self.name)), may_fail=True)
+            self.pkg_install_multiple([self])
+
+    def pkg_install_multiple(self, items):
+        self.run(
+            "pacman --noconfirm -S {}".format(" ".join(quote(item.name) for item in items)),
+            may_fail=True,
+        )
 
     def pkg_installed(self):
         # Don't use "pacman -Q $name" here because that doesn't work as
@@ -47,4 +58,10 @@ class PacmanPkg(Pkg):
         return "{}:{}".format(self.ITEM_TYPE_NAME, self.name) in self.pkg_all_installed()
 
     def pkg_remove(self):
-        self.run("pacman --noconfirm -Rs {}".format(quote(self.name)), may_fail=True)
+        self.pkg_remove_multiple([self])
+
+    def pkg_remove_multiple(self, items):
+        self.run(
+            "pacman --noconfirm -Rs {}".format(" ".join(quote(item.name) for item in items)),
+            may_fail=True,
+        )
@@ -20,7 +20,13 @@ class YumPkg(Pkg):
             yield "{}:{}".format(self.ITEM_TYPE_NAME, line.split()[0].split(".")[0])
 
     def pkg_install(self):
-        self.run("yum -d0 -e0 -y install {}".format(quote(self.name)), may_fail=True)
+        self.pkg_install_multiple([self])
+
+    def pkg_install_multiple(self, items):
+        self.run(
+            "yum -d0 -e0 -y install {}".format(" ".join(quote(item.name) for item in items)),
+            may_fail=True,
+        )
 
     def pkg_installed(self):
         result = self.run(
@@ -29,5 +35,23 @@ class YumPkg(Pkg):
         )
         return result.return_code == 0
 
+    def pkg_installed_multiple(self, items):
+        # same as pkg_installed(), but prints the names of all installed
+        # packages in a single command
+        result = self.run(
+            "for pkg in {}; do "
+            "yum -d0 -e0 list installed \"$pkg\" >/dev/null 2>&1 && echo \"$pkg\"; "
+            "done; true".format(" ".join(quote(item.name) for item in items)),
+            may_fail=True,
+        )
+        installed = set(result.stdout_text.split())
+        return {item.id: item.name in installed for item in items}
+
     def pkg_remove(self):
-        self.run("yum -d0 -e0 -y remove {}".format(quote(self.name)), may_fail=True)
+        self.pkg_remove_multiple([self])
+
+    def pkg_remove_multiple(self, items):
+        self.run(
+            "yum -d0 -e0 -y remove {}".format(" ".join(quote(item.name) for item in items)),
+            may_fail=True,
+        )
@@ -0,0 +1,176 @@
+from abc import ABCMeta, abstractmethod
+from json import loads
+from threading import Lock
+
+from bundlewrap.items import Item, ItemStatus, node_cache
+from bundlewrap.utils.text import force_text, mark_for_translation as _
+from bundlewrap.utils.ui import io
+
+
+CATALOG_QUERY = """SELECT json_build_object(
+    'databases', (
+        SELECT coalesce(json_object_agg(datname, json_build_object(
+            'owner', pg_get_userbyid(datdba)
+        )), '{}') FROM pg_database
+    ),
+    'roles', (
+        SELECT coalesce(json_object_agg(rolname, json_build_object(
+            'can_login', rolcanlogin,
+            'superuser', rolsuper,
+            'password_hash', coalesce(rolpassword, '')
+        )), '{}') FROM pg_authid
+    )
+)
+"""
+
+
+def quote_identifier(identifier):
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+def quote_literal(value):
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def _catalog_cache(node):
+    return node_cache(node, 'postgres_catalog', lambda: {'catalog': None, 'lock': Lock()})
+
+
+def get_catalog(node):
+    """
+    Returns a snapshot of all databases and roles on the given node,
+    obtained using a single query:
+
+        databases: database name -> {'owner': role name}
+        roles:     role name -> {'can_login', 'superuser', 'password_hash'}
+
+    The snapshot is kept until forget_catalog() is called.
+    """
+    cache = _catalog_cache(node)
+    with cache['lock']:
+        if cache['catalog'] is None:
+            result = node.run("psql -AnqtwX", data_stdin=CATALOG_QUERY.encode(), user="postgres")
+            catalog = loads(force_text(result.stdout))
+            io.debug(_("fetched {dbs} databases and {roles} roles from {node}").format(
+                dbs=len(catalog['databases']),
+                node=node.name,
+                roles=len(catalog['roles']),
+            ))
+            cache['catalog'] = catalog
+        return cache['catalog']
+
+
+def forget_catalog(node):
+    """
+    Discards the catalog snapshot for the given node. Must be called
+    whenever databases or roles might have changed on the node.
+    """
+    cache = _catalog_cache(node)
+    with cache['lock']:
+        cache['catalog'] = None
+
+
+def run_sql(node, statements, may_fail=False):
+    """
+    Runs the given SQL statements in a single psql session, stopping
+    at the first error.
+    """
+    sql = "".join(f"{statement};\n" for statement in statements)
+    return node.run(
+        "psql -nqwX -v ON_ERROR_STOP=1",
+        data_stdin=sql.encode('utf-8'),
+        may_fail=may_fail,
+        user="postgres",
+    )
+
+
+class PostgresItem(Item, metaclass=ABCMeta):
+    """
+    Common base class for postgres_db and postgres_role.
+
+    Statements from all postgres items on a node that need fixing and
+    only wait for the item currently being fixed are run in a single
+    psql session.
+    """
+    @classmethod
+    def block_concurrent(cls, node_os, node_os_version):
+        # only one item may build and run a batch at a time
+        return ["postgres_db", "postgres_role"]
+
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        # any item might have changed databases or roles (e.g. actions)
+        forget_catalog(node)
+
+    def _pg_batch(self):
+        """
+        Returns a dict mapping postgres items that can be fixed along
+        with this item to their current status: they need fixing, only
+        wait for this item and would not be skipped.
+        """
+        batch = {}
+        for item in self._batch_candidates(["postgres_db", "postgres_role"]):
+            # statements are run in order, so items may only depend on
+            # the one that goes first. Dependencies added by
+            # block_concurrent() just serialize items.
+            if not (item._deps - item._deps_concurrency) <= {self}:
+                continue
+            status = ItemStatus(item.cached_cdict, item.pg_sdict())
+            if not status.correct:
+                batch[item] = status
+        return batch
+
+    def fix(self, status):
+        if self._fixed_by_batch(forget=True) is not None:
+            io.debug(_("{item} on {node} has already been fixed by a previous batch").format(
+                item=self.id,
+                node=self.node.name,
+            ))
+            return
+
+        batch = self._pg_batch()
+        if not batch:
+            try:
+                run_sql(self.node, [self.pg_statement(status)])
+            finally:
+                forget_catalog(self.node)
+            return
+
+        items = sorted(batch, key=lambda item: item.id)
+        io.debug(_("fixing {items} on {node} in a single psql session").format(
+            items=", ".join(item.id for item in [self] + items),
+            node=self.node.name,
+        ))
+        run_sql(
+            self.node,
+            [self.pg_statement(status)] + [item.pg_statement(batch[item]) for item in items],
+            # our own status will tell if this worked
+            may_fail=True,
+        )
+        forget_catalog(self.node)
+
+        # items not fixed by the batch will be fixed individually
+        for item in items:
+            if ItemStatus(item.cached_cdict, item.pg_sdict()).correct:
+                item._mark_fixed_by_batch(batch[item].sdict)
+
+    @abstractmethod
+    def pg_sdict(self):
+        """
+        Returns the sdict for this item from get_catalog().
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def pg_statement(self, status):
+        """
+        Returns the SQL statement that fixes this item given its
+        ItemStatus.
+        """
+        raise NotImplementedError
+
+    def sdict(self):
+        fixed_by_batch = self._fixed_by_batch()
+        if fixed_by_batch is not None:
+            return fixed_by_batch['sdict']
+        return self.pg_sdict()
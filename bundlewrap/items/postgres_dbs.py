@@ -1,55 +1,61 @@
-from shlex import quote
-
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import Item
-from bundlewrap.utils.text import force_text, mark_for_translation as _
-
-
-def create_db(node, name, owner, when_creating):
+from bundlewrap.items.postgres import (
+    get_catalog,
+    PostgresItem,
+    quote_identifier,
+    quote_literal,
+    run_sql,
+)
+from bundlewrap.utils.text import mark_for_translation as _
+
+
+def create_db_statement(name, owner, when_creating):
+    sql = "CREATE DATABASE {} OWNER {}".format(quote_identifier(name), quote_identifier(owner))
     template = None
-    cmd = "createdb -wO {} ".format(owner)
 
     if when_creating.get('collation') is not None:
-        cmd += "--lc-collate={} ".format(when_creating['collation'])
+        sql += " LC_COLLATE {}".format(quote_literal(when_creating['collation']))
         template = "template0"
 
     if when_creating.get('ctype') is not None:
-        cmd += "--lc-ctype={} ".format(when_creating['ctype'])
+        sql += " LC_CTYPE {}".format(quote_literal(when_creating['ctype']))
         template = "template0"
 
     if when_creating.get('encoding') is not None:
-        cmd += "--encoding={} ".format(when_creating['encoding'])
+        sql += " ENCODING {}".format(quote_literal(when_creating['encoding']))
         template = "template0"
 
     if template is not None:
-        cmd += "--template={} ".format(template)
+        sql += " TEMPLATE {}".format(template)
+
+    return sql
 
-    cmd += name
 
-    return node.run(cmd, user="postgres")
+def create_db(node, name, owner, when_creating):
+    return run_sql(node, [create_db_statement(name, owner, when_creating)])
+
+
+def drop_db_statement(name):
+    return "DROP DATABASE {}".format(quote_identifier(name))
 
 
 def drop_db(node, name):
-    return node.run("dropdb -w {}".format(quote(name)), user="postgres")
+    return run_sql(node, [drop_db_statement(name)])
 
 
 def get_databases(node):
-    output = node.run("psql -Anqt -F '|' -c '\\l' | grep '|'", user="postgres").stdout
-    result = {}
-    for line in force_text(output).strip().split("\n"):
-        db, owner = line.strip().split("|", 2)[:2]
-        result[db] = {
-            'owner': owner,
-        }
-    return result
+    return get_catalog(node)['databases']
+
+
+def set_owner_statement(name, owner):
+    return "ALTER DATABASE {} OWNER TO {}".format(quote_identifier(name), quote_identifier(owner))
 
 
 def set_owner(node, name, owner):
-    sql = f"ALTER DATABASE \\\"{name}\\\" OWNER TO \\\"{owner}\\\""
-    return node.run(f"psql -nqw -c \"{sql}\"", user="postgres")
+    return run_sql(node, [set_owner_statement(name, owner)])
 
 
-class PostgresDB(Item):
+class PostgresDB(PostgresItem):
     """
     A postgres database.
     """
@@ -74,16 +80,6 @@ class PostgresDB(Item):
         else:
             return {'owner': self.attributes['owner']}
 
-    def fix(self, status):
-        if status.must_be_deleted:
-            drop_db(self.node, self.name)
-        elif status.must_be_created:
-            create_db(self.node, self.name, self.attributes['owner'], self.when_creating)
-        elif 'owner' in status.keys_to_fix:
-            set_owner(self.node, self.name, self.attributes['owner'])
-        else:
-            raise AssertionError("this shouldn't happen")
-
     def get_auto_deps(self, items):
         deps = []
         for item in items:
@@ -91,13 +87,23 @@ class PostgresDB(Item):
                 deps.append(item.id)
         return deps
 
-    def sdict(self):
+    def pg_sdict(self):
         databases = get_databases(self.node)
         if self.name not in databases:
             return None
         else:
             return {'owner': databases[self.name]['owner']}
 
+    def pg_statement(self, status):
+        if status.must_be_deleted:
+            return drop_db_statement(self.name)
+        elif status.must_be_created:
+            return create_db_statement(self.name, self.attributes['owner'], self.when_creating)
+        elif 'owner' in status.keys_to_fix:
+            return set_owner_statement(self.name, self.attributes['owner'])
+        else:
+            raise AssertionError("this shouldn't happen")
+
     @classmethod
     def validate_attributes(cls, bundle, item_id, attributes):
         if not isinstance(attributes.get('delete', True), bool):
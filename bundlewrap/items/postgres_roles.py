@@ -1,53 +1,44 @@
-from passlib.apps import postgres_context
-
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import Item
+from bundlewrap.items.postgres import (
+    get_catalog,
+    PostgresItem,
+    quote_identifier,
+    quote_literal,
+    run_sql,
+)
 from bundlewrap.utils.text import force_text, mark_for_translation as _
 
 
-AUTHID_COLUMNS = {
-    "rolcanlogin": 'can_login',
-    "rolsuper": 'superuser',
-    "rolpassword": 'password_hash',
-}
+def delete_role_statement(role):
+    return "DROP ROLE {}".format(quote_identifier(role))
 
 
 def delete_role(node, role):
-    node.run("dropuser -w {}".format(role), user="postgres")
+    run_sql(node, [delete_role_statement(role)])
 
 
-def fix_role(node, role, attrs, create=False):
-    password = " PASSWORD '{}'".format(attrs['password_hash'])
-    sql = "{operation} ROLE \\\"{role}\\\" WITH LOGIN {superuser}SUPERUSER{password}".format(
+def fix_role_statement(role, attrs, create=False):
+    return "{operation} ROLE {role} WITH LOGIN {superuser}SUPERUSER{password}".format(
         operation="CREATE" if create else "ALTER",
-        password="" if attrs['password_hash'] is None else password,
-        role=role,
+        password=(
+            "" if attrs['password_hash'] is None
+            else " PASSWORD {}".format(quote_literal(attrs['password_hash']))
+        ),
+        role=quote_identifier(role),
         superuser="" if attrs['superuser'] is True else "NO",
     )
-    node.run(f"psql -nqw -c \"{sql}\"", user="postgres")
 
 
-def get_role(node, role):
-    sql = f"SELECT rolcanlogin, rolsuper, rolpassword from pg_authid WHERE rolname='{role}'"
-    result = node.run(f"psql -Anqwx -F '|' -c \"{sql}\"", user="postgres")
-
-    role_attrs = {}
-    for line in force_text(result.stdout).strip().split("\n"):
-        try:
-            key, value = line.split("|")
-        except ValueError:
-            pass
-        else:
-            role_attrs[AUTHID_COLUMNS[key]] = value
+def fix_role(node, role, attrs, create=False):
+    run_sql(node, [fix_role_statement(role, attrs, create=create)])
 
-    for bool_attr in ('can_login', 'superuser'):
-        if bool_attr in role_attrs:
-            role_attrs[bool_attr] = role_attrs[bool_attr] == "t"
 
-    return role_attrs if role_attrs else None
+def get_role(node, role):
+    role_attrs = get_catalog(node)['roles'].get(role)
+    return dict(role_attrs) if role_attrs else None
 
 
-class PostgresRole(Item):
+class PostgresRole(PostgresItem):
     """
     A postgres role.
     """
@@ -72,19 +63,23 @@ class PostgresRole(Item):
         del cdict['password']
         return cdict
 
-    def fix(self, status):
+    def pg_sdict(self):
+        return get_role(self.node, self.name)
+
+    def pg_statement(self, status):
         if status.must_be_deleted:
-            delete_role(self.node, self.name)
-        elif status.must_be_created:
-            fix_role(self.node, self.name, self.attributes, create=True)
+            return delete_role_statement(self.name)
         else:
-            fix_role(self.node, self.name, self.attributes)
-
-    def sdict(self):
-        return get_role(self.node, self.name)
+            return fix_role_statement(
+                self.name,
+                self.attributes,
+                create=status.must_be_created,
+            )
 
     def patch_attributes(self, attributes):
         if 'password' in attributes:
+            from passlib.apps import postgres_context  # slow import, only needed here
+
             attributes['password_hash'] = postgres_context.encrypt(
                 force_text(attributes['password']),
                 user=self.name,
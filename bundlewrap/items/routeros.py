@@ -1,8 +1,28 @@
 from contextlib import suppress
 
-from bundlewrap.exceptions import BundleError
-from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item
+from bundlewrap.exceptions import BundleError, RemoteException
+from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item, ItemStatus
 from bundlewrap.utils.text import mark_for_translation as _
+from bundlewrap.utils.ui import io
+
+
+# how librouteros converts these values
+_BOOLEANS = {"yes": True, "true": True, "no": False, "false": False}
+
+
+def _query_matches(row, conditions):
+    """
+    Returns True if the given row from a print command matches all of
+    the given (key, value) conditions, just like an API query would.
+    """
+    for key, value in conditions:
+        row_value = row.get(key)
+        if isinstance(row_value, bool):
+            if _BOOLEANS.get(value) is not row_value:
+                return False
+        elif row_value is None or str(row_value) != value:
+            return False
+    return True
 
 
 class RouterOS(Item):
@@ -33,21 +53,100 @@ class RouterOS(Item):
         del cdict['delete']
         return cdict
 
+    def _batch(self):
+        """
+        Returns a dict mapping items that can be fixed along with this
+        item to their current status: they need fixing, don't wait for
+        any other item and would not be skipped.
+        """
+        batch = {}
+        for item in self._batch_candidates():
+            if item._deps - item._deps_concurrency:
+                # RouterOS may run tagged commands in any order, so
+                # items in a batch can't depend on each other.
+                # Dependencies added by block_concurrent() just
+                # serialize items.
+                continue
+            status = ItemStatus(item.cached_cdict, item._current_sdict())
+            if not status.correct:
+                batch[item] = status
+        return batch
+
     def fix(self, status):
+        if self._fixed_by_batch(forget=True) is not None:
+            io.debug(_("{item} on {node} has already been fixed by a previous batch").format(
+                item=self.id,
+                node=self.node.name,
+            ))
+            return
+
+        batch = self._batch()
+        items = sorted(batch, key=lambda item: item.id)
+        if items:
+            io.debug(_("fixing {items} on {node} in a single batch").format(
+                items=", ".join(item.id for item in [self] + items),
+                node=self.node.name,
+            ))
+        commands = {self: self._fix_commands(status)}
+        for item in items:
+            commands[item] = item._fix_commands(batch[item])
+        try:
+            results = self.run_routeros_pipelined(*[
+                command for item_commands in commands.values() for command in item_commands
+            ])
+        finally:
+            self._forget_print()
+
+        errors = {}
+        results = iter(results)
+        for item, item_commands in commands.items():
+            for command in item_commands:
+                result = next(results)
+                if result.return_code != 0:
+                    errors.setdefault(item, _("{command} failed: {error}").format(
+                        command=repr(command),
+                        error=result.stderr,
+                    ))
+
+        # items not fixed by the batch will be fixed individually
+        for item in items:
+            if (
+                item not in errors and
+                ItemStatus(item.cached_cdict, item._current_sdict()).correct
+            ):
+                item._mark_fixed_by_batch(batch[item].sdict)
+
+        if self in errors:
+            raise RemoteException(errors[self])
+
+    def _fix_commands(self, status):
+        """
+        Returns the API commands needed to fix this item.
+        """
         if status.must_be_created:
-            self._add(self.name.split("?", 1)[0], status.cdict)
+            return [self._add(self.name.split("?", 1)[0], status.cdict)]
         elif status.must_be_deleted:
-            self._remove(self.name.split("?", 1)[0], status.sdict['.id'])
+            return [self._remove(self.name.split("?", 1)[0], status.sdict['.id'])]
         else:
-            for key in status.keys_to_fix:
+            return [
                 self._set(
                     self.name.split("?", 1)[0],
                     status.sdict.get('.id'),
                     key,
                     status.cdict[key],
                 )
+                for key in status.keys_to_fix
+            ]
 
     def sdict(self):
+        fixed_by_batch = self._fixed_by_batch()
+        if fixed_by_batch is not None:
+            # report the state before the batch so this item shows up
+            # as fixed
+            return fixed_by_batch['sdict']
+        return self._current_sdict()
+
+    def _current_sdict(self):
         result = self._get(self.name)
         if result:
             # API doesn't return comment at all if emtpy
@@ -111,6 +210,15 @@ class RouterOS(Item):
         })
         return result
 
+    def run_routeros_pipelined(self, *commands):
+        results = self.node.run_routeros_pipelined(*commands)
+        for command, result in zip(commands, results):
+            self._command_results.append({
+                'command': repr(command),
+                'result': result,
+            })
+        return results
+
     def _add(self, command, kwargs):
         identifier = self.name.split("?", 1)[1]
         for identifier_component in identifier.split("&"):
@@ -118,22 +226,30 @@ class RouterOS(Item):
             kwargs[identifier_key] = identifier_value
         command += "/add"
         arguments = [f"={key}={value}" for key, value in kwargs.items()]
-        self.run_routeros(command, *arguments)
+        return (command, *arguments)
 
     def _get(self, command):
         if "?" in command:
             command, query = command.split("?", 1)
-            query = query.split("&")
-            query = ["?=" + condition for condition in query]
+            conditions = [condition.split("=", 1) for condition in query.split("&")]
+        else:
+            conditions = []
+
+        if any(len(condition) != 2 for condition in conditions):
+            # not a simple comparison, let RouterOS figure it out
+            query = ["?=" + "=".join(condition) for condition in conditions]
             query.append("?#&")  # AND all conditions
             result = self.run_routeros(command + "/print", *query).raw
         else:
-            result = self.run_routeros(command + "/print").raw
+            result = [
+                row for row in self._print(command)
+                if _query_matches(row, conditions)
+            ]
 
         if not result:
             return None
         elif len(result) == 1:
-            return result[0]
+            return dict(result[0])
         else:
             raise BundleError(_(
                 "{item} on {node} returned ambiguous data from API: {result}"
@@ -143,13 +259,32 @@ class RouterOS(Item):
                 result=repr(result),
             ))
 
+    def _print(self, command):
+        """
+        Returns all rows printed for the given command path. While
+        items are applied or verified, results are cached until an item
+        on the same node is fixed or the run ends.
+        """
+        run = self.node._item_run
+        if run is None:
+            return self.run_routeros(command + "/print").raw
+        cache = run.cache("routeros_print")
+        if command not in cache:
+            cache[command] = self.run_routeros(command + "/print").raw
+        return cache[command]
+
+    def _forget_print(self):
+        run = self.node._item_run
+        if run is not None:
+            run.cache("routeros_print").clear()
+
     def _set(self, command, api_id, key, value):
         command += "/set"
         kvstr = f"={key}={value}"
         if api_id is None:
-            self.run_routeros(command, kvstr)
+            return (command, kvstr)
         else:
-            self.run_routeros(command, f"=.id={api_id}", kvstr)
+            return (command, f"=.id={api_id}", kvstr)
 
     def _remove(self, command, api_id):
-        self.run_routeros(command + "/remove", f"=.id={api_id}")
+        return (command + "/remove", f"=.id={api_id}")
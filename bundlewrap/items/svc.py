@@ -0,0 +1,118 @@
+from abc import ABCMeta, abstractmethod
+from shlex import quote
+from threading import Lock
+
+from bundlewrap.items import Item, node_cache
+from bundlewrap.utils.text import mark_for_translation as _
+from bundlewrap.utils.ui import io
+
+
+def svc_run_multiple(node, command, svcnames):
+    """
+    Runs the given shell command once for each of the given service
+    names using a single remote command. The command can refer to the
+    service name as "$svc". Returns a dict mapping service names to
+    (return code, stdout).
+    """
+    script = (
+        'for svc in "$@"; do '
+        'out=$({command} 2>/dev/null); '
+        "printf '%s\\0%s\\0' \"$?\" \"$out\"; "
+        'done'
+    ).format(command=command)
+    result = node.run(
+        "sh -c {} sh {}".format(quote(script), " ".join(quote(svcname) for svcname in svcnames)),
+    )
+    fields = result.stdout_text.split("\0")
+    return {
+        svcname: (int(fields[i * 2]), fields[i * 2 + 1])
+        for i, svcname in enumerate(svcnames)
+    }
+
+
+def _svc_status_cache(node):
+    # sdicts by item ID and a lock for fetching them, keyed by item type
+    return node_cache(node, 'svc_status', lambda: {'lock': Lock(), 'status': {}, 'type_locks': {}})
+
+
+def forget_svc_status(node):
+    """
+    Discards all cached service status for the given node. Must be
+    called whenever something might have changed on the node.
+    """
+    cache = _svc_status_cache(node)
+    with cache['lock']:
+        cache['status'].clear()
+
+
+class Svc(Item, metaclass=ABCMeta):
+    """
+    A generic service.
+    """
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        # service items refresh their own status when checking if they
+        # have been fixed, but e.g. installing a package might start a
+        # service
+        if not isinstance(changed_item, Svc):
+            forget_svc_status(node)
+
+    def _svc_forget(self):
+        cache = _svc_status_cache(self.node)
+        with cache['lock']:
+            cache['status'].get(self.ITEM_TYPE_NAME, {}).pop(self.id, None)
+
+    def _svc_siblings(self):
+        """
+        Returns all items of this type on the same node, including this
+        one.
+        """
+        siblings = set(self.node._item_index.by_type.get(self.ITEM_TYPE_NAME, ()))
+        siblings.add(self)
+        return siblings
+
+    def get_status(self, cached=True):
+        if not cached:
+            # we're about to check if this item was fixed, only this
+            # item's status is refreshed
+            self._svc_forget()
+        return super().get_status(cached=cached)
+
+    def sdict(self):
+        cache = _svc_status_cache(self.node)
+        with cache['lock']:
+            type_lock = cache['type_locks'].setdefault(self.ITEM_TYPE_NAME, Lock())
+        with type_lock:
+            with cache['lock']:
+                known = cache['status'].setdefault(self.ITEM_TYPE_NAME, {})
+                if self.id in known:
+                    return known[self.id].copy()
+                missing = [
+                    item for item in sorted(self._svc_siblings(), key=lambda item: item.name)
+                    if item.id not in known
+                ]
+            io.debug(_("getting status of {count} {type} items on {node}").format(
+                count=len(missing),
+                node=self.node.name,
+                type=self.ITEM_TYPE_NAME,
+            ))
+            status = self.svc_status_multiple(missing)
+            with cache['lock']:
+                cache['status'].setdefault(self.ITEM_TYPE_NAME, {}).update(status)
+            return status[self.id].copy()
+
+    @abstractmethod
+    def svc_status(self):
+        """
+        Returns the sdict for this service.
+        """
+        raise NotImplementedError
+
+    def svc_status_multiple(self, items):
+        """
+        Returns a dict mapping item IDs to the result of svc_status()
+        for each of the given items (including this one).
+
+        MAY be overridden by subclasses to use a single command.
+        """
+        return {item.id: item.svc_status() for item in items}
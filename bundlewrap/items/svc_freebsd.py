@@ -1,7 +1,7 @@
 from shlex import quote
 
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import Item
+from bundlewrap.items.svc import Svc, svc_run_multiple
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -31,7 +31,7 @@ def svc_disable(node, svcname):
     return node.run("/usr/sbin/service {} disable".format(quote(svcname)), may_fail=True)
 
 
-class SvcFreeBSD(Item):
+class SvcFreeBSD(Svc):
     """
     A service managed by FreeBSD.
     """
@@ -90,12 +90,24 @@ class SvcFreeBSD(Item):
             },
         }
 
-    def sdict(self):
+    def svc_status(self):
         return {
             'enabled': svc_enabled(self.node, self.name),
             'running': svc_running(self.node, self.name),
         }
 
+    def svc_status_multiple(self, items):
+        svcnames = [item.name for item in items]
+        enabled = svc_run_multiple(self.node, '/usr/sbin/service "$svc" enabled', svcnames)
+        running = svc_run_multiple(self.node, '/usr/sbin/service "$svc" status', svcnames)
+        return {
+            item.id: {
+                'enabled': enabled[item.name][0] == 0,
+                'running': "is running as" in running[item.name][1],
+            }
+            for item in items
+        }
+
     @classmethod
     def validate_attributes(cls, bundle, item_id, attributes):
         if not isinstance(attributes.get('running', True), bool):
@@ -1,7 +1,7 @@
 from shlex import quote
 
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import Item
+from bundlewrap.items.svc import Svc, svc_run_multiple
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -31,7 +31,7 @@ def svc_disable(node, svcname):
     return node.run("rcctl set {} status off".format(quote(svcname)), may_fail=True)
 
 
-class SvcOpenBSD(Item):
+class SvcOpenBSD(Svc):
     """
     A service managed by OpenBSD rc.d.
     """
@@ -89,12 +89,24 @@ class SvcOpenBSD(Item):
             },
         }
 
-    def sdict(self):
+    def svc_status(self):
         return {
             'enabled': svc_enabled(self.node, self.name),
             'running': svc_running(self.node, self.name),
         }
 
+    def svc_status_multiple(self, items):
+        svcnames = [item.name for item in items]
+        enabled = svc_run_multiple(self.node, 'rcctl get "$svc" status', svcnames)
+        running = svc_run_multiple(self.node, 'rcctl check "$svc"', svcnames)
+        return {
+            item.id: {
+                'enabled': enabled[item.name][0] == 0,
+                'running': "ok" in running[item.name][1],
+            }
+            for item in items
+        }
+
     @classmethod
     def validate_attributes(cls, bundle, item_id, attributes):
         if not isinstance(attributes.get('running', True), bool):
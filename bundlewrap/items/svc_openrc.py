@@ -1,7 +1,7 @@
 from shlex import quote
 
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import Item
+from bundlewrap.items.svc import Svc, svc_run_multiple
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -33,7 +33,7 @@ def svc_disable(node, svcname):
     return node.run(f"rc-update del {quote(svcname)}", may_fail=True)
 
 
-class SvcOpenRC(Item):
+class SvcOpenRC(Svc):
     """
     A service managed by OpenRC init scripts.
     """
@@ -86,12 +86,26 @@ class SvcOpenRC(Item):
             },
         }
 
-    def sdict(self):
+    def svc_status(self):
         return {
             "enabled": svc_enabled(self.node, self.name),
             "running": svc_running(self.node, self.name),
         }
 
+    def svc_status_multiple(self, items):
+        svcnames = [item.name for item in items]
+        enabled = svc_run_multiple(
+            self.node, 'rc-update show default | grep -w "$svc"', svcnames,
+        )
+        running = svc_run_multiple(self.node, 'rc-service "$svc" status', svcnames)
+        return {
+            item.id: {
+                "enabled": enabled[item.name][0] == 0 and item.name in enabled[item.name][1],
+                "running": running[item.name][0] == 0 and "started" in running[item.name][1],
+            }
+            for item in items
+        }
+
     @classmethod
     def validate_attributes(cls, bundle, item_id, attributes):
         for attribute in ("enabled", "running"):
@@ -1,7 +1,7 @@
 from shlex import quote
 
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import Item
+from bundlewrap.items.svc import Svc
 from bundlewrap.utils.text import force_text, mark_for_translation as _
 
 
@@ -56,7 +56,23 @@ def svc_unmask(node, svcname):
     return node.run("systemctl unmask -- {}".format(quote(svcname)), may_fail=True)
 
 
-class SvcSystemd(Item):
+def _parse_systemctl_show(output):
+    """
+    Parses the output of `systemctl show` for multiple units into a
+    list of dicts, one for each unit.
+    """
+    units = []
+    for block in output.strip().split("\n\n"):
+        unit = {}
+        for line in block.splitlines():
+            if "=" in line:
+                key, value = line.split("=", 1)
+                unit[key] = value
+        units.append(unit)
+    return units
+
+
+class SvcSystemd(Svc):
     """
     A service managed by systemd.
     """
@@ -125,13 +141,54 @@ class SvcSystemd(Item):
             },
         }
 
-    def sdict(self):
+    def svc_status(self):
         return {
             'enabled': svc_enabled(self.node, self.name),
             'running': svc_running(self.node, self.name),
             'masked': svc_masked(self.node, self.name),
         }
 
+    def svc_status_multiple(self, items):
+        result = self.run(
+            "systemctl show --all -p Id,ActiveState,UnitFileState -- {}".format(
+                " ".join(quote(item.name) for item in items),
+            ),
+            may_fail=True,
+        )
+        units = _parse_systemctl_show(result.stdout_text)
+        if result.return_code != 0 or len(units) != len(items):
+            # e.g. an invalid unit name, let each item look for itself
+            return super().svc_status_multiple(items)
+        # these are the states `systemctl is-enabled` exits 0 for,
+        # minus 'enabled-runtime'
+        enabled_states = ('alias', 'enabled', 'indirect', 'static', 'transient')
+        disabled_states = (
+            '',  # no such unit
+            'disabled',
+            'enabled-runtime',
+            'linked',
+            'linked-runtime',
+            'masked',
+            'masked-runtime',
+        )
+        status = {}
+        unknown = []
+        for item, unit in zip(items, units):
+            unit_file_state = unit.get('UnitFileState', '')
+            if unit_file_state in enabled_states or unit_file_state in disabled_states:
+                status[item.id] = {
+                    'enabled': unit_file_state in enabled_states,
+                    'running': unit.get('ActiveState') in ('active', 'reloading'),
+                    'masked': unit_file_state == 'masked',
+                }
+            else:
+                # e.g. 'generated' for SysV init scripts, only
+                # `systemctl is-enabled` knows whether they're enabled
+                unknown.append(item)
+        if unknown:
+            status.update(super().svc_status_multiple(unknown))
+        return status
+
     @classmethod
     def validate_attributes(cls, bundle, item_id, attributes):
         for attribute in ('enabled', 'running'):
@@ -1,7 +1,7 @@
 from shlex import quote
 
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import Item
+from bundlewrap.items.svc import Svc, svc_run_multiple
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -21,7 +21,7 @@ def svc_stop(node, svcname):
     return node.run("/etc/init.d/{} stop".format(quote(svcname)), may_fail=True)
 
 
-class SvcSystemV(Item):
+class SvcSystemV(Svc):
     """
     A service managed by traditional System V init scripts.
     """
@@ -66,9 +66,15 @@ class SvcSystemV(Item):
             },
         }
 
-    def sdict(self):
+    def svc_status(self):
         return {'running': svc_running(self.node, self.name)}
 
+    def svc_status_multiple(self, items):
+        running = svc_run_multiple(
+            self.node, '/etc/init.d/"$svc" status', [item.name for item in items],
+        )
+        return {item.id: {'running': running[item.name][0] == 0} for item in items}
+
     @classmethod
     def validate_attributes(cls, bundle, item_id, attributes):
         if not isinstance(attributes.get('running', True), bool):
@@ -4,7 +4,7 @@ from shlex import quote
 
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item
-from bundlewrap.utils.remote import PathInfo
+from bundlewrap.utils.remote import forget_path_info, PathInfo
 from bundlewrap.utils.text import mark_for_translation as _
 from bundlewrap.utils.text import is_subdirectory
 
@@ -25,6 +25,10 @@ class Symlink(Item):
     ITEM_TYPE_NAME = "symlink"
     REQUIRED_ATTRIBUTES = ['target']
 
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        forget_path_info(node, changed_item)
+
     def __repr__(self):
         return "<Symlink path:{} target:{}>".format(
             quote(self.name),
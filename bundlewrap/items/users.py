@@ -1,12 +1,12 @@
 from logging import ERROR, getLogger
 from shlex import quote
 from string import ascii_lowercase, digits
-
-from passlib.hash import bcrypt, md5_crypt, sha256_crypt, sha512_crypt
+from threading import Lock
 
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item
+from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item, node_cache
 from bundlewrap.utils.text import force_text, mark_for_translation as _
+from bundlewrap.utils.ui import io
 
 
 getLogger('passlib').setLevel(ERROR)
@@ -38,35 +38,139 @@ _DEFAULT_SALT = "uJzJlYdG"
 # see https://bitbucket.org/ecollins/passlib/issues/25
 _DEFAULT_BCRYPT_SALT = "oo2ahgheen9Tei0IeJohTO"
 
+# names of the passlib.hash handlers, passlib is only imported when
+# we actually have to hash a password
 HASH_METHODS = {
-    'md5': md5_crypt,
-    'sha256': sha256_crypt,
-    'sha512': sha512_crypt,
-    'bcrypt': bcrypt
+    'md5': "md5_crypt",
+    'sha256': "sha256_crypt",
+    'sha512': "sha512_crypt",
+    'bcrypt': "bcrypt",
 }
 
 _USERNAME_VALID_CHARACTERS = ascii_lowercase + digits + "-_"
 
 
+def _account_cache(node):
+    return node_cache(node, 'account_database', lambda: {'database': None, 'lock': Lock()})
+
+
+def _account_database(node):
+    """
+    Returns a snapshot of the account database on the given node,
+    downloaded in a single command and parsed into dicts:
+
+        users:          username -> /etc/passwd entry
+        shadow:         username -> password hash from /etc/shadow
+        groups:         group name -> /etc/group entry
+        groups_by_gid:  gid -> group name
+        groups_by_user: username -> names of groups listing that user
+
+    The snapshot is kept until forget_account_database() is called.
+    """
+    cache = _account_cache(node)
+    with cache['lock']:
+        if cache['database'] is None:
+            cache['database'] = _fetch_account_database(node)
+        return cache['database']
+
+
+def _fetch_account_database(node):
+    if node.os in node.OS_FAMILY_BSD:
+        passwd_file = "/etc/master.passwd"
+        shadow_file = None
+        entries = (
+            'username',
+            'passwd_hash',
+            'uid',
+            'gid',
+            'class',
+            'change',
+            'expire',
+            'gecos',
+            'home',
+            'shell',
+        )
+    else:
+        passwd_file = "/etc/passwd"
+        shadow_file = "/etc/shadow"
+        entries = ('username', 'passwd_hash', 'uid', 'gid', 'gecos', 'home', 'shell')
+
+    # files are separated by NUL bytes, missing or unreadable files
+    # are treated as empty
+    result = node.run(
+        "cat {} 2>/dev/null; printf '\\0'; "
+        "cat {} 2>/dev/null; printf '\\0'; "
+        "cat /etc/group 2>/dev/null; true".format(passwd_file, shadow_file or "/dev/null"),
+    )
+    passwd, shadow, group = force_text(result.stdout).split("\0")
+
+    database = {
+        'users': {},
+        'shadow': {},
+        'groups': {},
+        'groups_by_gid': {},
+        'groups_by_user': {},
+    }
+    for line in passwd.splitlines():
+        if not line.strip() or line.startswith("#"):
+            continue
+        user = _parse_passwd_line(line, entries)
+        # like grep, the first matching line wins
+        database['users'].setdefault(user['username'], user)
+    for line in shadow.splitlines():
+        fields = line.split(":")
+        if len(fields) > 1:
+            database['shadow'].setdefault(fields[0], fields[1])
+    for line in group.splitlines():
+        if not line.strip() or line.startswith("#"):
+            continue
+        fields = line.strip().split(":")
+        if len(fields) < 4:
+            continue
+        groupname, gid, members = fields[0], fields[2], fields[3]
+        database['groups'].setdefault(groupname, line)
+        database['groups_by_gid'].setdefault(gid, groupname)
+        for member in members.split(","):
+            if member:
+                database['groups_by_user'].setdefault(member, set()).add(groupname)
+
+    io.debug(_(
+        "fetched account database with {users} users and {groups} groups from {node}"
+    ).format(
+        groups=len(database['groups']),
+        node=node.name,
+        users=len(database['users']),
+    ))
+    return database
+
+
+def forget_account_database(node):
+    """
+    Discards the account database snapshot for the given node. Must be
+    called whenever users or groups might have changed on the node.
+    """
+    cache = _account_cache(node)
+    with cache['lock']:
+        cache['database'] = None
+
+
 def _group_name_for_gid(node, gid):
     """
     Returns the group name that matches the gid.
     """
-    group_output = node.run("grep -e ':{}:[^:]*$' /etc/group".format(gid), may_fail=True)
-    if group_output.return_code != 0:
-        return None
-    else:
-        return group_output.stdout_text.split(":")[0]
+    return _account_database(node)['groups_by_gid'].get(gid)
 
 
 def _groups_for_user(node, username):
     """
-    Returns the list of group names for the given username on the given
-    node.
+    Returns the set of supplementary group names for the given username
+    on the given node.
     """
-    groups = node.run("id -Gn {}".format(username)).stdout_text.strip().split(" ")
-    primary_group = node.run("id -gn {}".format(username)).stdout_text.strip()
-    groups.remove(primary_group)
+    database = _account_database(node)
+    groups = set(database['groups_by_user'].get(username, ()))
+    user = database['users'].get(username)
+    if user is not None:
+        groups.discard(database['groups_by_gid'].get(user['gid']))
     return groups
 
 
@@ -113,6 +217,11 @@ class User(Item):
         else:
             return []
 
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        # any item might have added users or groups (e.g. packages)
+        forget_account_database(node)
+
     def __repr__(self):
         return "<User name:{}>".format(self.name)
 
@@ -169,6 +278,7 @@ class User(Item):
 
             command += f"{self.name}"
             self.run(command, data_stdin=stdin, may_fail=True)
+        forget_account_database(self.node)
 
     def display_on_create(self, cdict):
         for attr_name, attr_display_name in _ATTRIBUTE_NAMES.items():
@@ -226,34 +336,11 @@ class User(Item):
 
     def sdict(self):
         # verify content of /etc/passwd
-        if self.node.os in self.node.OS_FAMILY_BSD:
-            password_command = "grep -ae '^{}:' /etc/master.passwd"
-        else:
-            password_command = "grep -ae '^{}:' /etc/passwd"
-        passwd_grep_result = self.run(
-            password_command.format(self.name),
-            may_fail=True,
-        )
-        if passwd_grep_result.return_code != 0:
+        database = _account_database(self.node)
+        if self.name not in database['users']:
             return None
 
-        if self.node.os in self.node.OS_FAMILY_BSD:
-            entries = (
-                'username',
-                'passwd_hash',
-                'uid',
-                'gid',
-                'class',
-                'change',
-                'expire',
-                'gecos',
-                'home',
-                'shell',
-            )
-        else:
-            entries = ('username', 'passwd_hash', 'uid', 'gid', 'gecos', 'home', 'shell')
-
-        sdict = _parse_passwd_line(passwd_grep_result.stdout_text, entries)
+        sdict = database['users'][self.name].copy()
 
         if self.attributes['gid'] is not None and not self.attributes['gid'].isdigit():
             sdict['gid'] = _group_name_for_gid(self.node, sdict['gid'])
@@ -261,33 +348,28 @@ class User(Item):
         if self.attributes['password_hash'] is not None:
             if self.attributes['use_shadow'] and self.node.os not in self.node.OS_FAMILY_BSD:
                 # verify content of /etc/shadow unless we are on OpenBSD
-                shadow_grep_result = self.run(
-                    "grep -e '^{}:' /etc/shadow".format(self.name),
-                    may_fail=True,
-                )
-                if shadow_grep_result.return_code != 0:
-                    sdict['password_hash'] = None
-                else:
-                    sdict['password_hash'] = shadow_grep_result.stdout_text.split(":")[1]
+                sdict['password_hash'] = database['shadow'].get(self.name)
             else:
                 sdict['password_hash'] = sdict['passwd_hash']
         del sdict['passwd_hash']
 
         # verify content of /etc/group
-        sdict['groups'] = set(_groups_for_user(self.node, self.name))
+        sdict['groups'] = _groups_for_user(self.node, self.name)
 
         return sdict
 
     def patch_attributes(self, attributes):
         if attributes.get('password', None) is not None:
+            from passlib import hash as passlib_hash
+
             # defaults aren't set yet
-            hash_method = HASH_METHODS[attributes.get(
+            hash_method = getattr(passlib_hash, HASH_METHODS[attributes.get(
                 'hash_method',
                 self.ITEM_ATTRIBUTES['hash_method'],
-            )]
+            )])
             salt = force_text(attributes.get('salt', None))
             if self.node.os == 'openbsd':
-                attributes['password_hash'] = bcrypt.encrypt(
+                attributes['password_hash'] = passlib_hash.bcrypt.encrypt(
                     force_text(attributes['password']),
                     rounds=8,  # default rounds for OpenBSD accounts
                     salt=_DEFAULT_BCRYPT_SALT if salt is None else salt,
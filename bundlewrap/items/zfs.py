@@ -0,0 +1,101 @@
+from shlex import quote
+from threading import Lock
+
+from bundlewrap.items import node_cache
+from bundlewrap.utils.text import mark_for_translation as _
+from bundlewrap.utils.ui import io
+
+
+# `zfs get` reports these under their canonical names
+PROPERTY_ALIASES = {
+    'avail': "available",
+    'compress': "compression",
+    'recsize': "recordsize",
+    'refreserv': "refreservation",
+    'reserv': "reservation",
+    'volblock': "volblocksize",
+}
+
+
+def _parse_properties(output, result):
+    """
+    Adds the output of `zfs get -H -o name,property,value` (or zpool
+    get) to the given dict of dicts.
+    """
+    for line in output.splitlines():
+        try:
+            name, prop, value = line.split("\t")
+        except ValueError:
+            continue
+        result.setdefault(name, {})[prop] = value
+
+
+def _zfs_cache(node):
+    return node_cache(node, 'zfs_state', lambda: {'lock': Lock(), 'state': None})
+
+
+def get_zfs_state(node):
+    """
+    Returns all properties of all datasets and pools on the given node,
+    obtained using a single command:
+
+        datasets: dataset name -> {property: value}
+        pools:    pool name -> {property: value}
+
+    The state is kept until forget_zfs_state() is called.
+    """
+    cache = _zfs_cache(node)
+    with cache['lock']:
+        if cache['state'] is not None:
+            return cache['state']
+        result = node.run(
+            "zfs get -Hp -o name,property,value -t filesystem,volume all 2>/dev/null; "
+            "printf '\\0'; "
+            "zpool get -H -o name,property,value all 2>/dev/null; "
+            "true"
+        )
+        datasets_output, pools_output = result.stdout_text.split("\0")
+        state = {'datasets': {}, 'pools': {}}
+        _parse_properties(datasets_output, state['datasets'])
+        _parse_properties(pools_output, state['pools'])
+        io.debug(_("fetched {datasets} ZFS datasets and {pools} pools from {node}").format(
+            datasets=len(state['datasets']),
+            node=node.name,
+            pools=len(state['pools']),
+        ))
+        cache['state'] = state
+        return state
+
+
+def refresh_zfs_properties(node, path, properties=("all",), recursive=False):
+    """
+    Updates the given properties of the given dataset (and its
+    children if recursive is True) in the cached state.
+    """
+    result = node.run(
+        "zfs get -Hp -o name,property,value -t filesystem,volume {}{} {}".format(
+            "-r " if recursive else "",
+            quote(",".join(sorted(set(properties)))),
+            quote(path),
+        ),
+        may_fail=True,
+    )
+    datasets = {}
+    _parse_properties(result.stdout_text, datasets)
+    cache = _zfs_cache(node)
+    with cache['lock']:
+        if cache['state'] is None:
+            # will be fetched from scratch anyway
+            return
+        for name, dataset_properties in datasets.items():
+            cache['state']['datasets'].setdefault(name, {}).update(dataset_properties)
+
+
+def forget_zfs_state(node):
+    """
+    Discards the cached ZFS state for the given node. Must be called
+    whenever datasets or pools might have changed on the node.
+    """
+    cache = _zfs_cache(node)
+    with cache['lock']:
+        cache['state'] = None
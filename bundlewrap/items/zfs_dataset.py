@@ -1,6 +1,12 @@
 from shlex import quote
 
 from bundlewrap.items import Item
+from bundlewrap.items.zfs import (
+    forget_zfs_state,
+    get_zfs_state,
+    PROPERTY_ALIASES,
+    refresh_zfs_properties,
+)
 
 
 class ZFSDataset(Item):
@@ -11,6 +17,12 @@ class ZFSDataset(Item):
     REJECT_UNKNOWN_ATTRIBUTES = False
     ITEM_TYPE_NAME = "zfs_dataset"
 
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        if changed_item.ITEM_TYPE_NAME != "zfs_dataset":
+            # zfs_dataset items update the state they changed
+            forget_zfs_state(node)
+
     def __repr__(self):
         return f"<ZFSDataset name:{self.name} {' '.join(f'{k}:{v}' for k,v in self.attributes.items())}>"
 
@@ -30,23 +42,29 @@ class ZFSDataset(Item):
             ),
             may_fail=True,
         )
+        refresh_zfs_properties(self.node, path)
 
         if options['mounted'] == 'no':
             self.__set_option(path, 'mounted', 'no')
 
     def __does_exist(self, path):
-        status_result = self.run(
-            "zfs list {}".format(quote(path)),
-            may_fail=True,
-        )
-        return status_result.return_code == 0
+        return path in get_zfs_state(self.node)['datasets']
 
     def __get_option(self, path, option):
-        cmd = "zfs get -Hp -o value {} {}".format(quote(option), quote(path))
         # We always expect this to succeed since we don't call this function
         # if we have already established that the dataset does not exist.
-        status_result = self.run(cmd)
-        return status_result.stdout.decode('utf-8').strip()
+        properties = get_zfs_state(self.node)['datasets'][path]
+        canonical_option = PROPERTY_ALIASES.get(option, option)
+        if canonical_option in properties:
+            return properties[canonical_option]
+        elif ":" in option:
+            # Like `zfs get`, we report unset user properties as "-".
+            return "-"
+        else:
+            # some alias we don't know about, let zfs resolve it
+            cmd = "zfs get -Hp -o value {} {}".format(quote(option), quote(path))
+            status_result = self.run(cmd)
+            return status_result.stdout.decode('utf-8').strip()
 
     def __set_option(self, path, option, value):
         if option == 'mounted':
@@ -68,6 +86,9 @@ class ZFSDataset(Item):
                 ),
                 may_fail=True,
             )
+        # children might inherit the option and mounting or changing
+        # the mountpoint affects whether they are mounted
+        refresh_zfs_properties(self.node, path, (option, 'mounted'), recursive=True)
 
     def cdict(self):
         cdict = {}
@@ -3,6 +3,7 @@ from shlex import quote
 
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item
+from bundlewrap.items.zfs import forget_zfs_state, get_zfs_state
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -22,6 +23,12 @@ class ZFSPool(Item):
     }
     ITEM_TYPE_NAME = "zfs_pool"
 
+    @classmethod
+    def forget_node_state(cls, node, changed_item):
+        if changed_item.ITEM_TYPE_NAME != "zfs_dataset":
+            # zfs_dataset items update the state they changed
+            forget_zfs_state(node)
+
     def __repr__(self):
         return "<ZFSPool name:{} autoexpand:{} autoreplace:{} autotrim:{} ashift:{} config:{}>".format(
             self.name,
@@ -48,6 +55,13 @@ class ZFSPool(Item):
         return sorted(devices)
 
     def fix(self, status):
+        try:
+            self.__fix(status)
+        finally:
+            # creating a pool also creates its root dataset
+            forget_zfs_state(self.node)
+
+    def __fix(self, status):
         if status.must_be_created:
             cmdline = []
             for option in self.when_creating['config']:
@@ -86,21 +100,10 @@ class ZFSPool(Item):
                 self.run('zpool set {}={} {}'.format(attr, state_str, quote(self.name)))
 
     def sdict(self):
-        status_result = self.run('zpool list {}'.format(quote(self.name)), may_fail=True)
-        if status_result.return_code != 0:
+        pool_status = get_zfs_state(self.node)['pools'].get(self.name)
+        if pool_status is None:
             return None
 
-        pool_status = {}
-        for line in self.run(
-            'zpool get all -H -o all {}'.format(quote(self.name)),
-            may_fail=True,
-        ).stdout.decode().splitlines():
-            try:
-                pname, prop, value, source = line.split()
-                pool_status[prop.strip()] = value.strip()
-            except (IndexError, ValueError):
-                continue
-
         sdict = {}
         for attr in self.attributes:
             sdict[attr] = (pool_status.get(attr) == 'on')
@@ -0,0 +1,151 @@
+from hashlib import sha1
+from io import BytesIO
+from os import environ, makedirs, replace, walk
+from os.path import exists, isdir, isfile, join, relpath
+from pickle import HIGHEST_PROTOCOL, Pickler, PicklingError, Unpickler, UnpicklingError
+from sys import version_info
+from tempfile import mkstemp
+
+from . import VERSION_STRING
+from .secrets import SecretProxy
+from .utils import cached_property, Fault, get_file_contents
+from .utils.text import mark_for_translation as _
+from .utils.ui import io
+
+
+DIRNAME_CACHE = ".cache"
+DIRNAME_METADATA_CACHE = "metadata"
+
+
+def make_cache_dir(repo_path, *subdirs):
+    """
+    Creates the given directory below the cache directory of the repo
+    at repo_path (if necessary) and returns its path. The cache
+    directory gets a .gitignore, so it never makes the repo look dirty.
+    """
+    cache_dir = join(repo_path, DIRNAME_CACHE)
+    path = join(cache_dir, *subdirs)
+    makedirs(path, exist_ok=True)
+    gitignore = join(cache_dir, ".gitignore")
+    if not exists(gitignore):
+        with open(gitignore, 'w') as f:
+            f.write("*\n")
+    return path
+
+
+class UncacheableFault(PicklingError):
+    pass
+
+
+class _MetadataPickler(Pickler):
+    """
+    Faults usually hold a closure as their callback, which can't be
+    pickled. We can, however, store Faults coming straight from
+    repo.vault by remembering which vault method to call with which
+    arguments.
+    """
+    def persistent_id(self, obj):
+        if not isinstance(obj, Fault):
+            return None
+        vault = getattr(obj.callback, '__self__', None)
+        if not isinstance(vault, SecretProxy):
+            raise UncacheableFault(repr(obj))
+        return ('vault', obj.callback.__name__, obj.id_list[0], obj.kwargs)
+
+
+class _MetadataUnpickler(Unpickler):
+    def __init__(self, file, repo):
+        super().__init__(file)
+        self.repo = repo
+
+    def persistent_load(self, pid):
+        kind, method_name, fault_id, kwargs = pid
+        if kind != 'vault':
+            raise UnpicklingError(_("unknown persistent object: {}").format(repr(pid)))
+        return Fault(fault_id, getattr(self.repo.vault, method_name), **kwargs)
+
+
+class MetadataCache:
+    """
+    Stores the final metadata (and blame) of nodes on disk, so it
+    doesn't have to be rebuilt by running all reactors every time bw is
+    invoked.
+
+    Since reactors can read metadata from any node, all files that can
+    possibly influence metadata are part of a single cache key for the
+    entire repo. Change any of them and all cached metadata becomes
+    invalid.
+    """
+    def __init__(self, repo):
+        self.repo = repo
+        self.path = join(repo.path, DIRNAME_CACHE, DIRNAME_METADATA_CACHE)
+
+    def _input_files(self):
+        yield self.repo.nodes_file
+        yield self.repo.groups_file
+        for dirname in ("nodes", "groups", "libs"):
+            path = join(self.repo.path, dirname)
+            if not isdir(path):
+                continue
+            for root_dir, _dirs, files in walk(path):
+                for filename in files:
+                    yield join(root_dir, filename)
+        for bundle_name in self.repo.bundle_names:
+            yield join(self.repo.bundles_dir, bundle_name, "metadata.py")
+
+    @cached_property
+    def key(self):
+        hasher = sha1()
+        hasher.update(VERSION_STRING.encode('utf-8'))
+        hasher.update("{}.{}".format(*version_info[:2]).encode('utf-8'))
+        hasher.update(environ.get("BW_VAULT_DUMMY_MODE", "0").encode('utf-8'))
+        for path in sorted(self._input_files()):
+            if not isfile(path):
+                continue
+            hasher.update(relpath(path, self.repo.path).encode('utf-8'))
+            hasher.update(b"\0")
+            hasher.update(sha1(get_file_contents(path)).digest())
+        return hasher.hexdigest()
+
+    def _node_file(self, node_name):
+        return join(self.path, node_name + ".pickle")
+
+    def load(self, node_name):
+        """
+        Returns a dict with 'metadata' and 'blame' for the given node or
+        None if there is no valid cache entry.
+        """
+        try:
+            with open(self._node_file(node_name), 'rb') as f:
+                entry = _MetadataUnpickler(f, self.repo).load()
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            io.debug(f"unable to read metadata cache for {node_name}: {repr(exc)}")
+            return None
+        if entry.get('key') != self.key:
+            io.debug(f"metadata cache for {node_name} is stale")
+            return None
+        io.debug(f"using cached metadata for {node_name}")
+        return entry
+
+    def store(self, node_name, metadata, blame):
+        buf = BytesIO()
+        try:
+            _MetadataPickler(buf, protocol=HIGHEST_PROTOCOL).dump({
+                'blame': blame,
+                'key': self.key,
+                'metadata': metadata,
+            })
+        except UncacheableFault as exc:
+            io.debug(f"not caching metadata for {node_name}, it contains {exc}")
+            return
+        except (AttributeError, PicklingError, TypeError) as exc:
+            io.debug(f"not caching metadata for {node_name}: {repr(exc)}")
+            return
+        make_cache_dir(self.repo.path, DIRNAME_METADATA_CACHE)
+        handle, tmp_path = mkstemp(dir=self.path, prefix=".tmp_")
+        with open(handle, 'wb') as f:
+            f.write(buf.getvalue())
+        replace(tmp_path, self._node_file(node_name))
+        io.debug(f"stored metadata cache for {node_name}")
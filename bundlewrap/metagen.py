@@ -1,21 +1,41 @@
 from collections import defaultdict, Counter
 from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from os import environ
-from threading import RLock
+from threading import local, RLock
+from time import perf_counter
 from traceback import TracebackException
 
 from .exceptions import MetadataPersistentKeyError
-from .metadata import DoNotRunAgain
+from .metadata import deepcopy_metadata, DoNotRunAgain
 from .node import _flatten_group_hierarchy
 from .utils import list_starts_with, randomize_order, NO_DEFAULT
-from .utils.dicts import extra_paths_in_dict
+from .utils.dicts import extra_paths_in_dict, value_at_key_path
 from .utils.ui import io, QUIT_EVENT
 from .utils.metastack import Metastack
 from .utils.text import bold, mark_for_translation as _, red
 
 
 MAX_METADATA_ITERATIONS = int(environ.get("BW_MAX_METADATA_ITERATIONS", "1000"))
+METADATA_WORKERS = int(environ.get("BW_METADATA_WORKERS", "1"))
+
+
+class ReactorContext(local):
+    """
+    Keeps track of the reactor currently running in this thread.
+    """
+    def __init__(self):
+        # are we currently executing a reactor?
+        self.in_a_reactor = False
+        self.reactor = None
+        self.provides = ()
+        # all paths requested by the current reactor during this run
+        self.requested_paths = set()
+        # all new paths not requested before by the current reactor
+        self.newly_requested_paths = set()
+        # how often the current reactor called metadata.get()
+        self.metadata_gets = 0
 
 
 class ReactorTree:
@@ -107,6 +127,8 @@ class NodeMetadataProxy(Mapping):
         self._node = node
         self._completed_paths = PathSet()
         self._metastack = Metastack()
+        # None: cache not consulted yet, False: no usable cache entry
+        self._cache_entry = None
 
     def __contains__(self, key):
         try:
@@ -128,23 +150,71 @@ class NodeMetadataProxy(Mapping):
 
     @property
     def blame(self):
-        if self._metagen._in_a_reactor:
+        if self._metagen._reactor_context.in_a_reactor:
             raise RuntimeError("cannot call node.metadata.blame from a reactor")
+        elif self._served_from_cache:
+            return self._cache_entry['blame']
         else:
             return self._metastack.as_blame()
 
     @property
     def stack(self):
-        if self._metagen._in_a_reactor:
+        if self._metagen._reactor_context.in_a_reactor:
             raise RuntimeError("cannot call node.metadata.stack from a reactor")
         else:
+            if self._served_from_cache:
+                # the cache doesn't have individual layers, build them
+                self._cache_entry = False
+                self.get(tuple())
             return self._metastack
 
+    @property
+    def _served_from_cache(self):
+        return (
+            bool(self._cache_entry) and
+            self._node not in self._metagen._relevant_nodes
+        )
+
+    def _get_from_cache(self, path):
+        """
+        Returns metadata from the on-disk cache or NO_DEFAULT if the
+        cache can't be used.
+        """
+        metadata_cache = self._metagen._metadata_cache
+        if (
+            metadata_cache is None or
+            self._cache_entry is False or
+            self._metagen._reactor_context.in_a_reactor
+        ):
+            return NO_DEFAULT
+
+        if self._cache_entry is None:
+            if self._node in self._metagen._relevant_nodes:
+                # a reactor on another node has already started building
+                # metadata for this node, don't mix the two
+                self._cache_entry = False
+                return NO_DEFAULT
+            self._cache_entry = metadata_cache.load(self._node.name) or False
+
+        if not self._served_from_cache:
+            return NO_DEFAULT
+        return deepcopy_metadata(value_at_key_path(self._cache_entry['metadata'], path))
+
+    def _store_in_cache(self):
+        metadata_cache = self._metagen._metadata_cache
+        if metadata_cache is not None and not self._served_from_cache:
+            metadata_cache.store(
+                self._node.name,
+                self._metastack.as_dict(),
+                self._metastack.as_blame(),
+            )
+
     def get(self, path, default=NO_DEFAULT, _backwards_compatibility_default=True):
+        context = self._metagen._reactor_context
         if (
             default == NO_DEFAULT and
             _backwards_compatibility_default and
-            not self._metagen._in_a_reactor and
+            not context.in_a_reactor and
             "/" not in path
         ):
             # make node.metadata.get('foo') work as if it was still a dict
@@ -153,18 +223,38 @@ class NodeMetadataProxy(Mapping):
         if not isinstance(path, (tuple, list)):
             path = tuple(path.split("/"))
 
-        if self._metagen._in_a_reactor and self._metagen._record_reactor_call_graph:
-            for provided_path in self._metagen._current_reactor_provides:
+        if context.in_a_reactor:
+            context.metadata_gets += 1
+
+        if context.in_a_reactor and self._metagen._record_reactor_call_graph:
+            for provided_path in context.provides:
                 self._metagen._reactor_call_graph.add((
-                    (self._metagen._current_reactor[0], provided_path),
+                    (context.reactor[0], provided_path),
                     (self._node.name, path),
-                    self._metagen._current_reactor,
+                    context.reactor,
                 ))
 
-        with self._metagen._node_metadata_lock:
+        if context.in_a_reactor:
+            # Reactors may run in worker threads while the thread that
+            # started metadata generation holds _node_metadata_lock.
+            lock = self._metagen._reactor_lock
+        else:
+            lock = self._metagen._node_metadata_lock
+
+        with lock:
+            try:
+                cached_value = self._get_from_cache(path)
+            except KeyError as exc:
+                if default != NO_DEFAULT:
+                    return default
+                else:
+                    raise exc
+            if cached_value is not NO_DEFAULT:
+                return cached_value
+
             # The lock is required because there are several thread-unsafe things going on here:
             #
-            #   self._metagen._current_reactor_newly_requested_paths
+            #   self._metagen._reactors
             #   self._metagen._build_node_metadata
             #   self._metastack
             #
@@ -172,13 +262,12 @@ class NodeMetadataProxy(Mapping):
             # called from _build_node_metadata (when reactors call node.metadata.get()).
             if self._node not in self._metagen._relevant_nodes:
                 self._metagen._initialize_node(self._node)
-            if self._metagen._in_a_reactor:
-                if self._metagen._reactors[self._metagen._current_reactor]['requested_paths'].add(
+            if context.in_a_reactor:
+                context.requested_paths.add((self._node.name,) + path)
+                if self._metagen._reactors[context.reactor]['requested_paths'].add(
                     (self._node.name,) + path
                 ):
-                    self._metagen._current_reactor_newly_requested_paths.add(
-                        (self._node.name,) + path
-                    )
+                    context.newly_requested_paths.add((self._node.name,) + path)
             elif not self._completed_paths.covers(path):
                 io.debug(f"metagen triggered by request for {path} on {self._node.name}")
                 self._metagen._trigger_reactors_for_path(
@@ -188,6 +277,9 @@ class NodeMetadataProxy(Mapping):
                 with io.job(_("building metadata...")):
                     self._metagen._build_node_metadata(self._node)
                 self._completed_paths.add(path)
+                if not path:
+                    # we only cache complete metadata
+                    self._store_in_cache()
 
             try:
                 return self._metastack.get(path)
@@ -195,8 +287,8 @@ class NodeMetadataProxy(Mapping):
                 if default != NO_DEFAULT:
                     return default
                 else:
-                    if self._metagen._in_a_reactor:
-                        self._metagen._reactors_with_keyerrors[self._metagen._current_reactor] = \
+                    if context.in_a_reactor:
+                        self._metagen._reactors_with_keyerrors[context.reactor] = \
                             ((self._node.name, path), exc)
                     raise exc
 
@@ -216,6 +308,10 @@ class MetadataGenerator:
         self._node_metadata_proxies = {}
         # metadata access is multi-threaded, but generation can't be
         self._node_metadata_lock = RLock()
+        # reactors running in parallel must not initialize nodes concurrently
+        self._reactor_lock = RLock()
+        # how many reactors may run in parallel
+        self._metadata_workers = METADATA_WORKERS
         # guard against infinite loops
         self.__iterations = 0
         # all nodes involved with currently requested metadata
@@ -233,20 +329,24 @@ class MetadataGenerator:
         # bw plot reactors
         self._reactor_call_graph = set()
         self._reactor_runs = defaultdict(int)
-        # are we currently executing a reactor?
-        self._in_a_reactor = False
-        # all new paths not requested before by the current reactor
-        self._current_reactor_newly_requested_paths = set()
+        # which reactor (if any) is running in the current thread
+        self._reactor_context = ReactorContext()
         # should reactor return values be checked against their declared keys?
         self._verify_reactor_provides = False
         # should we collect information for `bw plot reactors`?
         self._record_reactor_call_graph = False
+        # on-disk cache of final node metadata (see metacache.py)
+        self._metadata_cache = None
+        # set to a ReactorProfile to record reactor timing (see metaprofile.py)
+        self._reactor_profile = None
 
     def _metadata_proxy_for_node(self, node_name):
-        if node_name not in self._node_metadata_proxies:
-            self._node_metadata_proxies[node_name] = \
-                NodeMetadataProxy(self, self.get_node(node_name))
-        return self._node_metadata_proxies[node_name]
+        # reactors running in parallel might both be first to ask
+        with self._reactor_lock:
+            if node_name not in self._node_metadata_proxies:
+                self._node_metadata_proxies[node_name] = \
+                    NodeMetadataProxy(self, self.get_node(node_name))
+            return self._node_metadata_proxies[node_name]
 
     def _build_node_metadata(self, initial_node_name):
         self.__iterations = 0
@@ -375,75 +475,192 @@ class MetadataGenerator:
                 f"it previously raised a KeyError for: {path_exc[0]}"
             )
 
+    def __provided_paths(self, reactor_id):
+        node_name = reactor_id[0]
+        for path in getattr(self._reactors[reactor_id]['reactor'], '_provides', ((),)):
+            yield (node_name,) + path
+
+    def __reactor_reads_from(self, reactor_id, requested_paths, other_reactor_id):
+        """
+        Returns True if any of the given paths requested by reactor_id
+        overlap with what other_reactor_id provides.
+        """
+        if reactor_id == other_reactor_id:
+            return True
+        for provided_path in self.__provided_paths(other_reactor_id):
+            for requested_path in requested_paths:
+                if (
+                    list_starts_with(requested_path, provided_path) or
+                    list_starts_with(provided_path, requested_path)
+                ):
+                    return True
+        return False
+
+    def __reactor_waves(self):
+        """
+        Groups the reactors to run into waves of reactors that can run
+        in parallel because, as far as we know, none of them read
+        metadata provided by another one in the same wave.
+        """
+        waves = []
+        for reactor_id, debug_msg in self.__reactors_to_run():
+            if self._metadata_workers < 2:
+                waves.append([(reactor_id, debug_msg)])
+                continue
+            for wave in waves:
+                if len(wave) >= self._metadata_workers:
+                    continue
+                if not any(
+                    self.__reactor_reads_from(
+                        reactor_id,
+                        self._reactors[reactor_id]['requested_paths'],
+                        other_reactor_id,
+                    ) or
+                    self.__reactor_reads_from(
+                        other_reactor_id,
+                        self._reactors[other_reactor_id]['requested_paths'],
+                        reactor_id,
+                    )
+                    for other_reactor_id, other_debug_msg in wave
+                ):
+                    wave.append((reactor_id, debug_msg))
+                    break
+            else:
+                waves.append([(reactor_id, debug_msg)])
+        return waves
+
     def __run_reactors(self):
         reactors_run = set()
         only_keyerrors = True
 
-        for reactor_id, debug_msg in self.__reactors_to_run():
+        for wave in self.__reactor_waves():
             if QUIT_EVENT.is_set():
                 # It's important that we don't just `break` here and
                 # end up returning incomplete metadata.
                 raise KeyboardInterrupt
 
-            reactors_run.add(reactor_id)
-            node_name, reactor_name = reactor_id
-            io.debug(debug_msg)
+            for reactor_id, debug_msg in wave:
+                reactors_run.add(reactor_id)
+                io.debug(debug_msg)
+
             with io.job(_("building metadata ({} nodes, {} reactors, {} iterations)...").format(
                 len(self._relevant_nodes),
                 len(self._reactors),
                 self.__iterations,
             )):
-                self.__run_reactor(
-                    self.get_node(node_name),
-                    reactor_name,
-                    self._reactors[reactor_id]['reactor'],
-                )
+                self.__run_wave([reactor_id for reactor_id, debug_msg in wave])
 
-            if (node_name, reactor_name) not in self._reactors_with_keyerrors:
-                only_keyerrors = False
+            for reactor_id, debug_msg in wave:
+                if reactor_id not in self._reactors_with_keyerrors:
+                    only_keyerrors = False
 
         return reactors_run, only_keyerrors
 
-    def __run_reactor(self, node, reactor_name, reactor):
-        # make sure the reactor doesn't react to its own output
-        old_metadata = node.metadata._metastack.pop_layer(1, reactor_name)
-        self._in_a_reactor = True
-        self._current_reactor = (node.name, reactor_name)
-        self._current_reactor_provides = getattr(reactor, '_provides', (("/",),))  # used in .get()
-        self._current_reactor_newly_requested_paths = set()
-        self._reactor_runs[self._current_reactor] += 1
+    def __run_wave(self, reactor_ids):
+        old_metadata = {}
+        for reactor_id in reactor_ids:
+            node_name, reactor_name = reactor_id
+            # make sure the reactor doesn't react to its own output
+            old_metadata[reactor_id] = \
+                self.get_node(node_name).metadata._metastack.pop_layer(1, reactor_name)
+
+        if len(reactor_ids) == 1:
+            outcomes = {reactor_ids[0]: self.__run_reactor(reactor_ids[0])}
+        else:
+            with ThreadPoolExecutor(max_workers=len(reactor_ids)) as executor:
+                futures = {
+                    reactor_id: executor.submit(self.__run_reactor, reactor_id)
+                    for reactor_id in reactor_ids
+                }
+            outcomes = {
+                reactor_id: future.result()
+                for reactor_id, future in futures.items()
+            }
+
+        # Reactors in this wave may have been triggered by each other
+        # in the meantime. They didn't see each other's new results, so
+        # we must only clear triggers from before the wave.
+        for reactor_id in reactor_ids:
+            with suppress(KeyError):
+                del self._reactors_triggered[reactor_id]
+
+        # process results in a stable order to arrive at the same
+        # metastack regardless of which reactor finished first
+        for reactor_id in sorted(reactor_ids):
+            self.__process_reactor_result(
+                reactor_id,
+                old_metadata[reactor_id],
+                outcomes[reactor_id],
+            )
+
+        if len(reactor_ids) > 1:
+            for reactor_id in reactor_ids:
+                for other_reactor_id in reactor_ids:
+                    if reactor_id != other_reactor_id and self.__reactor_reads_from(
+                        reactor_id,
+                        outcomes[reactor_id]['requested_paths'],
+                        other_reactor_id,
+                    ):
+                        # We guessed wrong and this reactor read metadata
+                        # while a reactor it depends on was running. It
+                        # has to run again. We now know about the
+                        # dependency, so they will end up in different
+                        # waves next time.
+                        io.debug(f"rerun of {reactor_id} required by parallel {other_reactor_id}")
+                        self._reactors_triggered[reactor_id].add(other_reactor_id)
+                        break
+
+    def __run_reactor(self, reactor_id):
+        """
+        Runs a single reactor, possibly in a worker thread. Returns a
+        dict describing the outcome that must then be passed to
+        __process_reactor_result().
+        """
+        node_name, reactor_name = reactor_id
+        node = self.get_node(node_name)
+        reactor = self._reactors[reactor_id]['reactor']
+        context = self._reactor_context
+        context.in_a_reactor = True
+        context.reactor = reactor_id
+        context.provides = getattr(reactor, '_provides', (("/",),))  # used in .get()
+        context.requested_paths = set()
+        context.newly_requested_paths = set()
+        context.metadata_gets = 0
+        self._reactor_runs[reactor_id] += 1
+        outcome = {
+            'new_metadata': None,
+            'result': 'ok',
+        }
+        start = perf_counter()
         try:
-            new_metadata = reactor(node.metadata)
+            outcome['new_metadata'] = reactor(node.metadata)
         except KeyError as exc:
-            if self._current_reactor not in self._reactors_with_keyerrors:
-                # Uncomment this in 5.0 and remove the rest of this block
-                # # this is a KeyError that didn't result from metadata.get()
-                # io.stderr(_(
-                #     "{x} KeyError while executing metadata reactor "
-                #     "{metaproc} for node {node}:"
-                # ).format(
-                #     x=red("!!!"),
-                #     metaproc=reactor_name,
-                #     node=node.name,
-                # ))
-                # raise exc
-                self._reactors_with_keyerrors[self._current_reactor] = (
-                    ('UNKNOWN', ('UNKNOWN',)),
-                    exc,
-                )
+            with self._reactor_lock:
+                if reactor_id not in self._reactors_with_keyerrors:
+                    # Uncomment this in 5.0 and remove the rest of this block
+                    # # this is a KeyError that didn't result from metadata.get()
+                    # io.stderr(_(
+                    #     "{x} KeyError while executing metadata reactor "
+                    #     "{metaproc} for node {node}:"
+                    # ).format(
+                    #     x=red("!!!"),
+                    #     metaproc=reactor_name,
+                    #     node=node.name,
+                    # ))
+                    # raise exc
+                    self._reactors_with_keyerrors[reactor_id] = (
+                        ('UNKNOWN', ('UNKNOWN',)),
+                        exc,
+                    )
             io.debug(
-                f"{self._current_reactor} raised KeyError: "
-                f"{self._reactors_with_keyerrors[self._current_reactor]}"
+                f"{reactor_id} raised KeyError: "
+                f"{self._reactors_with_keyerrors[reactor_id]}"
             )
-            return False
+            outcome['result'] = 'keyerror'
         except DoNotRunAgain:
-            self._reactors[self._current_reactor]['raised_donotrunagain'] = True
-            # clear any previously stored exception
-            with suppress(KeyError):
-                del self._reactors_with_keyerrors[self._current_reactor]
-            self._current_reactor_newly_requested_paths.clear()
-            io.debug(f"{self._current_reactor} raised DoNotRunAgain")
-            return False
+            context.newly_requested_paths.clear()
+            io.debug(f"{reactor_id} raised DoNotRunAgain")
+            outcome['result'] = 'donotrunagain'
         except Exception as exc:
             io.stderr(_(
                 "{x} Exception while executing metadata reactor "
@@ -455,17 +672,42 @@ class MetadataGenerator:
             ))
             raise exc
         finally:
-            self._in_a_reactor = False
+            context.in_a_reactor = False
+            outcome['requested_paths'] = context.requested_paths
+            outcome['newly_requested_paths'] = context.newly_requested_paths
+            if self._reactor_profile is not None:
+                self._reactor_profile.record_run(
+                    reactor_id,
+                    start,
+                    perf_counter() - start,
+                    context.metadata_gets,
+                    outcome['result'] == 'keyerror',
+                )
+        return outcome
+
+    def __process_reactor_result(self, reactor_id, old_metadata, outcome):
+        node_name, reactor_name = reactor_id
+        node = self.get_node(node_name)
+        reactor = self._reactors[reactor_id]['reactor']
+
+        for path in outcome['newly_requested_paths']:
+            for needed_reactor in self._trigger_reactors_for_path(path, reactor_id):
+                self._reactors[needed_reactor]['trigger_on_change'].add(reactor_id)
+
+        if outcome['result'] == 'keyerror':
+            return
+        elif outcome['result'] == 'donotrunagain':
+            self._reactors[reactor_id]['raised_donotrunagain'] = True
+            # clear any previously stored exception
             with suppress(KeyError):
-                del self._reactors_triggered[self._current_reactor]
-            for path in self._current_reactor_newly_requested_paths:
-                for needed_reactor in self._trigger_reactors_for_path(path, self._current_reactor):
-                    self._reactors[needed_reactor]['trigger_on_change'].add(self._current_reactor)
+                del self._reactors_with_keyerrors[reactor_id]
+            return
 
         # reactor terminated normally, clear any previously stored exception
         with suppress(KeyError):
-            del self._reactors_with_keyerrors[self._current_reactor]
+            del self._reactors_with_keyerrors[reactor_id]
 
+        new_metadata = outcome['new_metadata']
         if new_metadata is None:
             raise ValueError(_(
                 "{reactor_name} on {node_name} returned None instead of a dict "
@@ -507,10 +749,15 @@ class MetadataGenerator:
             raise exc
 
         if old_metadata != new_metadata:
-            io.debug(f"{self._current_reactor} returned changed result")
-            self._reactor_changes[self._current_reactor] += 1
-            for triggered_reactor in self._reactors[self._current_reactor]['trigger_on_change']:
-                io.debug(f"rerun of {triggered_reactor} triggered by {self._current_reactor}")
-                self._reactors_triggered[triggered_reactor].add(self._current_reactor)
+            io.debug(f"{reactor_id} returned changed result")
+            self._reactor_changes[reactor_id] += 1
+            if self._reactor_profile is not None:
+                self._reactor_profile.record_change(
+                    reactor_id,
+                    len(self._reactors[reactor_id]['trigger_on_change']),
+                )
+            for triggered_reactor in self._reactors[reactor_id]['trigger_on_change']:
+                io.debug(f"rerun of {triggered_reactor} triggered by {reactor_id}")
+                self._reactors_triggered[triggered_reactor].add(reactor_id)
         else:
-            io.debug(f"{self._current_reactor} returned same result")
+            io.debug(f"{reactor_id} returned same result")
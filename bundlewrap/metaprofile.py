@@ -0,0 +1,119 @@
+from collections import defaultdict
+from json import dump
+from threading import get_ident, Lock
+from time import perf_counter
+
+from .utils.table import ROW_SEPARATOR, render_table
+from .utils.text import bold, mark_for_translation as _
+
+
+class ReactorProfile:
+    """
+    Records how much time each metadata reactor takes and how much work
+    it causes during metadata generation.
+    """
+    def __init__(self):
+        # reactors may run in parallel (see BW_METADATA_WORKERS)
+        self._lock = Lock()
+        self._start = perf_counter()
+        # reactor ID -> counters
+        self.stats = defaultdict(lambda: {
+            'changes': 0,
+            'keyerrors': 0,
+            'metadata_gets': 0,
+            'runs': 0,
+            'time': 0.0,
+            'triggered': 0,
+        })
+        # (reactor ID, thread ID, start, duration) for every run
+        self.runs = []
+
+    def record_run(self, reactor_id, start, duration, metadata_gets, keyerror):
+        with self._lock:
+            stats = self.stats[reactor_id]
+            stats['runs'] += 1
+            stats['time'] += duration
+            stats['metadata_gets'] += metadata_gets
+            if keyerror:
+                stats['keyerrors'] += 1
+            self.runs.append((reactor_id, get_ident(), start - self._start, duration))
+
+    def record_change(self, reactor_id, triggered):
+        with self._lock:
+            stats = self.stats[reactor_id]
+            stats['changes'] += 1
+            stats['triggered'] += triggered
+
+    def sorted_stats(self):
+        """
+        Returns (reactor ID, counters) tuples, most expensive first.
+        """
+        return sorted(
+            self.stats.items(),
+            key=lambda reactor_stats: (-reactor_stats[1]['time'], reactor_stats[0]),
+        )
+
+    def as_dict(self):
+        return {
+            'reactors': [
+                dict(node=reactor_id[0], reactor=reactor_id[1], **stats)
+                for reactor_id, stats in self.sorted_stats()
+            ],
+        }
+
+    def as_chrome_trace(self):
+        """
+        Returns the individual reactor runs in Chrome's Trace Event
+        Format, which can also be loaded into speedscope.
+        """
+        thread_ids = {}
+        events = []
+        for reactor_id, thread_ident, start, duration in self.runs:
+            events.append({
+                'cat': "reactor",
+                'dur': round(duration * 1000000),
+                'name': "{} {}".format(*reactor_id),
+                'ph': "X",
+                'pid': 1,
+                'tid': thread_ids.setdefault(thread_ident, len(thread_ids) + 1),
+                'ts': round(start * 1000000),
+            })
+        return {
+            'displayTimeUnit': "ms",
+            'traceEvents': events,
+        }
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            dump(self.as_dict(), f, indent=4)
+
+    def dump_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            dump(self.as_chrome_trace(), f)
+
+    def table(self):
+        rows = [
+            [
+                bold(_("node")),
+                bold(_("reactor")),
+                bold(_("time")),
+                bold(_("runs")),
+                bold(_("changes")),
+                bold(_("KeyErrors")),
+                bold(_("gets")),
+                bold(_("triggered")),
+            ],
+            ROW_SEPARATOR,
+        ]
+        for reactor_id, stats in self.sorted_stats():
+            rows.append([
+                reactor_id[0],
+                reactor_id[1],
+                "{:.3f}s".format(stats['time']),
+                str(stats['runs']),
+                str(stats['changes']),
+                str(stats['keyerrors']),
+                str(stats['metadata_gets']),
+                str(stats['triggered']),
+            ])
+        return render_table(rows, alignments={i: 'right' for i in range(2, 8)})
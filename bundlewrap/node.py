@@ -5,12 +5,10 @@ from os import environ, mkdir, rename
 from os.path import dirname, exists, join
 from threading import Lock
 
-from tomlkit import dumps as toml_dump, parse as toml_parse
-
 from . import operations
 from .bundle import Bundle
 from .concurrency import WorkerPool
-from .deps import find_item, ItemDependencyLoop
+from .deps import find_item, ItemDependencyLoop, ItemIndex
 from .exceptions import (
     BundleError,
     GracefulApplyException,
@@ -25,7 +23,7 @@ from .exceptions import (
 )
 from .group import GROUP_ATTR_DEFAULTS, GROUP_ATTR_TYPES, GROUP_ATTR_TYPES_ENFORCED
 from .itemqueue import ItemQueue
-from .items import Item
+from .items import clear_node_caches, Item, ItemRun
 from .lock import NodeLock
 from .metadata import hash_metadata
 from .utils import (
@@ -40,11 +38,13 @@ from .utils.dicts import (
     dict_to_toml,
     diff_dict,
     hash_statedict,
+    LazyDict,
     set_key_at_path,
     normalize_dict,
     validate_dict,
     COLLECTION_OF_STRINGS,
 )
+from .utils.remote import PATH_ITEM_TYPES, prefetch_path_info
 from .utils.text import (
     blue,
     bold,
@@ -168,6 +168,50 @@ def handle_apply_result(
             io.stdout(formatted_result)
 
 
+def _prefetch_path_info(node, items, autoskip_selector, autoonly_selector):
+    """
+    Looks at all paths managed by the given items at once instead of
+    one remote command (or more) per item.
+    """
+    if node.os not in node.OS_FAMILY_UNIX:
+        return
+    paths = set()
+    hash_paths = set()
+    for item in items:
+        if (
+            item.ITEM_TYPE_NAME in PATH_ITEM_TYPES and
+            not item.skip and
+            not item.triggered and
+            item.covered_by_autoonly_selector(autoonly_selector) and
+            not item.covered_by_autoskip_selector(autoskip_selector)
+        ):
+            paths.add(item.name)
+            if item.ITEM_TYPE_NAME == "file" and item.remote_hash_needed:
+                hash_paths.add(item.name)
+    if not paths:
+        return
+    try:
+        prefetch_path_info(node, paths, hash_paths=hash_paths)
+    except (RemoteException, TransportException) as exc:
+        io.debug(f"unable to prefetch path info on {node.name}: {exc}")
+
+
+def _prefetch_downloads(items, autoskip_selector, autoonly_selector):
+    """
+    Starts downloading files for file items right away instead of
+    waiting until we get to them.
+    """
+    for item in items:
+        if (
+            item.ITEM_TYPE_NAME == "file" and
+            not item.skip and
+            not item.triggered and
+            item.covered_by_autoonly_selector(autoonly_selector) and
+            not item.covered_by_autoskip_selector(autoskip_selector)
+        ):
+            item.prefetch_download()
+
+
 def apply_items(
     node,
     autoskip_selector="",
@@ -177,14 +221,34 @@ def apply_items(
     workers=1,
     interactive=False,
     show_diff=True,
+    scheduler=None,
 ):
     item_queue = ItemQueue(node)
+    _prefetch_downloads(node.items, autoskip_selector, autoonly_selector)
+    clear_node_caches(node)
+    _prefetch_path_info(node, node.items, autoskip_selector, autoonly_selector)
     # the item queue might contain new generated items (canned actions)
     # adjust progress total accordingly
     extra_items = len(item_queue.all_items) - len(node.items)
     io.progress_increase_total(increment=extra_items)
 
+    # only item types that actually occur on this node can have
+    # cached anything
+    item_types = {type(item) for item in item_queue.all_items}
+
     results = []
+    apply_kwargs = {
+        'autoskip_selector': autoskip_selector,
+        'autoonly_selector': autoonly_selector,
+        'my_soft_locks': my_soft_locks,
+        'other_peoples_soft_locks': other_peoples_soft_locks,
+        'interactive': interactive,
+        'show_diff': show_diff,
+    }
+
+    def forget_node_state(changed_item):
+        for item_type in item_types:
+            item_type.forget_node_state(node, changed_item)
 
     def tasks_available():
         return bool(item_queue.items_without_deps)
@@ -194,14 +258,7 @@ def apply_items(
         return {
             'task_id': "{}:{}".format(node.name, item.id),
             'target': item.apply,
-            'kwargs': {
-                'autoskip_selector': autoskip_selector,
-                'autoonly_selector': autoonly_selector,
-                'my_soft_locks': my_soft_locks,
-                'other_peoples_soft_locks': other_peoples_soft_locks,
-                'interactive': interactive,
-                'show_diff': show_diff,
-            },
+            'kwargs': apply_kwargs,
         }
 
     def handle_result(task_id, return_value, duration):
@@ -210,6 +267,9 @@ def apply_items(
 
         status_code, details, created, deleted = return_value
 
+        if status_code not in (Item.STATUS_OK, Item.STATUS_SKIPPED):
+            forget_node_state(item)
+
         if status_code == Item.STATUS_FAILED:
             for skipped_item in item_queue.item_failed(item):
                 handle_apply_result(
@@ -264,6 +324,7 @@ def apply_items(
     def handle_exception(task_id, exc, traceback):
         item_id = task_id.split(":", 1)[1]
         item = find_item(item_id, item_queue.pending_items)
+        forget_node_state(item)
 
         for skipped_item in item_queue.item_failed(item):
             handle_apply_result(
@@ -297,8 +358,10 @@ def apply_items(
         handle_exception=handle_exception,
         pool_id="apply_{}".format(node.name),
         workers=workers,
+        scheduler=scheduler,
     )
-    worker_pool.run()
+    with ItemRun(node, item_queue, apply_kwargs):
+        worker_pool.run()
 
     # we have no items without deps left and none are processing
     # there must be a loop
@@ -313,43 +376,10 @@ def _flatten_group_hierarchy(groups):
     Takes a list of groups and returns a list of group names ordered so
     that parent groups will appear before any of their subgroups.
     """
-    # dict mapping groups to subgroups
-    child_groups = {}
-    for group in groups:
-        child_groups[group.name] = list(names(group.subgroups))
-
-    # dict mapping groups to parent groups
-    parent_groups = {}
-    for child_group in child_groups:
-        parent_groups[child_group] = []
-        for parent_group, subgroups in child_groups.items():
-            if child_group in subgroups:
-                parent_groups[child_group].append(parent_group)
-
-    order = []
-
-    while True:
-        top_level_group = None
-        for group, parents in parent_groups.items():
-            if parents:
-                continue
-            else:
-                top_level_group = group
-                break
-        if not top_level_group:
-            if parent_groups:
-                raise RuntimeError(
-                    _("encountered subgroup loop that should have been detected")
-                )
-            else:
-                break
-        order.append(top_level_group)
-        del parent_groups[top_level_group]
-        for group in parent_groups:
-            if top_level_group in parent_groups[group]:
-                parent_groups[group].remove(top_level_group)
-
-    return order
+    groups = list(groups)
+    if not groups:
+        return []
+    return groups[0].repo._group_membership.order(groups)
 
 
 def format_item_command_results(results):
@@ -521,24 +551,31 @@ class Node:
         if not validate_name(name):
             raise RepositoryError(_("'{}' is not a valid node name").format(name))
 
-        with error_context(node_name=name):
-            validate_dict(attributes, NODE_ATTR_TYPES)
-
-        attributes = normalize_dict(attributes, GROUP_ATTR_TYPES_ENFORCED)
-
         self._add_host_keys = environ.get('BW_ADD_HOST_KEYS', False) == "1"
-        self._attributes = attributes
         self._dynamic_attribute_cache = {}
+        # see bundlewrap.items.node_cache()
+        self._item_caches = {}
+        self._item_caches_lock = Lock()
+        self._item_run = None
         self._ssh_conn_established = False
         self._ssh_first_conn_lock = Lock()
-        self.file_path = attributes.get('file_path')
-        self.hostname = attributes.get('hostname', name)
         self.name = name
 
-        for attr in GROUP_ATTR_DEFAULTS:
-            setattr(self, "_{}".format(attr), attributes.get(attr))
+        if isinstance(attributes, LazyDict) and not attributes.loaded:
+            # attributes from TOML files are only parsed once they're
+            # actually needed, see __getattr__()
+            self._lazy_attributes = attributes
+            self._lazy_attributes_lock = Lock()
+        else:
+            self._set_attributes(attributes)
 
     def __getattr__(self, name):
+        if '_lazy_attributes' in self.__dict__:
+            with self._lazy_attributes_lock:
+                if '_lazy_attributes' in self.__dict__:
+                    self._set_attributes(self._lazy_attributes)
+                    del self._lazy_attributes
+            return getattr(self, name)
         with suppress(KeyError):
             return self._dynamic_attribute_cache[name]
         try:
@@ -551,6 +588,19 @@ class Node:
             self._dynamic_attribute_cache[name] = value
             return value
 
+    def _set_attributes(self, attributes):
+        with error_context(node_name=self.name):
+            validate_dict(attributes, NODE_ATTR_TYPES)
+
+        attributes = normalize_dict(attributes, GROUP_ATTR_TYPES_ENFORCED)
+
+        self._attributes = attributes
+        self.file_path = attributes.get('file_path')
+        self.hostname = attributes.get('hostname', self.name)
+
+        for attr in GROUP_ATTR_DEFAULTS:
+            setattr(self, "_{}".format(attr), attributes.get(attr))
+
     def __lt__(self, other):
         return self.name < other.name
 
@@ -606,37 +656,20 @@ class Node:
 
     @property
     def immediate_groups(self):
-        result = set()
-        for group_name in self._attributes.get('groups', set()):
-            try:
-                result.add(self.repo.get_group(group_name))
-            except NoSuchGroup:
-                raise RepositoryError(_(
-                    "Node '{node}' has '{group}' listed as a group, "
-                    "but no such group could be found."
-                ).format(
-                    node=self.name,
-                    group=group_name,
-                ))
-        for group in self.repo.groups:
-            if group in result:
-                continue
-            elif self in group._nodes_from_members:
-                result.add(self.repo.get_group(group.name))
-            else:
-                for pattern in group._member_patterns:
-                    if pattern.search(self.name) is not None:
-                        result.add(self.repo.get_group(group.name))
-        return result
+        return set(self.repo._group_membership.node_immediate_groups(self))
 
     @cached_property_set
     @io.job_wrapper(_("{}  determining groups").format(bold("{0.name}")))
     def groups(self):
-        for group in self.immediate_groups:
-            yield group
-            for parent_group in group.parent_groups:
-                # these are not just the *immediate* parent groups
-                yield parent_group
+        return self.repo._group_membership.node_groups(self)
+
+    @cached_property
+    def _group_attributes(self):
+        """
+        All attributes this node inherits from its groups, see
+        GroupMembership.attributes().
+        """
+        return self.repo._group_membership.attributes(self.groups)
 
     def has_any_bundle(self, bundle_list):
         for bundle_name in bundle_list:
@@ -660,10 +693,11 @@ class Node:
         return False
 
     def in_group(self, group_name):
-        for group in self.groups:
-            if group.name == group_name:
-                return True
-        return False
+        try:
+            group = self.repo.get_group(group_name)
+        except NoSuchGroup:
+            return False
+        return group in self.groups
 
     @cached_property_set
     def items(self):
@@ -683,6 +717,10 @@ class Node:
                         items[item.id] = item
         return items.values()
 
+    @cached_property
+    def _item_index(self):
+        return ItemIndex(self.items)
+
     @cached_property
     def magic_number(self):
         return int(md5(self.name.encode('UTF-8')).hexdigest(), 16)
@@ -714,6 +752,7 @@ class Node:
         show_diff=True,
         skip_list=(),
         workers=4,
+        scheduler=None,
     ):
         if not list(self.items):
             io.stdout(_("{x} {node}  has no items").format(
@@ -774,6 +813,7 @@ class Node:
                         workers=workers,
                         interactive=interactive,
                         show_diff=show_diff,
+                        scheduler=scheduler,
                     )
             except NodeLockedException as e:
                 if not interactive:
@@ -826,7 +866,7 @@ class Node:
         )
 
     def get_item(self, item_id):
-        return find_item(item_id, self.items)
+        return find_item(item_id, self._item_index)
 
     @property
     def metadata(self):
@@ -938,6 +978,15 @@ class Node:
             *command,
         )
 
+    def run_routeros_pipelined(self, *commands):
+        assert self.os == 'routeros'
+        return operations.run_routeros_pipelined(
+            self.hostname,
+            self.username,
+            self.password,
+            commands,
+        )
+
     @property
     def is_toml(self):
         return self.file_path and self.file_path.endswith(".toml")
@@ -946,6 +995,8 @@ class Node:
     def toml(self):
         if not self.is_toml:
             raise ValueError(_("node {} not in TOML format").format(self.name))
+        from tomlkit import parse as toml_parse  # slow import, only needed here
+
         return toml_parse(get_file_contents(self.file_path))
 
     def toml_save(self):
@@ -958,6 +1009,8 @@ class Node:
             self.file_path = join(self.repo.path, "nodes", self.name + ".toml")
         if not exists(join(self.repo.path, "nodes")):
             mkdir(join(self.repo.path, "nodes"))
+        from tomlkit import dumps as toml_dump
+
         with open(self.file_path, 'w') as f:
             f.write(toml_clean(toml_dump(toml_doc)))
 
@@ -982,6 +1035,18 @@ class Node:
             wrapper_outer=self.cmd_wrapper_outer,
         )
 
+    def upload_multiple(self, uploads, may_fail=False):
+        assert self.os in self.OS_FAMILY_UNIX
+        return operations.upload_multiple(
+            self.hostname,
+            uploads,
+            add_host_keys=self._add_host_keys,
+            ignore_failure=may_fail,
+            username=self.username,
+            wrapper_inner=self.cmd_wrapper_inner,
+            wrapper_outer=self.cmd_wrapper_outer,
+        )
+
     def verify(
         self,
         autoskip_selector=(),
@@ -1019,15 +1084,10 @@ def build_attr_property(attr, default):
     def method(self):
         attr_source = None
         attr_value = None
-        group_order = [
-            self.repo.get_group(group_name)
-            for group_name in _flatten_group_hierarchy(self.groups)
-        ]
 
-        for group in group_order:
-            if getattr(group, attr) is not None:
-                attr_source = "group:{}".format(group.name)
-                attr_value = getattr(group, attr)
+        if attr in self._group_attributes:
+            attr_value, group_name = self._group_attributes[attr]
+            attr_source = "group:{}".format(group_name)
 
         if getattr(self, "_{}".format(attr)) is not None:
             attr_source = "node"
@@ -1079,6 +1139,9 @@ def verify_items(
             io.progress_advance()
         return [None for item in items]
 
+    clear_node_caches(node)
+    _prefetch_path_info(node, items, autoskip_selector, autoonly_selector)
+
     def tasks_available():
         return bool(items)
 
@@ -1194,4 +1257,5 @@ def verify_items(
         pool_id="verify_{}".format(node.name),
         workers=workers,
     )
-    return worker_pool.run()
+    with ItemRun(node, None, {}):
+        return worker_pool.run()
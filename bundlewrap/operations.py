@@ -1,25 +1,34 @@
-from contextlib import suppress
+from atexit import register as at_exit
+from contextlib import contextmanager, suppress
 from datetime import datetime
 from fcntl import fcntl, F_GETFL, F_SETFL
 from shlex import quote
 from select import poll, POLLIN, POLLOUT, POLLERR, POLLHUP
 from shlex import split
-from subprocess import Popen
+from subprocess import PIPE, Popen
 from sys import version_info
-from threading import Lock
-from os import close, environ, pipe, read, setpgrp, write, O_NONBLOCK
+from tempfile import TemporaryFile
+from threading import Lock, Thread
+from os import close, environ, fdopen, fstat, pipe, read, setpgrp, write, O_NONBLOCK
+from os.path import dirname, isabs, join
+from tarfile import open as tarfile_open, TarInfo
 
 from .exceptions import RemoteException, TransportException
 from .utils import cached_property
 from .utils.text import force_text, LineBuffer, mark_for_translation as _, randstr
 from .utils.ui import io
 
-from librouteros import connect
-
 
 ROUTEROS_CONNECTIONS = {}
 ROUTEROS_CONNECTIONS_LOCK = Lock()
 
+SSH_SESSIONS = {}
+SSH_SESSIONS_LOCK = Lock()
+# data_stdin is transferred as octal escapes through the session, so
+# we only do this for small payloads and fork a dedicated SSH process
+# for anything bigger
+SSH_SESSION_MAX_STDIN = 256 * 1024
+
 
 def download(
     hostname,
@@ -113,6 +122,9 @@ def run_local(
 ):
     """
     Runs a command on the local system.
+
+    data_stdin can be bytes or a file object to read from directly,
+    such as an open file or the read end of a pipe.
     """
     # LineBuffer objects take care of always printing complete lines
     # which have been properly terminated by a newline. This is only
@@ -145,10 +157,18 @@ def run_local(
     # if we do not send data to the child. Otherwise, SSH can steal user
     # input.
     stdin_fd_r, stdin_fd_w = pipe()
+    child_stdin = stdin_fd_r
     if data_stdin is None:
         data_stdin = b''
         close_after_fork += [stdin_fd_r, stdin_fd_w]
+    elif hasattr(data_stdin, 'fileno'):
+        # the child reads the file (or pipe) directly, so its content
+        # never has to fit into memory
+        child_stdin = data_stdin.fileno()
+        close_after_fork += [stdin_fd_r, stdin_fd_w]
     else:
+        # slicing a memoryview doesn't copy the remaining data
+        data_stdin = memoryview(data_stdin)
         poller.register(stdin_fd_w, POLLOUT)
         close_after_fork += [stdin_fd_r]
 
@@ -176,7 +196,7 @@ def run_local(
             command,
             preexec_fn=setpgrp,
             shell=shell,
-            stdin=stdin_fd_r,
+            stdin=child_stdin,
             stderr=stderr_fd_w,
             stdout=stdout_fd_w,
         )
@@ -185,7 +205,7 @@ def run_local(
             command,
             process_group=0,
             shell=shell,
-            stdin=stdin_fd_r,
+            stdin=child_stdin,
             stderr=stderr_fd_w,
             stdout=stdout_fd_w,
         )
@@ -285,6 +305,249 @@ def run_local(
     return result
 
 
+def _ssh_command(hostname, add_host_keys=False, username=None):
+    ssh_command = [
+        "ssh",
+        "-o", "BatchMode=yes",
+        "-o", "KbdInteractiveAuthentication=no",
+        "-o", "PasswordAuthentication=no",
+        "-o", "StrictHostKeyChecking=no" if add_host_keys else "StrictHostKeyChecking=yes",
+    ]
+    if username:
+        ssh_command += ["-l", str(username)]
+    extra_args = environ.get("BW_SSH_ARGS", "").strip()
+    if extra_args:
+        ssh_command.extend(split(extra_args))
+    ssh_command.append(hostname)
+    return ssh_command
+
+
+def _octal_escape(data):
+    return "".join("\\{:03o}".format(byte) for byte in data)
+
+
+class SSHSession:
+    """
+    A long-lived shell on a remote host. Commands are written to the
+    shell's stdin one at a time. Their output is captured in temporary
+    files on the remote end and sent back as a single frame:
+
+        BW_FRAME <id> <return code> <stdout length> <stderr length>
+        <stdout><stderr>
+
+    This saves us from forking and authenticating a new SSH process
+    for every single command.
+    """
+    def __init__(self, command):
+        self.command = command
+        self.broken = False
+        self._process = None
+        self._stderr = None
+
+    def __repr__(self):
+        return "<SSHSession {}>".format(" ".join(self.command))
+
+    def close(self):
+        if self._process is None:
+            return
+        with suppress(ValueError, OSError):
+            self._process.stdin.close()
+        self._process.wait()
+        with suppress(ValueError):
+            io._child_pids.remove(self._process.pid)
+        self._stderr.close()
+        self._process = None
+
+    def _read_exactly(self, length):
+        data = self._process.stdout.read(length)
+        if len(data) != length:
+            raise TransportException(_(
+                "SSH session {session} terminated unexpectedly: {stderr}"
+            ).format(
+                session=self,
+                stderr=self._stderr_text(),
+            ))
+        return data
+
+    def _stderr_text(self):
+        self._stderr.seek(0)
+        return force_text(self._stderr.read()).strip()
+
+    def _write(self, script):
+        try:
+            self._process.stdin.write(script.encode('utf-8'))
+            self._process.stdin.flush()
+        except (OSError, ValueError):
+            raise TransportException(_(
+                "SSH session {session} terminated unexpectedly: {stderr}"
+            ).format(
+                session=self,
+                stderr=self._stderr_text(),
+            ))
+
+    def run(self, shell_command, data_stdin=None):
+        """
+        Runs the given command in the remote shell and returns a
+        RunResult. Raises TransportException if the session died, in
+        which case the session must not be used again.
+
+        Returns None if the session was already dead before the command
+        could be sent (e.g. because sshd closed the connection while the
+        session was idle). The command has not been run in that case and
+        the session must not be used again either.
+        """
+        cmd_id = randstr(length=8)
+        io.debug("running command with ID {} in {}: {}".format(cmd_id, self, shell_command))
+        start = datetime.utcnow()
+
+        script = ""
+        if data_stdin is None:
+            stdin_path = "/dev/null"
+        else:
+            stdin_path = "\"$bw_d/i\""
+            script += "printf '{}' >{}\n".format(_octal_escape(data_stdin), stdin_path)
+        # Running the command with `sh -c` instead of inlining it
+        # prevents broken quoting or an `exit` from taking down the
+        # whole session.
+        script += (
+            "sh -c {command} <{stdin} >\"$bw_d/o\" 2>\"$bw_d/e\"; bw_rc=$?; "
+            "printf 'BW_FRAME %s %s %s %s\\n' {cmd_id} $bw_rc "
+            "$(wc -c <\"$bw_d/o\") $(wc -c <\"$bw_d/e\"); "
+            "cat \"$bw_d/o\" \"$bw_d/e\"\n"
+        ).format(
+            cmd_id=cmd_id,
+            command=quote(shell_command),
+            stdin=stdin_path,
+        )
+
+        try:
+            self._write(script)
+        except TransportException as exc:
+            # nothing was sent, the caller can still run the command
+            # some other way
+            io.debug(str(exc))
+            self.broken = True
+            return None
+
+        try:
+            header = self._process.stdout.readline().decode('utf-8', 'replace').split()
+            if len(header) != 5 or header[0] != "BW_FRAME" or header[1] != cmd_id:
+                raise TransportException(_(
+                    "SSH session {session} sent garbage while running '{command}': {header}"
+                ).format(
+                    command=shell_command,
+                    header=" ".join(header) or self._stderr_text(),
+                    session=self,
+                ))
+            result = RunResult()
+            result.return_code = int(header[2])
+            result.stdout = self._read_exactly(int(header[3]))
+            result.stderr = self._read_exactly(int(header[4]))
+        except Exception:
+            self.broken = True
+            raise
+        result.duration = datetime.utcnow() - start
+
+        io.debug("command with ID {} finished with return code {}".format(
+            cmd_id,
+            result.return_code,
+        ))
+        return result
+
+    def start(self):
+        """
+        Spawns the remote shell. Returns False if it could not be
+        started.
+        """
+        self._stderr = TemporaryFile()
+        # See run_local() on why we need a new process group.
+        if version_info < (3, 11):
+            popen_kwargs = {'preexec_fn': setpgrp}
+        else:
+            popen_kwargs = {'process_group': 0}
+        self._process = Popen(
+            self.command,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=self._stderr,
+            **popen_kwargs
+        )
+        io._child_pids.append(self._process.pid)
+        try:
+            self._write(
+                "bw_d=$(mktemp -d) || exit 1; "
+                "trap 'rm -rf \"$bw_d\"' EXIT; "
+                "echo BW_SESSION_READY\n"
+            )
+            ready = self._process.stdout.readline()
+        except TransportException:
+            ready = b""
+        if ready.strip() != b"BW_SESSION_READY":
+            io.debug(_("unable to start {session}: {stderr}").format(
+                session=self,
+                stderr=self._stderr_text(),
+            ))
+            self.close()
+            return False
+        io.debug(_("started {session}").format(session=self))
+        return True
+
+
+def _ssh_sessions_enabled():
+    return environ.get("BW_SSH_SESSIONS", "0") == "1"
+
+
+@contextmanager
+def _ssh_session(hostname, add_host_keys=False, username=None):
+    """
+    Yields an idle SSHSession for the given host, starting a new one if
+    necessary. Yields None if no session could be started.
+
+    There can be more than one session per host because multiple
+    items on the same node are handled in parallel.
+    """
+    key = (hostname, add_host_keys, username)
+    new_session = False
+    with SSH_SESSIONS_LOCK:
+        pool = SSH_SESSIONS.setdefault(key, {'failed': False, 'idle': []})
+        if pool['failed']:
+            session = None
+        elif pool['idle']:
+            session = pool['idle'].pop()
+        else:
+            session = SSHSession(
+                _ssh_command(hostname, add_host_keys=add_host_keys, username=username) +
+                ["exec /bin/sh"]
+            )
+            new_session = True
+
+    if new_session:
+        if not session.start():
+            with SSH_SESSIONS_LOCK:
+                # don't try this again, fall back to one SSH process per
+                # command for this host
+                pool['failed'] = True
+            session = None
+
+    try:
+        yield session
+    finally:
+        if session is not None:
+            if session.broken:
+                session.close()
+            else:
+                with SSH_SESSIONS_LOCK:
+                    pool['idle'].append(session)
+
+
+@at_exit
+def close_ssh_sessions():
+    with SSH_SESSIONS_LOCK:
+        for pool in SSH_SESSIONS.values():
+            while pool['idle']:
+                pool['idle'].pop().close()
+
+
 def run(
     hostname,
     command,
@@ -306,26 +569,32 @@ def run(
     """
     shell_command = wrapper_outer.format(quote(wrapper_inner.format(command)), user)
 
-    ssh_command = [
-        "ssh",
-        "-o", "BatchMode=yes",
-        "-o", "KbdInteractiveAuthentication=no",
-        "-o", "PasswordAuthentication=no",
-        "-o", "StrictHostKeyChecking=no" if add_host_keys else "StrictHostKeyChecking=yes",
-    ]
-    if username:
-        ssh_command += ["-l", str(username)]
-    extra_args = environ.get("BW_SSH_ARGS", "").strip()
-    if extra_args:
-        ssh_command.extend(split(extra_args))
-    ssh_command.append(hostname)
-    ssh_command.append(shell_command)
-
-    result = run_local(
-        ssh_command,
-        data_stdin=data_stdin,
-        log_function=log_function,
-    )
+    result = None
+    if (
+        _ssh_sessions_enabled() and
+        # `bw run` wants to see output as it happens
+        log_function is None and
+        (
+            data_stdin is None or
+            # files are streamed by a separate SSH process
+            isinstance(data_stdin, bytes) and len(data_stdin) <= SSH_SESSION_MAX_STDIN
+        )
+    ):
+        with _ssh_session(hostname, add_host_keys=add_host_keys, username=username) as session:
+            if session is not None:
+                result = session.run(shell_command, data_stdin=data_stdin)
+
+    if result is None:
+        # sessions disabled, unavailable or found dead before the
+        # command could be sent
+        ssh_command = _ssh_command(hostname, add_host_keys=add_host_keys, username=username)
+        ssh_command.append(shell_command)
+
+        result = run_local(
+            ssh_command,
+            data_stdin=data_stdin,
+            log_function=log_function,
+        )
 
     if result.return_code < 0:
         error_msg = _(
@@ -364,7 +633,13 @@ def run(
     return result
 
 
-def run_routeros(hostname, username, password, *args):
+@contextmanager
+def _routeros_connection(hostname, username, password):
+    """
+    Yields the librouteros connection to the given host, holding its
+    lock. The connection is reestablished next time if anything goes
+    wrong while it is in use.
+    """
     with ROUTEROS_CONNECTIONS_LOCK:
         try:
             conn_state = ROUTEROS_CONNECTIONS[hostname]
@@ -384,6 +659,8 @@ def run_routeros(hostname, username, password, *args):
                 except Exception as exc:
                     io.debug(f'error closing RouterOS connection to {hostname}: {exc}')
 
+            from librouteros import connect  # slow import, only needed here
+
             try:
                 conn_state['connection'] = connect(
                     # str() to resolve Faults
@@ -398,13 +675,18 @@ def run_routeros(hostname, username, password, *args):
                 conn_state['needs_reconnect'] = False
 
         try:
-            io.debug(f'{hostname}: running routeros command: {repr(args)}')
-            result = tuple(conn_state['connection'].rawCmd(*args))
+            yield conn_state['connection']
         except Exception as e:
             # Connection in unknown state, mark it as broken
             conn_state['needs_reconnect'] = True
             raise RemoteException(str(e)) from e
 
+
+def run_routeros(hostname, username, password, *args):
+    with _routeros_connection(hostname, username, password) as connection:
+        io.debug(f'{hostname}: running routeros command: {repr(args)}')
+        result = tuple(connection.rawCmd(*args))
+
     run_result = RunResult()
     run_result.raw = result
     run_result.stdout = repr(result)
@@ -412,6 +694,119 @@ def run_routeros(hostname, username, password, *args):
     return run_result
 
 
+def run_routeros_pipelined(hostname, username, password, commands):
+    """
+    Sends all of the given commands (each a tuple of command and
+    arguments, like for run_routeros()) before reading any replies and
+    uses API tags to tell the replies apart.
+
+    Returns a RunResult for each command. Unlike run_routeros(), a
+    command that fails does not raise an exception, its result has
+    a return_code of 1 and the error message in stderr instead.
+    """
+    from librouteros.protocol import parse_word  # slow import, only needed here
+
+    replies = {tag: [] for tag in range(len(commands))}
+    errors = {}
+    with _routeros_connection(hostname, username, password) as connection:
+        for tag, command in enumerate(commands):
+            io.debug(f'{hostname}: sending routeros command: {repr(command)}')
+            connection.protocol.writeSentence(*command, f".tag={tag}")
+
+        pending = set(replies)
+        while pending:
+            reply_word, words = connection.protocol.readSentence()
+            tag = None
+            attributes = {}
+            for word in words:
+                if word.startswith(".tag="):
+                    tag = int(word[len(".tag="):])
+                else:
+                    key, value = parse_word(word)
+                    attributes[key] = value
+            if tag not in pending:
+                raise ValueError(f"unexpected reply from RouterOS: {reply_word} {words}")
+            if reply_word == "!trap":
+                errors[tag] = attributes.get('message', repr(attributes))
+            elif reply_word in ("!re", "!done") and attributes:
+                replies[tag].append(attributes)
+            if reply_word == "!done":
+                pending.remove(tag)
+
+    results = []
+    for tag in range(len(commands)):
+        run_result = RunResult()
+        run_result.raw = tuple(replies[tag])
+        run_result.return_code = 1 if tag in errors else 0
+        run_result.stdout = repr(run_result.raw)
+        run_result.stderr = errors.get(tag, "")
+        results.append(run_result)
+    return results
+
+
+# Temporary files are only readable by their owner while we write
+# them. This remembers the mode files would have gotten otherwise, so
+# we can use it for uploads without an explicit mode.
+_SAVE_DEFAULT_MODE = 'default_mode=$(printf %o $((0666 & ~0$(umask))))'
+
+
+def _upload_commands(temp_path, remote_path, group="", mode=None, owner=""):
+    """
+    Returns the commands needed to move an uploaded file from its
+    temporary location into place. Without a mode, the file gets the
+    one saved by _SAVE_DEFAULT_MODE.
+    """
+    commands = []
+    if owner or group:
+        if group:
+            group = ":" + quote(group)
+        commands.append("chown {}{} {}".format(
+            quote(owner),
+            group,
+            quote(temp_path),
+        ))
+    commands.append("chmod {} {}".format(
+        mode or '"$default_mode"',
+        quote(temp_path),
+    ))
+    commands.append("mv -f {} {}".format(
+        quote(temp_path),
+        quote(remote_path),
+    ))
+    return commands
+
+
+def _temp_path(remote_path):
+    # keep the temporary file next to its destination so the final mv
+    # is an atomic rename
+    return join(dirname(remote_path), ".bundlewrap_tmp_" + randstr())
+
+
+def _write_tar(fileobj, members):
+    """
+    Writes a tar stream containing the given (local path, name in
+    archive) pairs to fileobj and closes it. Returns the exception that
+    stopped us, if any.
+    """
+    try:
+        with tarfile_open(fileobj=fileobj, mode='w|') as tar:
+            for local_path, name in members:
+                with open(local_path, 'rb') as f:
+                    tarinfo = TarInfo(name)
+                    tarinfo.mode = 0o600
+                    tarinfo.size = fstat(f.fileno()).st_size
+                    tar.addfile(tarinfo, f)
+    except BrokenPipeError:
+        # the remote end gave up early, its return code will tell why
+        return None
+    except Exception as exc:
+        return exc
+    finally:
+        with suppress(BrokenPipeError):
+            fileobj.close()
+    return None
+
+
 def upload(
     hostname,
     local_path,
@@ -427,88 +822,115 @@ def upload(
 ):
     """
     Upload a file.
+
+    The file content is sent as stdin to a single remote command that
+    writes it to a temporary file only readable by its owner, sets owner
+    and mode and then moves it into place. Fails if the parent directory
+    doesn't exist.
     """
     io.debug(_("uploading {path} -> {host}:{target}").format(
         host=hostname, path=local_path, target=remote_path))
-    temp_filename = ".bundlewrap_tmp_" + randstr()
-
-    scp_hostname = hostname
-    if ':' in hostname:
-        scp_hostname = f"[{hostname}]"
-
-    scp_command = [
-        "scp",
-        "-o", "BatchMode=yes",
-        "-o",
-        "StrictHostKeyChecking=no" if add_host_keys else "StrictHostKeyChecking=yes",
-    ]
-    extra_args = environ.get("BW_SCP_ARGS", environ.get("BW_SSH_ARGS", "")).strip()
-    if extra_args:
-        scp_command.extend(split(extra_args))
-    scp_command.append(local_path)
-    if username:
-        scp_command.append(f"{username}@{scp_hostname}:{temp_filename}")
-    else:
-        scp_command.append(f"{scp_hostname}:{temp_filename}")
-
-    scp_process = run_local(scp_command)
-
-    if scp_process.return_code != 0:
-        if ignore_failure:
-            return False
-        raise RemoteException(_(
-            "Upload to {host} failed for {failed}:\n\n{result}\n\n"
-        ).format(
-            failed=remote_path,
-            host=hostname,
-            result=force_text(scp_process.stdout) + force_text(scp_process.stderr),
-        ))
-
-    if owner or group:
-        if group:
-            group = ":" + quote(group)
+    temp_path = _temp_path(remote_path)
+
+    # nobody else gets to read the file before chmod
+    commands = [_SAVE_DEFAULT_MODE, "umask 077", "cat > {}".format(quote(temp_path))]
+    commands.extend(_upload_commands(temp_path, remote_path, group=group, mode=mode, owner=owner))
+
+    with open(local_path, 'rb') as f:
+        if fstat(f.fileno()).st_size <= SSH_SESSION_MAX_STDIN:
+            # small enough to be sent through an SSH session
+            data_stdin = f.read()
+        else:
+            data_stdin = f
         result = run(
             hostname,
-            "chown {}{} {}".format(
-                quote(owner),
-                group,
-                quote(temp_filename),
+            "{} || {{ rm -f {}; exit 1; }}".format(
+                " && ".join(commands),
+                quote(temp_path),
             ),
             add_host_keys=add_host_keys,
+            data_stdin=data_stdin,
             ignore_failure=ignore_failure,
             username=username,
             wrapper_inner=wrapper_inner,
             wrapper_outer=wrapper_outer,
         )
-        if result.return_code != 0:
-            return False
+    return result.return_code == 0
 
-    if mode:
-        result = run(
-            hostname,
-            "chmod {} {}".format(
-                mode,
-                quote(temp_filename),
-            ),
-            add_host_keys=add_host_keys,
-            ignore_failure=ignore_failure,
-            username=username,
-            wrapper_inner=wrapper_inner,
-            wrapper_outer=wrapper_outer,
-        )
-        if result.return_code != 0:
-            return False
 
-    result = run(
-        hostname,
-        "mv -f {} {}".format(
-            quote(temp_filename),
-            quote(remote_path),
-        ),
-        add_host_keys=add_host_keys,
-        ignore_failure=ignore_failure,
-        username=username,
-        wrapper_inner=wrapper_inner,
-        wrapper_outer=wrapper_outer,
+def upload_multiple(
+    hostname,
+    uploads,
+    add_host_keys=False,
+    ignore_failure=False,
+    username=None,
+    wrapper_inner="{}",
+    wrapper_outer="{}",
+):
+    """
+    Upload many files at once.
+
+    uploads is a list of dicts with the keys 'local_path' and
+    'remote_path' (which must be absolute) and optionally 'group',
+    'mode' and 'owner' as accepted by upload().
+
+    All files are streamed as a single tar archive to one remote
+    command that extracts them next to their destinations and moves
+    them into place. Just like upload(), this fails if a parent
+    directory doesn't exist. Requires a tar that understands
+    --no-same-owner.
+    """
+    commands = []
+    members = []
+    parent_dirs = set()
+    temp_paths = []
+    for upload_spec in uploads:
+        remote_path = upload_spec['remote_path']
+        assert isabs(remote_path)
+        io.debug(_("uploading {path} -> {host}:{target}").format(
+            host=hostname, path=upload_spec['local_path'], target=remote_path))
+        temp_path = _temp_path(remote_path)
+        temp_paths.append(temp_path)
+        members.append((upload_spec['local_path'], temp_path.lstrip("/")))
+        parent_dirs.add(dirname(remote_path))
+        commands.extend(_upload_commands(
+            temp_path,
+            remote_path,
+            group=upload_spec.get('group', ""),
+            mode=upload_spec.get('mode'),
+            owner=upload_spec.get('owner', ""),
+        ))
+
+    # tar would create missing directories
+    dir_checks = ["test -d {}".format(quote(path)) for path in sorted(parent_dirs)]
+
+    pipe_r, pipe_w = pipe()
+    writer_result = []
+    writer = Thread(
+        target=lambda: writer_result.append(_write_tar(fdopen(pipe_w, 'wb'), members)),
+        daemon=True,
     )
+    writer.start()
+    try:
+        with fdopen(pipe_r, 'rb') as tar_stream:
+            result = run(
+                hostname,
+                "{} && tar -xf - --no-same-owner -C / && {} || {{ rm -f {}; exit 1; }}".format(
+                    " && ".join([_SAVE_DEFAULT_MODE] + dir_checks),
+                    " && ".join(commands),
+                    " ".join(quote(temp_path) for temp_path in temp_paths),
+                ),
+                add_host_keys=add_host_keys,
+                data_stdin=tar_stream,
+                ignore_failure=ignore_failure,
+                username=username,
+                wrapper_inner=wrapper_inner,
+                wrapper_outer=wrapper_outer,
+            )
+    finally:
+        # closing the read end unblocks the writer if the remote
+        # command didn't read everything
+        writer.join()
+    if writer_result and writer_result[0] is not None:
+        raise writer_result[0]
     return result.return_code == 0
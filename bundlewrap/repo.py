@@ -1,10 +1,10 @@
 from contextlib import suppress
+from functools import partial
 from importlib.util import module_from_spec, spec_from_file_location
 from inspect import isabstract
-from os import listdir, mkdir, walk
+from os import environ, listdir, mkdir, walk
 from os.path import abspath, dirname, isdir, isfile, join
-
-from pkg_resources import DistributionNotFound, require, VersionConflict  # needs setuptools
+from threading import Lock
 try:
     from tomllib import loads as toml_load
 except ImportError:
@@ -12,6 +12,7 @@ except ImportError:
 
 from . import items, VERSION_STRING
 from .bundle import FILENAME_ITEMS
+from .codecache import CodeCache
 from .exceptions import (
     NoSuchGroup,
     NoSuchNode,
@@ -19,10 +20,12 @@ from .exceptions import (
     MissingRepoDependency,
     RepositoryError,
 )
-from .group import Group
+from .group import Group, GroupMembership
+from .metacache import make_cache_dir, MetadataCache
 from .metagen import MetadataGenerator
 from .node import Node, NODE_ATTRS
 from .secrets import FILENAME_SECRETS, generate_initial_secrets_cfg, SecretProxy
+from .templatecache import DIRNAME_TEMPLATE_CACHE
 from .utils import (
     cached_property,
     error_context,
@@ -30,7 +33,7 @@ from .utils import (
     names,
 )
 from .utils.scm import get_git_branch, get_git_clean, get_rev
-from .utils.dicts import hash_statedict
+from .utils.dicts import hash_statedict, LazyDict
 from .utils.text import bold, mark_for_translation as _, red, validate_name
 from .utils.ui import io
 
@@ -98,6 +101,53 @@ nodes = {
 }
 
 
+def _load_toml_file(filepath):
+    with error_context(filepath=filepath):
+        infodict = toml_load(get_file_contents(filepath).decode())
+    infodict['file_path'] = filepath
+    return infodict
+
+
+def check_requirements(lines):
+    """
+    Raises MissingRepoDependency unless all of the given
+    requirements.txt lines are satisfied by installed packages.
+    """
+    # slow to import and only needed if there is a requirements.txt
+    from importlib.metadata import PackageNotFoundError, version as package_version
+    from packaging.requirements import Requirement
+
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        req = Requirement(line)
+        if req.marker is not None and not req.marker.evaluate():
+            continue
+        try:
+            installed_version = package_version(req.name)
+        except PackageNotFoundError:
+            raise MissingRepoDependency(_(
+                "{x} Python package '{pkg}' is listed in {filename}, but wasn't found. "
+                "You probably have to install it with `pip install {pkg}`."
+            ).format(
+                filename=FILENAME_REQUIREMENTS,
+                pkg=line,
+                x=red("!"),
+            ))
+        if not req.specifier.contains(installed_version, prereleases=True):
+            raise MissingRepoDependency(_(
+                "{x} Python package '{required}' is listed in {filename}, "
+                "but only '{existing}' was found. "
+                "You probably have to upgrade it with `pip install {required}`."
+            ).format(
+                existing=f"{req.name} {installed_version}",
+                filename=FILENAME_REQUIREMENTS,
+                required=line,
+                x=red("!"),
+            ))
+
+
 class HooksProxy:
     def __init__(self, repo, path):
         self.repo = repo
@@ -201,14 +251,21 @@ class Repository(MetadataGenerator):
         self.group_dict = {}
         self.node_dict = {}
         self.node_attribute_functions = {}
+        self._code_cache = None
+        self._template_cache_dir = None
         self._get_all_attr_code_cache = {}
         self._get_all_attr_result_cache = {}
 
+        self.item_attribute_names = []
+        self._item_classes = {}
+        self._item_class_files = {}
+        self._item_class_lock = Lock()
+
         with io.job("Loading repository"):
             if repo_path is not None:
                 self.populate_from_path(self.path)
             else:
-                self.item_classes = list(self.items_from_dir(items.__path__[0]))
+                self._register_item_classes()
 
     def __eq__(self, other):
         if self.path == "/dev/null":
@@ -236,28 +293,30 @@ class Repository(MetadataGenerator):
         """
         Adds the given group object to this repo.
         """
-        if group.name in names(self.nodes):
+        if group.name in self.node_dict:
             raise RepositoryError(_("you cannot have a node and a group "
                                     "both named '{}'").format(group.name))
-        if group.name in names(self.groups):
+        if group.name in self.group_dict:
             raise RepositoryError(_("you cannot have two groups "
                                     "both named '{}'").format(group.name))
         group.repo = self
         self.group_dict[group.name] = group
+        self._forget_group_membership()
 
     def add_node(self, node):
         """
         Adds the given node object to this repo.
         """
-        if node.name in names(self.groups):
+        if node.name in self.group_dict:
             raise RepositoryError(_("you cannot have a node and a group "
                                     "both named '{}'").format(node.name))
-        if node.name in names(self.nodes):
+        if node.name in self.node_dict:
             raise RepositoryError(_("you cannot have two nodes "
                                     "both named '{}'").format(node.name))
 
         node.repo = self
         self.node_dict[node.name] = node
+        self._forget_group_membership()
 
     @cached_property
     def branch(self):
@@ -326,10 +385,13 @@ class Repository(MetadataGenerator):
             return self._get_all_attr_result_cache[path]
 
         if path not in self._get_all_attr_code_cache:
-            source = get_file_contents(path)
-            with error_context(path=path):
-                self._get_all_attr_code_cache[path] = \
-                    compile(source, path, mode='exec')
+            if self._code_cache is not None:
+                self._get_all_attr_code_cache[path] = self._code_cache.compile(path)
+            else:
+                source = get_file_contents(path)
+                with error_context(path=path):
+                    self._get_all_attr_code_cache[path] = \
+                        compile(source, path, mode='exec')
 
         code = self._get_all_attr_code_cache[path]
         env = base_env.copy()
@@ -371,14 +433,22 @@ class Repository(MetadataGenerator):
                 p=path,
             ))
         for name, infodict in flat_dict.items():
-            infodict.setdefault('file_path', path)
+            if not isinstance(infodict, LazyDict) or infodict.loaded:
+                # unloaded TOML nodes will bring their own file_path
+                infodict.setdefault('file_path', path)
             yield (name, infodict)
 
-    def nodes_or_groups_from_dir(self, directory):
+    def nodes_or_groups_from_dir(self, directory, lazy=False):
+        """
+        Returns a dict mapping names to the attributes found in TOML
+        files in the given directory. With lazy=True, each file is only
+        parsed once its attributes are first accessed.
+        """
         path = join(self.path, directory)
         if not isdir(path):
             return
         result = {}
+        file_paths = {}
         for root_dir, _dirs, files in walk(path):
             for filename in files:
                 filepath = join(root_dir, filename)
@@ -387,20 +457,62 @@ class Repository(MetadataGenerator):
                         filename.startswith("_"):
                     continue
                 entity_name = filename[:-5]
-                if entity_name in result:
+                if entity_name in file_paths:
                     raise RepositoryError(_(
                         "Duplicate definition of {entity_name} in {file1} and {file2}"
                     ).format(
                         entity_name=entity_name,
                         file1=filepath,
-                        file2=result[entity_name]['file_path'],
+                        file2=file_paths[entity_name],
                     ))
-                with error_context(filepath=filepath):
-                    infodict = toml_load(get_file_contents(filepath).decode())
-                infodict['file_path'] = filepath
-                result[entity_name] = infodict
+                file_paths[entity_name] = filepath
+                if lazy:
+                    result[entity_name] = LazyDict(partial(_load_toml_file, filepath))
+                else:
+                    result[entity_name] = _load_toml_file(filepath)
         return result
 
+    @property
+    def item_classes(self):
+        """
+        All item classes available in this repo. This has to load every
+        single item type, use item_class() if you can.
+        """
+        return [
+            self.item_class(attribute_name)
+            for attribute_name in self.item_attribute_names
+        ]
+
+    def item_class(self, attribute_name):
+        """
+        Returns the Item subclass for the given bundle attribute name.
+        Builtin item types are loaded when they are first requested.
+
+        Raises KeyError for unknown attribute names.
+        """
+        with suppress(KeyError):
+            return self._item_classes[attribute_name]
+        with self._item_class_lock:
+            if attribute_name not in self._item_classes:
+                filepath = self._item_class_files[attribute_name]
+                io.debug(f"loading item types from {filepath}")
+                for item_class in self.items_from_file(filepath):
+                    self._item_classes.setdefault(item_class.BUNDLE_ATTRIBUTE_NAME, item_class)
+            return self._item_classes[attribute_name]
+
+    def _register_item_classes(self):
+        self._item_classes = {}
+        self._item_class_files = {
+            attribute_name: join(items.__path__[0], filename)
+            for attribute_name, filename in items.BUILTIN_ITEM_TYPES.items()
+        }
+        # custom item types are always loaded since we can't know
+        # their attribute names otherwise
+        for item_class in self.items_from_dir(self.items_dir):
+            if item_class.BUNDLE_ATTRIBUTE_NAME not in self._item_class_files:
+                self._item_classes.setdefault(item_class.BUNDLE_ATTRIBUTE_NAME, item_class)
+        self.item_attribute_names = list(self._item_class_files) + list(self._item_classes)
+
     def items_from_dir(self, path):
         """
         Looks for Item subclasses in the given path.
@@ -419,12 +531,18 @@ class Repository(MetadataGenerator):
                         not isfile(filepath) or \
                         filename.startswith("_"):
                     continue
-                for name, obj in self.get_all_attrs_from_file(filepath).items():
-                    if obj == items.Item or name.startswith("_"):
-                        continue
-                    with suppress(TypeError):
-                        if issubclass(obj, items.Item) and not isabstract(obj):
-                            yield obj
+                yield from self.items_from_file(filepath)
+
+    def items_from_file(self, filepath):
+        """
+        Looks for Item subclasses in the given file.
+        """
+        for name, obj in self.get_all_attrs_from_file(filepath).items():
+            if obj == items.Item or name.startswith("_"):
+                continue
+            with suppress(TypeError):
+                if issubclass(obj, items.Item) and not isabstract(obj):
+                    yield obj
 
     def _discover_root_path(self, path):
         while True:
@@ -437,6 +555,14 @@ class Repository(MetadataGenerator):
 
             path = previous_component
 
+    @cached_property
+    def _group_membership(self):
+        return GroupMembership(self)
+
+    def _forget_group_membership(self):
+        with suppress(AttributeError, KeyError):
+            del self._cache['_group_membership']
+
     def get_group(self, group_name):
         try:
             return self.group_dict[group_name]
@@ -517,31 +643,19 @@ class Repository(MetadataGenerator):
         except Exception:
             pass
         else:
-            try:
-                require(lines)
-            except DistributionNotFound as exc:
-                raise MissingRepoDependency(_(
-                    "{x} Python package '{pkg}' is listed in {filename}, but wasn't found. "
-                    "You probably have to install it with `pip install {pkg}`."
-                ).format(
-                    filename=FILENAME_REQUIREMENTS,
-                    pkg=exc.req,
-                    x=red("!"),
-                ))
-            except VersionConflict as exc:
-                raise MissingRepoDependency(_(
-                    "{x} Python package '{required}' is listed in {filename}, "
-                    "but only '{existing}' was found. "
-                    "You probably have to upgrade it with `pip install {required}`."
-                ).format(
-                    existing=exc.dist,
-                    filename=FILENAME_REQUIREMENTS,
-                    required=exc.req,
-                    x=red("!"),
-                ))
+            check_requirements(lines)
 
         self.vault = SecretProxy(self)
 
+        if environ.get("BW_CODE_CACHE", "0") == "1":
+            self._code_cache = CodeCache(self)
+
+        if environ.get("BW_METADATA_CACHE", "0") == "1":
+            self._metadata_cache = MetadataCache(self)
+
+        if environ.get("BW_TEMPLATE_CACHE", "0") == "1":
+            self._template_cache_dir = make_cache_dir(self.path, DIRNAME_TEMPLATE_CACHE)
+
         # populate bundles
         self.bundle_names = []
         for dir_entry in listdir(self.bundles_dir):
@@ -555,12 +669,10 @@ class Repository(MetadataGenerator):
             self.add_group(Group(*group))
 
         # populate items
-        self.item_classes = list(self.items_from_dir(items.__path__[0]))
-        for item_class in self.items_from_dir(self.items_dir):
-            self.item_classes.append(item_class)
+        self._register_item_classes()
 
         # populate nodes
-        toml_nodes = self.nodes_or_groups_from_dir("nodes")
+        toml_nodes = self.nodes_or_groups_from_dir("nodes", lazy=True)
         self.node_dict = {}
         for node in self.nodes_or_groups_from_file(self.nodes_file, 'nodes', toml_nodes):
             self.add_node(Node(*node))
@@ -7,8 +7,6 @@ from os.path import join
 from string import ascii_letters, punctuation, digits
 from subprocess import PIPE, run
 
-from cryptography.fernet import Fernet
-
 from .exceptions import FaultUnavailable
 from .utils import Fault, get_file_contents
 from .utils.text import force_text, mark_for_translation as _
@@ -31,6 +29,14 @@ def choice_prng(lst, prng):
     return lst[next(prng) % (len(lst) - 1)]
 
 
+def _fernet(key):
+    # cryptography takes a while to import and most invocations of bw
+    # don't need it at all
+    from cryptography.fernet import Fernet
+
+    return Fernet(key)
+
+
 def generate_initial_secrets_cfg():
     return (
         "# DO NOT COMMIT THIS FILE\n"
@@ -65,6 +71,8 @@ class SecretProxy:
         """
         Provided as a helper to generate new keys from `bw debug`.
         """
+        from cryptography.fernet import Fernet
+
         return Fernet.generate_key().decode('utf-8')
 
     def __init__(self, repo):
@@ -79,7 +87,7 @@ class SecretProxy:
             return "decrypted text"
 
         key, cryptotext = self._determine_key_to_use(cryptotext.encode('utf-8'), key, cryptotext)
-        return Fernet(key).decrypt(cryptotext).decode('utf-8')
+        return _fernet(key).decrypt(cryptotext).decode('utf-8')
 
     def _decrypt_file(self, source_path=None, binary=False, key=None):
         """
@@ -92,7 +100,7 @@ class SecretProxy:
         cryptotext = get_file_contents(join(self.repo.data_dir, source_path))
         key, cryptotext = self._determine_key_to_use(cryptotext, key, source_path)
 
-        f = Fernet(key)
+        f = _fernet(key)
         if binary:
             return f.decrypt(cryptotext)
         else:
@@ -109,7 +117,7 @@ class SecretProxy:
         cryptotext = get_file_contents(join(self.repo.data_dir, source_path))
         key, cryptotext = self._determine_key_to_use(cryptotext, key, source_path)
 
-        f = Fernet(key)
+        f = _fernet(key)
         return b64encode(f.decrypt(cryptotext)).decode('utf-8')
 
     def _determine_key_to_use(self, cryptotext, key, entity_description):
@@ -324,7 +332,7 @@ class SecretProxy:
                 key=key,
             ))
 
-        return key_name + '$' + Fernet(key).encrypt(plaintext.encode('utf-8')).decode('utf-8')
+        return key_name + '$' + _fernet(key).encrypt(plaintext.encode('utf-8')).decode('utf-8')
 
     def encrypt_file(self, source_path, target_path, key='encrypt'):
         """
@@ -344,7 +352,7 @@ class SecretProxy:
             ))
 
         plaintext = get_file_contents(source_path)
-        fernet = Fernet(key)
+        fernet = _fernet(key)
         target_file = join(self.repo.data_dir, target_path)
         with open(target_file, 'wb') as f:
             f.write(key_name.encode('utf-8') + b'$')
@@ -0,0 +1,164 @@
+from hashlib import sha1
+from os import makedirs, replace
+from os.path import dirname, join
+from tempfile import mkstemp
+from threading import Lock
+from types import ModuleType
+
+from .utils.ui import io
+
+
+DIRNAME_TEMPLATE_CACHE = "templates"
+
+# Environments, lookups and compiled templates are shared by all items
+# in this process. Lookups and environments are keyed by their search
+# path, compiled templates additionally by a hash of their source.
+_LOCK = Lock()
+_JINJA2_ENVIRONMENTS = {}
+_JINJA2_TEMPLATES = {}
+_MAKO_LOOKUPS = {}
+_MAKO_TEMPLATES = {}
+
+
+def _source_hash(source):
+    return sha1(source.encode('utf-8')).hexdigest()
+
+
+def _jinja2_environment(searchpath, cache_dir):
+    from jinja2 import (  # slow import, only needed here
+        Environment,
+        FileSystemBytecodeCache,
+        FileSystemLoader,
+    )
+
+    key = (searchpath, cache_dir)
+    with _LOCK:
+        if key not in _JINJA2_ENVIRONMENTS:
+            if cache_dir is None:
+                bytecode_cache = None
+            else:
+                makedirs(join(cache_dir, "jinja2"), exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(join(cache_dir, "jinja2"))
+            _JINJA2_ENVIRONMENTS[key] = Environment(
+                bytecode_cache=bytecode_cache,
+                loader=FileSystemLoader(searchpath=list(searchpath)),
+            )
+        return _JINJA2_ENVIRONMENTS[key]
+
+
+def jinja2_template(source, searchpath, cache_dir=None):
+    """
+    Returns a compiled Jinja2 template for the given source, which may
+    include or extend templates from the given search path.
+
+    If cache_dir is given, compiled templates are also stored there
+    and reused by other processes.
+    """
+    searchpath = tuple(searchpath)
+    source_hash = _source_hash(source)
+    key = (searchpath, cache_dir, source_hash)
+    with _LOCK:
+        if key in _JINJA2_TEMPLATES:
+            return _JINJA2_TEMPLATES[key]
+
+    env = _jinja2_environment(searchpath, cache_dir)
+    if env.bytecode_cache is None:
+        template = env.from_string(source)
+    else:
+        # this is what Jinja2 loaders do for templates loaded from
+        # files, but we have the source as a string
+        bucket = env.bytecode_cache.get_bucket(env, source_hash, None, source)
+        if bucket.code is None:
+            io.debug(f"compiling Jinja2 template {source_hash}")
+            bucket.code = env.compile(source)
+            env.bytecode_cache.set_bucket(bucket)
+        template = env.template_class.from_code(env, bucket.code, env.make_globals(None))
+
+    with _LOCK:
+        return _JINJA2_TEMPLATES.setdefault(key, template)
+
+
+def _mako_lookup(directories, cache_dir):
+    from mako.lookup import TemplateLookup  # slow import, only needed here
+
+    key = (directories, cache_dir)
+    with _LOCK:
+        if key not in _MAKO_LOOKUPS:
+            _MAKO_LOOKUPS[key] = TemplateLookup(
+                directories=list(directories),
+                module_directory=None if cache_dir is None else join(cache_dir, "mako"),
+            )
+        return _MAKO_LOOKUPS[key]
+
+
+def _mako_template_from_cache(source, module_file, lookup, output_encoding):
+    from mako.template import ModuleTemplate  # slow import, only needed here
+
+    try:
+        with open(module_file, 'r', encoding='utf-8') as f:
+            module_source = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as exc:
+        io.debug(f"unable to read Mako template cache {module_file}: {repr(exc)}")
+        return None
+
+    module = ModuleType(module_file)
+    exec(compile(module_source, module_file, 'exec'), module.__dict__)
+    return ModuleTemplate(
+        module,
+        lookup=lookup,
+        module_source=module_source,
+        output_encoding=output_encoding,
+        template_source=source,
+    )
+
+
+def _mako_template_to_cache(template, module_file):
+    try:
+        makedirs(dirname(module_file), exist_ok=True)
+        handle, tmp_path = mkstemp(dir=dirname(module_file), prefix=".tmp_")
+        with open(handle, 'w', encoding='utf-8') as f:
+            f.write(template.code)
+        replace(tmp_path, module_file)
+    except OSError as exc:
+        io.debug(f"unable to write Mako template cache {module_file}: {repr(exc)}")
+
+
+def mako_template(source, directories, output_encoding, cache_dir=None):
+    """
+    Returns a compiled Mako template for the given source, which may
+    include or inherit from templates in the given directories.
+
+    If cache_dir is given, the Python modules generated by Mako are
+    also stored there and reused by other processes.
+    """
+    from mako.codegen import MAGIC_NUMBER  # slow import, only needed here
+    from mako.template import Template
+
+    directories = tuple(directories)
+    source_hash = _source_hash(source)
+    key = (directories, cache_dir, source_hash, output_encoding)
+    with _LOCK:
+        if key in _MAKO_TEMPLATES:
+            return _MAKO_TEMPLATES[key]
+
+    lookup = _mako_lookup(directories, cache_dir)
+    template = None
+    if cache_dir is not None:
+        module_file = join(cache_dir, "mako", "_text", f"{source_hash}_{MAGIC_NUMBER}.py")
+        template = _mako_template_from_cache(source, module_file, lookup, output_encoding)
+
+    if template is None:
+        io.debug(f"compiling Mako template {source_hash}")
+        template = Template(
+            source.encode('utf-8'),
+            input_encoding='utf-8',
+            lookup=lookup,
+            output_encoding=output_encoding,
+        )
+        if cache_dir is not None:
+            _mako_template_to_cache(template, module_file)
+
+    with _LOCK:
+        return _MAKO_TEMPLATES.setdefault(key, template)
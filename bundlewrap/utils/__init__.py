@@ -1,26 +1,30 @@
 from base64 import b64encode
 from codecs import getwriter
-from contextlib import contextmanager
+from contextlib import contextmanager, suppress
 import hashlib
 from inspect import isgenerator
-from os import chmod, close, makedirs, remove
-from os.path import dirname, exists
+from os import chmod, close, environ, fstat, makedirs, remove, replace
+from os.path import dirname, exists, join
 from random import shuffle
 import stat
 from sys import stderr, stdout
 from tempfile import mkstemp
-
-from passlib.hash import apr_md5_crypt
-from requests import get
+from threading import Lock
 
 from ..exceptions import DontCache, FaultUnavailable
 
 
 class NO_DEFAULT: pass
+HASH_CHUNK_SIZE = 1024 * 1024  # bytes
 MODE644 = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH
 STDERR_WRITER = getwriter('utf-8')(stderr.buffer)
 STDOUT_WRITER = getwriter('utf-8')(stdout.buffer)
 
+# maps (path, device, inode, size, mtime) to sha1 hashes
+_LOCAL_FILE_HASHES = {}
+_LOCAL_FILE_HASH_LOCKS = {}
+_LOCAL_FILE_HASH_LOCKS_LOCK = Lock()
+
 
 def cached_property(prop, convert_to=None):
     """
@@ -60,6 +64,13 @@ def cached_property_set(prop):
 
 
 def download(url, path, timeout=60.0):
+    """
+    Downloads the given URL to the given path and returns the sha1 hash
+    of the downloaded data.
+    """
+    from requests import get  # slow import, only needed here
+
+    hasher = hashlib.sha1()
     with error_context(url=url, path=path):
         if not exists(dirname(path)):
             makedirs(dirname(path))
@@ -68,11 +79,13 @@ def download(url, path, timeout=60.0):
         with open(path, 'wb') as f:
             r = get(url, stream=True, timeout=timeout)
             r.raise_for_status()
-            for block in r.iter_content(1024):
+            for block in r.iter_content(HASH_CHUNK_SIZE):
                 if not block:
                     break
                 else:
                     f.write(block)
+                    hasher.update(block)
+    return hasher.hexdigest()
 
 
 class ErrorContext(Exception):
@@ -183,6 +196,8 @@ class Fault:
 
     def as_htpasswd_entry(self, username):
         def callback():
+            from passlib.hash import apr_md5_crypt  # slow import, only needed here
+
             return '{}:{}'.format(
                 username,
                 apr_md5_crypt.encrypt(
@@ -252,11 +267,79 @@ def get_file_contents(path):
     return content
 
 
+def _local_hash_cache_file(key):
+    cache_dir = environ.get("BW_LOCAL_HASH_CACHE")
+    if not cache_dir:
+        return None
+    return join(cache_dir, sha1(repr(key).encode('utf-8')))
+
+
+def _read_local_hash_cache(key):
+    cache_file = _local_hash_cache_file(key)
+    if cache_file is None:
+        return None
+    try:
+        with open(cache_file, 'r') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_local_hash_cache(key, file_hash):
+    cache_file = _local_hash_cache_file(key)
+    if cache_file is None:
+        return
+    try:
+        makedirs(dirname(cache_file), exist_ok=True)
+        handle, tmp_path = mkstemp(dir=dirname(cache_file), prefix=".tmp_")
+        with open(handle, 'w') as f:
+            f.write(file_hash)
+        replace(tmp_path, cache_file)
+    except OSError:
+        pass
+
+
 def hash_local_file(path):
     """
     Retuns the sha1 hash of a file on the local machine.
+
+    The file is read in chunks, so it never has to fit into memory.
+    Hashes are remembered for as long as the path, inode, size and
+    modification time of the file stay the same (across runs of bw if
+    BW_LOCAL_HASH_CACHE is set).
     """
-    return sha1(get_file_contents(path))
+    with _LOCAL_FILE_HASH_LOCKS_LOCK:
+        lock = _LOCAL_FILE_HASH_LOCKS.setdefault(path, Lock())
+
+    # many nodes might be asking for the hash of the same file at once
+    with lock, error_context(path=path):
+        with open(path, 'rb') as f:
+            file_stat = fstat(f.fileno())
+            key = (
+                path,
+                file_stat.st_dev,
+                file_stat.st_ino,
+                file_stat.st_size,
+                file_stat.st_mtime_ns,
+            )
+            with suppress(KeyError):
+                return _LOCAL_FILE_HASHES[key]
+
+            file_hash = _read_local_hash_cache(key)
+            if file_hash is None:
+                hasher = hashlib.sha1()
+                buf = bytearray(HASH_CHUNK_SIZE)
+                view = memoryview(buf)
+                while True:
+                    length = f.readinto(buf)
+                    if not length:
+                        break
+                    hasher.update(view[:length])
+                file_hash = hasher.hexdigest()
+                _write_local_hash_cache(key, file_hash)
+
+        _LOCAL_FILE_HASHES[key] = file_hash
+        return file_hash
 
 
 def list_starts_with(list_a, list_b):
@@ -5,6 +5,7 @@ from traceback import format_exc, print_exc
 
 from ..concurrency import WorkerPool
 from ..exceptions import NoSuchGroup, NoSuchItem, NoSuchNode, RepositoryError
+from ..metaprofile import ReactorProfile
 from . import names
 from .text import bold, mark_for_translation as _, prefix_lines, red
 from .ui import io, QUIT_EVENT
@@ -95,6 +96,34 @@ def count_items(nodes):
     return count
 
 
+def enable_reactor_profile(repo, args):
+    """
+    Starts recording reactor timing if any of the --reactor-profile*
+    options were given.
+    """
+    if (
+        args['reactor_profile'] or
+        args['reactor_profile_json'] or
+        args['reactor_profile_trace']
+    ):
+        repo._reactor_profile = ReactorProfile()
+        # we want to see reactors actually run
+        repo._metadata_cache = None
+
+
+def report_reactor_profile(repo, args):
+    profile = repo._reactor_profile
+    if profile is None:
+        return
+    if args['reactor_profile']:
+        for line in profile.table():
+            io.stderr(line)
+    if args['reactor_profile_json']:
+        profile.dump_json(args['reactor_profile_json'])
+    if args['reactor_profile_trace']:
+        profile.dump_chrome_trace(args['reactor_profile_trace'])
+
+
 def get_group(repo, group_name):
     try:
         return repo.get_group(group_name)
@@ -1,10 +1,9 @@
 from copy import copy
 from difflib import unified_diff
+from functools import wraps
 from hashlib import sha1
 from json import dumps, JSONEncoder
 
-from tomlkit import document as toml_document
-
 from . import Fault
 from .text import bold, green, red, yellow
 from .text import force_text, mark_for_translation as _
@@ -40,6 +39,8 @@ ATOMIC_TYPES = {
 
 
 def dict_to_toml(dict_obj):
+    from tomlkit import document as toml_document  # slow import, only needed here
+
     toml_doc = toml_document()
     for key, value in dict_obj.items():
         if isinstance(value, tuple):
@@ -216,6 +217,39 @@ def hash_statedict(sdict):
     return sha1(statedict_to_json(sdict).encode('utf-8')).hexdigest()
 
 
+class LazyDict(dict):
+    """
+    A dict that is filled with whatever the given function returns
+    when its contents are first accessed.
+    """
+    def __init__(self, loader):
+        super().__init__()
+        self._loader = loader
+        self.loaded = False
+
+    def load(self):
+        if not self.loaded:
+            dict.update(self, self._loader())
+            self.loaded = True
+
+
+def _load_lazy_dict_first(method):
+    @wraps(method)
+    def wrapped(self, *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+    return wrapped
+
+
+for _method_name in (
+    '__contains__', '__delitem__', '__eq__', '__getitem__', '__ior__', '__iter__',
+    '__len__', '__ne__', '__or__', '__repr__', '__reversed__', '__ror__', '__setitem__',
+    'clear', 'copy', 'get', 'items', 'keys', 'pop', 'popitem', 'setdefault', 'update',
+    'values',
+):
+    setattr(LazyDict, _method_name, _load_lazy_dict_first(getattr(dict, _method_name)))
+
+
 def map_dict_keys(dict_obj, leaves_only=False, _base=None,):
     """
     Return a set of key paths for the given dict. E.g.:
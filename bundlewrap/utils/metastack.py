@@ -3,6 +3,26 @@ from .dicts import ATOMIC_TYPES, map_dict_keys, merge_dict
 
 
 UNMERGEABLE = tuple(METADATA_TYPES) + tuple(ATOMIC_TYPES.values())
+_MISSING = object()
+
+
+def _same_metadata(a, b):
+    """
+    Like a == b, but also considers types (e.g. atomic() vs. dict) since
+    they influence merging.
+    """
+    if type(a) is not type(b):
+        return False
+    elif isinstance(a, dict):
+        if a.keys() != b.keys():
+            return False
+        return all(_same_metadata(value, b[key]) for key, value in a.items())
+    elif isinstance(a, (list, tuple)):
+        if len(a) != len(b):
+            return False
+        return all(_same_metadata(x, y) for x, y in zip(a, b))
+    else:
+        return a == b
 
 
 class Metastack:
@@ -22,11 +42,43 @@ class Metastack:
             {},  # defaults
         )
         self._cached_partitions = {}
+        # Merged values (or _MISSING) previously returned by get(),
+        # grouped by the first key of their path. These must never be
+        # handed out without copying them first.
+        self._merged_values = {}
+
+    def _invalidate(self, old_layer, new_layer):
+        """
+        Forgets merged values that might be affected by replacing
+        old_layer with new_layer.
+        """
+        changed = False
+        for key in set(old_layer.keys()) | set(new_layer.keys()):
+            if not _same_metadata(
+                old_layer.get(key, _MISSING),
+                new_layer.get(key, _MISSING),
+            ):
+                self._merged_values.pop(key, None)
+                changed = True
+        if changed:
+            # the empty path always depends on everything
+            self._merged_values.pop(None, None)
 
     def get(self, path):
         """
         Get the value at the given path, merging all layers together.
         """
+        path = tuple(path)
+        bucket = self._merged_values.setdefault(path[0] if path else None, {})
+        try:
+            value = bucket[path]
+        except KeyError:
+            value = bucket[path] = self._merged_value(path)
+        if value is _MISSING:
+            raise KeyError('/'.join(path))
+        return deepcopy_metadata(value)
+
+    def _merged_value(self, path):
         result = None
         undef = True
 
@@ -43,16 +95,16 @@ class Metastack:
                         # First time we see anything. If we can't merge
                         # it anyway, then return early.
                         if isinstance(value, UNMERGEABLE):
-                            return deepcopy_metadata(value)
+                            return value
                         result = {'data': value}
                         undef = False
                     else:
                         result = merge_dict({'data': value}, result)
 
         if undef:
-            raise KeyError('/'.join(path))
+            return _MISSING
         else:
-            return deepcopy_metadata(result['data'])
+            return result['data']
 
     def as_dict(self, partitions=None):
         final_dict = {}
@@ -86,15 +138,21 @@ class Metastack:
 
     def pop_layer(self, partition_index, identifier):
         try:
-            return self._partitions[partition_index].pop(identifier)
+            old_layer = self._partitions[partition_index].pop(identifier)
         except (KeyError, IndexError):
             return {}
+        self._invalidate(old_layer, {})
+        return old_layer
 
     def set_layer(self, partition_index, identifier, new_layer):
         validate_metadata(new_layer)
-        self._partitions[partition_index][identifier] = new_layer
+        partition = self._partitions[partition_index]
+        self._invalidate(partition.get(identifier, {}), new_layer)
+        # copy so we notice if the caller keeps modifying new_layer
+        partition[identifier] = deepcopy_metadata(new_layer)
 
     def cache_partition(self, partition_index):
         self._cached_partitions[partition_index] = {
             'merged layers': self.as_dict(partitions=[partition_index]),
         }
+        self._merged_values = {}
@@ -1,33 +1,61 @@
+from os.path import dirname
 from shlex import quote
 
+from ..items import node_cache
 from . import cached_property
 from .text import force_text, mark_for_translation as _
 from .ui import io
 
 
-def stat(node, path):
+# number of paths to look at in a single command when prefetching
+PREFETCH_CHUNK_SIZE = 500
+
+# item types whose paths can be prefetched
+PATH_ITEM_TYPES = ("directory", "file", "symlink")
+
+
+def _stat_command(node):
     if node.os in node.OS_FAMILY_BSD:
-        result = node.run(
-            "stat -f '%Su:%Sg:%p:%z:%HT' -- {}".format(quote(path)),
-            may_fail=True,
-        )
+        return "stat -f '%Su:%Sg:%p:%z:%HT'"
     else:
-        result = node.run(
-            "stat -c '%U:%G:%a:%s:%F' -- {}".format(quote(path)),
-            may_fail=True,
-        )
-    if result.return_code != 0:
-        return {}
-    owner, group, mode, size, ftype = \
-        force_text(result.stdout).strip().split(":", 5)
+        return "stat -c '%U:%G:%a:%s:%F'"
+
+
+def _sha1_command(node):
+    if node.os == 'macos':
+        return "shasum -a 1"
+    elif node.os in node.OS_FAMILY_BSD:
+        return "sha1 -q"
+    else:
+        return "sha1sum"
+
+
+def _parse_sha1(output):
+    # sha1sum adds a leading backslash to hashes of files whose name
+    # contains backslash-escaped characters – we must lstrip() that
+    return force_text(output).strip().lstrip("\\").split()[0]
+
+
+def _parse_stat(output):
+    owner, group, mode, size, ftype = force_text(output).strip().split(":", 5)
     mode = mode[-4:].zfill(4)  # cut off BSD file type
-    file_stat = {
+    return {
         'owner': owner,
         'group': group,
         'mode': mode,
         'size': int(size),
         'type': ftype.lower(),
     }
+
+
+def stat(node, path):
+    result = node.run(
+        "{} -- {}".format(_stat_command(node), quote(path)),
+        may_fail=True,
+    )
+    if result.return_code != 0:
+        return {}
+    file_stat = _parse_stat(result.stdout)
     io.debug(_("stat for '{path}' on {node}: {result}".format(
         node=node.name,
         path=path,
@@ -36,15 +64,131 @@ def stat(node, path):
     return file_stat
 
 
+def prefetch_path_info(node, paths, hash_paths=()):
+    """
+    Gathers everything PathInfo needs to know about the given paths
+    using as few commands as possible. Only files in hash_paths are
+    hashed, PathInfo.sha1 will have to hash other files itself.
+    Results are stored in a cache on the node and each will be used by
+    the next PathInfo for that path only.
+    """
+    cache = node_cache(node, 'path_info')
+    paths = sorted(set(paths))
+    hash_paths = set(hash_paths)
+    # arguments are pairs of a flag (hash or not) and a path, output
+    # is one NUL-terminated record per path: path, stat, sha1, link target
+    script = (
+        'while [ $# -gt 1 ]; do '
+        'w=$1; p=$2; shift 2; '
+        's=$({stat} -- "$p" 2>/dev/null); h=; t=; '
+        'case "$s" in '
+        '*:[Rr]egular\\ [Ff]ile|*:[Rr]egular\\ [Ee]mpty\\ [Ff]ile) '
+        'if [ "$w" = 1 ]; then h=$({sha1} -- "$p" 2>/dev/null); fi ;; '
+        '*:[Ss]ymbolic\\ [Ll]ink) t=$(readlink -- "$p" 2>/dev/null) ;; '
+        'esac; '
+        "printf '%s\\0%s\\0%s\\0%s\\0' \"$p\" \"$s\" \"$h\" \"$t\"; "
+        'done'
+    ).format(stat=_stat_command(node), sha1=_sha1_command(node))
+    for i in range(0, len(paths), PREFETCH_CHUNK_SIZE):
+        chunk = paths[i:i + PREFETCH_CHUNK_SIZE]
+        result = node.run(
+            "sh -c {} sh {}".format(quote(script), " ".join(
+                "{} {}".format(1 if path in hash_paths else 0, quote(path))
+                for path in chunk
+            )),
+            may_fail=True,
+        )
+        if result.return_code != 0:
+            io.debug(_("unable to prefetch path info on {node}").format(node=node.name))
+            return
+        fields = result.stdout.split(b"\0")
+        for j in range(0, len(fields) - 3, 4):
+            path, file_stat, sha1, symlink_target = fields[j:j + 4]
+            try:
+                cache[force_text(path)] = {
+                    'file_stat': _parse_stat(file_stat) if file_stat.strip() else {},
+                    'sha1': _parse_sha1(sha1) if sha1.strip() else None,
+                    'symlink_target': force_text(symlink_target).strip() or None,
+                }
+            except ValueError:
+                # unexpected output, PathInfo will have to look for itself
+                pass
+    io.debug(_("prefetched path info for {count} paths on {node}").format(
+        count=len(paths),
+        node=node.name,
+    ))
+
+
+def forget_path_info(node, changed_item=None):
+    """
+    Discards prefetched path info for the given node that changed_item
+    might have made obsolete, or all of it if changed_item is None:
+
+        * the path of a directory, file or symlink item along with its
+          parents and everything below it
+        * the paths of all directory, file and symlink items still
+          waiting for changed_item, which might have changed them
+
+    Items that don't wait for changed_item might just as well have
+    been applied before it.
+    """
+    cache = node_cache(node, 'path_info')
+    if changed_item is None:
+        cache.clear()
+        return
+
+    run = node._item_run
+    if run is not None and run.item_queue is not None:
+        for item in run.item_queue.dependents(changed_item):
+            if item.ITEM_TYPE_NAME in PATH_ITEM_TYPES:
+                cache.pop(item.name, None)
+    elif changed_item.ITEM_TYPE_NAME not in PATH_ITEM_TYPES:
+        # no way of telling which paths might have changed
+        cache.clear()
+        return
+
+    if changed_item.ITEM_TYPE_NAME in PATH_ITEM_TYPES:
+        _forget_path_info_around(cache, changed_item.name)
+
+
+def _forget_path_info_around(cache, changed_path):
+    path = changed_path
+    while True:
+        cache.pop(path, None)
+        if path == dirname(path):
+            break
+        path = dirname(path)
+    prefix = changed_path.rstrip("/") + "/"
+    for cached_path in list(cache):
+        if cached_path.startswith(prefix):
+            cache.pop(cached_path, None)
+
+
 class PathInfo:
     """
     Serves as a proxy to get_path_type.
     """
 
-    def __init__(self, node, path):
+    def __init__(self, node, path, file_stat=None, sha1=None, symlink_target=None):
+        """
+        file_stat, sha1 and symlink_target may be given if they are
+        already known. Otherwise, prefetched info for the path is used
+        if available (see prefetch_path_info()). Anything still missing
+        is looked up on the node when needed.
+        """
         self.node = node
         self.path = path
-        self.stat = stat(node, path)
+        if file_stat is None:
+            prefetched = node_cache(node, 'path_info').pop(path, None)
+            if prefetched is None:
+                file_stat = stat(node, path)
+            else:
+                file_stat = prefetched['file_stat']
+                sha1 = prefetched['sha1']
+                symlink_target = prefetched['symlink_target']
+        self.stat = file_stat
+        self._sha1 = sha1
+        self._symlink_target = symlink_target
 
     def __repr__(self):
         return "<PathInfo for {}:{}>".format(self.node.name, quote(self.path))
@@ -96,17 +240,12 @@ class PathInfo:
             "file -bh -- {}".format(quote(self.path))
         ).stdout).strip()
 
-    @cached_property
+    @property
     def sha1(self):
-        if self.node.os == 'macos':
-            result = self.node.run("shasum -a 1 -- {}".format(quote(self.path)))
-        elif self.node.os in self.node.OS_FAMILY_BSD:
-            result = self.node.run("sha1 -q -- {}".format(quote(self.path)))
-        else:
-            result = self.node.run("sha1sum -- {}".format(quote(self.path)))
-        # sha1sum adds a leading backslash to hashes of files whose name
-        # contains backslash-escaped characters – we must lstrip() that
-        return force_text(result.stdout).strip().lstrip("\\").split()[0]
+        if self._sha1 is None:
+            result = self.node.run("{} -- {}".format(_sha1_command(self.node), quote(self.path)))
+            self._sha1 = _parse_sha1(result.stdout)
+        return self._sha1
 
     @property
     def size(self):
@@ -117,6 +256,8 @@ class PathInfo:
         if not self.is_symlink:
             raise ValueError("{} is not a symlink".format(quote(self.path)))
 
-        return force_text(self.node.run(
-            "readlink -- {}".format(quote(self.path)), may_fail=True,
-        ).stdout.strip())
+        if self._symlink_target is None:
+            self._symlink_target = force_text(self.node.run(
+                "readlink -- {}".format(quote(self.path)), may_fail=True,
+            ).stdout.strip())
+        return self._symlink_target
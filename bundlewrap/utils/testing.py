@@ -2,6 +2,9 @@ import platform
 from subprocess import Popen, PIPE
 
 from ..bundle import FILENAME_BUNDLE, FILENAME_ITEMS
+from ..exceptions import RemoteException
+from ..itemqueue import ItemQueue
+from ..items import clear_node_caches, Item, ItemRun
 from ..secrets import FILENAME_SECRETS
 
 
@@ -11,6 +14,39 @@ HOST_OS = {
 }
 
 
+def apply_sequentially(node):
+    """
+    Applies all items of the given node one after another in the
+    current thread, much like apply_items() would with a single
+    worker. Returns a dict mapping item IDs to status codes.
+    """
+    item_queue = ItemQueue(node)
+    results = {}
+    clear_node_caches(node)
+    with ItemRun(node, item_queue, {}):
+        while True:
+            try:
+                item = item_queue.pop()
+            except KeyError:
+                break
+            try:
+                status_code = item.apply()[0]
+            except RemoteException:
+                # apply_items() would report this as failed
+                status_code = Item.STATUS_FAILED
+            results[item.id] = status_code
+            if status_code == Item.STATUS_OK:
+                item_queue.item_ok(item)
+            elif status_code == Item.STATUS_FAILED:
+                for skipped_item in item_queue.item_failed(item):
+                    results[skipped_item.id] = Item.STATUS_SKIPPED
+            else:
+                assert status_code in (Item.STATUS_FIXED, Item.STATUS_ACTION_SUCCEEDED), item.id
+                item_queue.item_fixed(item)
+    assert node._item_run is None
+    return results
+
+
 def host_os():
     return HOST_OS[platform.system()]
 
@@ -31,6 +31,8 @@ INFO_EVENT = Event()
 QUIT_EVENT = Event()
 SHUTDOWN_EVENT_HARD = Event()
 SHUTDOWN_EVENT_SOFT = Event()
+# wakes up the signal handler thread early
+WAKEUP_EVENT = Event()
 TTY = STDOUT_WRITER.isatty()
 
 
@@ -87,6 +89,7 @@ def sigint_handler(*args, **kwargs):
     else:
         SHUTDOWN_EVENT_HARD.set()
         faulthandler.dump_traceback()
+    WAKEUP_EVENT.set()
 
 
 def sigquit_handler(*args, **kwargs):
@@ -288,6 +291,9 @@ class IOManager:
         signal(SIGINT, SIG_DFL)
         signal(SIGQUIT, SIG_DFL)
         faulthandler.disable()
+        # don't make every bw invocation wait for the thread to wake up
+        # on its own
+        WAKEUP_EVENT.set()
         self._signal_handler_thread.join()
         if self.debug_log_file:
             self.debug_log_file.close()
@@ -436,7 +442,7 @@ class IOManager:
                     self._clear_last_job(flush=False)
                     self._write_current_job()
             if QUIT_EVENT.is_set():
-                if SHUTDOWN_EVENT_HARD.wait(0.1):
+                if SHUTDOWN_EVENT_HARD.is_set():
                     self.stderr(_("{x} {signal}  cleanup interrupted, exiting...").format(
                         signal=bold(_("SIGINT")),
                         x=blue("i"),
@@ -449,16 +455,17 @@ class IOManager:
                     if TTY:
                         write_to_stream(STDOUT_WRITER, SHOW_CURSOR)
                     _exit(130)  # https://tldp.org/LDP/abs/html/exitcodes.html
-            else:
-                if SHUTDOWN_EVENT_SOFT.wait(0.1):
-                    QUIT_EVENT.set()
-                    self.stderr(_(
-                        "{x} {signal}  canceling pending tasks... "
-                        "(hit CTRL+C again for immediate dirty exit)"
-                    ).format(
-                        signal=bold(_("SIGINT")),
-                        x=blue("i"),
-                    ))
+            elif SHUTDOWN_EVENT_SOFT.is_set():
+                QUIT_EVENT.set()
+                self.stderr(_(
+                    "{x} {signal}  canceling pending tasks... "
+                    "(hit CTRL+C again for immediate dirty exit)"
+                ).format(
+                    signal=bold(_("SIGINT")),
+                    x=blue("i"),
+                ))
+            WAKEUP_EVENT.wait(0.1)
+            WAKEUP_EVENT.clear()
 
     def _spinner_character(self):
         if time() - self._last_spinner_update > 0.2:
@@ -41,11 +41,11 @@ setup(
         "Jinja2",
         "librouteros >= 3.0.0",
         "Mako",
+        "packaging",
         "passlib",
         "pyyaml",
         "requests >= 1.0.0",
         "rtoml ; python_version<'3.11'",
-        "setuptools",
         "tomlkit",
     ],
     zip_safe=False,
@@ -1,4 +1,5 @@
 from base64 import b64encode
+from os import mkdir, stat
 from os.path import exists, join
 
 from bundlewrap.utils.testing import host_os, make_repo, run
@@ -275,3 +276,43 @@ files = {
     assert rcode == 0
     assert b"file:/tmp/bw_test_faultunavailable  skipped (Fault unavailable)" in stdout
     assert not exists("/tmp/bw_test_faultunavailable")
+
+
+def test_multiple_files(tmpdir):
+    files = {}
+    for i in range(20):
+        files[join(str(tmpdir), "sub", f"file{i}")] = {
+            'content': f"content {i}\n",
+            'mode': "0600" if i % 2 else "0644",
+        }
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'files': files,
+                },
+            },
+        },
+        nodes={
+            "localhost": {
+                'bundles': ["test"],
+                'os': host_os(),
+            },
+        },
+    )
+    mkdir(join(str(tmpdir), "sub"))
+    with open(join(str(tmpdir), "sub", "file0"), 'w') as f:
+        f.write("old content\n")
+
+    stdout, stderr, rcode = run("bw apply localhost", path=str(tmpdir))
+    assert rcode == 0
+
+    for i in range(20):
+        path = join(str(tmpdir), "sub", f"file{i}")
+        with open(path) as f:
+            assert f.read() == f"content {i}\n"
+        assert oct(stat(path).st_mode & 0o777) == ("0o600" if i % 2 else "0o644")
+
+    stdout, stderr, rcode = run("bw verify localhost", path=str(tmpdir))
+    assert rcode == 0
@@ -0,0 +1,11 @@
+from bundlewrap.utils.testing import make_repo, run
+
+
+def test_startup_profile(tmpdir):
+    make_repo(tmpdir)
+    stdout, stderr, rcode = run("BW_TABLE_STYLE=grep bw debug --startup-profile", path=str(tmpdir))
+    assert rcode == 0
+    lines = stdout.decode().splitlines()
+    assert lines[0].split() == ["package", "modules", "time"]
+    assert "bundlewrap" in [line.split()[0] for line in lines[1:]]
+    assert "loading repo" in stdout.decode()
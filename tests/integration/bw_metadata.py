@@ -1,5 +1,5 @@
 from json import loads
-from os.path import join
+from os.path import exists, join
 
 from bundlewrap.utils.testing import make_repo, run
 
@@ -322,6 +322,150 @@ def foo_reactor(metadata):
     assert rcode == 0
 
 
+def test_metadatapy_parallel_reactors(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={"test": {}},
+        nodes={
+            "node1": {
+                'bundles': ["test"],
+                'metadata': {
+                    "start": 1,
+                },
+            },
+        },
+    )
+    with open(join(str(tmpdir), "bundles", "test", "metadata.py"), 'w') as f:
+        f.write("""@metadata_reactor.provides("one")
+def reactor1(metadata):
+    return {"one": metadata.get("start") + 1}
+
+@metadata_reactor.provides("two")
+def reactor2(metadata):
+    return {"two": metadata.get("one") + 1}
+
+@metadata_reactor.provides("three")
+def reactor3(metadata):
+    return {"three": metadata.get("two") + 1}
+
+@metadata_reactor.provides("independent")
+def reactor4(metadata):
+    return {"independent": metadata.get("start")}
+""")
+    stdout, stderr, rcode = run("BW_METADATA_WORKERS=4 bw metadata node1", path=str(tmpdir))
+    assert loads(stdout.decode()) == {
+        "start": 1,
+        "one": 2,
+        "two": 3,
+        "three": 4,
+        "independent": 1,
+    }
+    assert stderr == b""
+    assert rcode == 0
+
+
+def test_metadatapy_cache(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={"test": {}},
+        nodes={
+            "node1": {
+                'bundles': ["test"],
+                'metadata': {
+                    "start": 1,
+                },
+            },
+        },
+    )
+    with open(join(str(tmpdir), "bundles", "test", "metadata.py"), 'w') as f:
+        f.write("""@metadata_reactor
+def reactor1(metadata):
+    return {
+        "one": metadata.get("start") + 1,
+        "secret": repo.vault.password_for("test"),
+    }
+""")
+    stdout, stderr, rcode = run("BW_METADATA_CACHE=1 bw metadata node1 -k one", path=str(tmpdir))
+    assert rcode == 0
+    # partial metadata is not cached
+    assert not exists(join(str(tmpdir), ".cache", "metadata", "node1.pickle"))
+
+    for i in range(2):
+        stdout, stderr, rcode = run("BW_METADATA_CACHE=1 bw metadata node1", path=str(tmpdir))
+        assert loads(stdout.decode())["one"] == 2
+        assert stderr == b""
+        assert rcode == 0
+        assert exists(join(str(tmpdir), ".cache", "metadata", "node1.pickle"))
+
+    # Faults from repo.vault survive the cache
+    stdout_cached, stderr, rcode = run(
+        "BW_METADATA_CACHE=1 bw metadata node1 -k secret",
+        path=str(tmpdir),
+    )
+    assert rcode == 0
+    stdout, stderr, rcode = run("bw metadata node1 -k secret", path=str(tmpdir))
+    assert stdout_cached == stdout
+
+    with open(join(str(tmpdir), "nodes.py"), 'w') as f:
+        f.write("nodes = {'node1': {'bundles': ['test'], 'metadata': {'start': 2}}}")
+    stdout, stderr, rcode = run("BW_METADATA_CACHE=1 bw metadata node1 -k one", path=str(tmpdir))
+    assert loads(stdout.decode()) == {"one": 3}
+    assert rcode == 0
+
+
+def test_metadatapy_reactor_profile(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={"test": {}},
+        nodes={
+            "node1": {
+                'bundles': ["test"],
+            },
+        },
+    )
+    with open(join(str(tmpdir), "bundles", "test", "metadata.py"), 'w') as f:
+        f.write("""@metadata_reactor
+def reactor1(metadata):
+    return {"one": metadata.get("two") + 1}
+
+
+@metadata_reactor
+def reactor2(metadata):
+    return {"two": 1}
+""")
+    stdout, stderr, rcode = run(
+        "bw metadata node1 --reactor-profile "
+        "--reactor-profile-json profile.json --reactor-profile-trace trace.json",
+        path=str(tmpdir),
+    )
+    assert rcode == 0
+    assert loads(stdout.decode()) == {"one": 2, "two": 1}
+    assert b"reactor1" in stderr
+    assert b"reactor2" in stderr
+
+    with open(join(str(tmpdir), "profile.json")) as f:
+        profile = {
+            reactor['reactor']: reactor
+            for reactor in loads(f.read())['reactors']
+        }
+    reactor1 = profile["metadata_reactor:test.reactor1"]
+    reactor2 = profile["metadata_reactor:test.reactor2"]
+    assert reactor1['node'] == "node1"
+    assert reactor1['changes'] == 1
+    assert reactor1['metadata_gets'] >= 1
+    assert reactor1['runs'] >= reactor1['keyerrors'] + reactor1['changes']
+    assert reactor2['changes'] == 1
+    assert reactor2['metadata_gets'] == 0
+
+    with open(join(str(tmpdir), "trace.json")) as f:
+        trace = loads(f.read())
+    assert len(trace['traceEvents']) == sum(reactor['runs'] for reactor in profile.values())
+    assert {event['name'] for event in trace['traceEvents']} == {
+        "node1 metadata_reactor:test.reactor1",
+        "node1 metadata_reactor:test.reactor2",
+    }
+
+
 def test_metadatapy_reactor_keyerror_from_metastack(tmpdir):
     make_repo(
         tmpdir,
@@ -1,3 +1,4 @@
+from json import loads
 from os.path import join
 
 from bundlewrap.utils.testing import host_os, make_repo, run
@@ -812,6 +813,108 @@ def test_config_determinism_broken(tmpdir):
     assert b"findme" in stderr
 
 
+def test_config_determinism_broken_parallel(tmpdir):
+    make_repo(
+        tmpdir,
+        nodes={
+            "node{}".format(i): {
+                'bundles': ["bundle1"],
+            } for i in range(4)
+        },
+        bundles={
+            "bundle1": {
+                'items': {
+                    "files": {
+                        "/test": {
+                            'content': (
+                                "<% from random import randint %>\n"
+                                "findme${randint(1, 99999)\n}"
+                            ),
+                            'content_type': 'mako',
+                        },
+                    },
+                },
+            },
+        },
+    )
+    stdout, stderr, rcode = run("bw test -j 4 -d 3", path=str(tmpdir))
+    assert rcode == 1
+    assert b"findme" in stderr
+
+
+def test_items_parallel(tmpdir):
+    make_repo(
+        tmpdir,
+        nodes={
+            "node{}".format(i): {
+                'bundles': ["bundle1"],
+            } for i in range(8)
+        },
+        bundles={
+            "bundle1": {
+                'items': {
+                    "files": {
+                        "/test{}".format(i): {
+                            'content': "${node.name}",
+                            'content_type': 'mako',
+                        } for i in range(10)
+                    },
+                },
+            },
+        },
+    )
+    stdout, stderr, rcode = run("bw test -I -j 4", path=str(tmpdir))
+    assert rcode == 0
+    node_names = [line.split()[1] for line in stdout.decode().splitlines()]
+    assert len(node_names) == 80
+    # output for each node is not interleaved with other nodes
+    for i in range(0, 80, 10):
+        assert len(set(node_names[i:i + 10])) == 1
+
+
+def test_items_parallel_circular_dep(tmpdir):
+    make_repo(
+        tmpdir,
+        nodes={
+            "node1": {
+                'bundles': ["bundle1"],
+            },
+            "node2": {
+                'bundles': ["bundle2"],
+            },
+        },
+        bundles={
+            "bundle1": {
+                'items': {
+                    "pkg_apt": {
+                        "foo": {
+                            'needs': ["pkg_apt:bar"],
+                        },
+                        "bar": {
+                            'needs': ["pkg_apt:foo"],
+                        },
+                    },
+                },
+            },
+            "bundle2": {
+                'items': {
+                    "files": {
+                        "/test": {
+                            'content': "test",
+                        },
+                    },
+                },
+            },
+        },
+    )
+    stdout, stderr, rcode = run("bw test -I -j 2", path=str(tmpdir))
+    assert rcode == 1
+    assert b"node1" in stderr
+    assert b"pkg_apt:foo" in stderr
+    # the other node is still tested
+    assert b"node2  bundle2  file:/test" in stdout
+
+
 def test_unknown_subgroup(tmpdir):
     make_repo(
         tmpdir,
@@ -1100,3 +1203,31 @@ def test_file_test_with_succeds(tmpdir):
     stdout, stderr, rcode = run("bw test localhost", path=str(tmpdir))
     assert rcode == 0
     assert b'failed local validation using: true' not in stderr
+
+
+def test_reactor_profile_on_failure(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={
+            "orphan": {},
+            "test": {},
+        },
+        nodes={
+            "node1": {
+                'bundles': ["test"],
+            },
+        },
+    )
+    with open(join(str(tmpdir), "bundles", "test", "metadata.py"), 'w') as f:
+        f.write("""@metadata_reactor
+def reactor1(metadata):
+    return {"one": 1}
+""")
+    stdout, stderr, rcode = run(
+        "bw test -p -o --reactor-profile-json profile.json",
+        path=str(tmpdir),
+    )
+    assert rcode == 1
+    with open(join(str(tmpdir), "profile.json")) as f:
+        reactors = {reactor['reactor'] for reactor in loads(f.read())['reactors']}
+    assert "metadata_reactor:test.reactor1" in reactors
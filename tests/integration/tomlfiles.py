@@ -45,3 +45,24 @@ def test_duplicate_nodes(tmpdir):
     assert "aaa" in stderr.decode()
     assert "bbb" in stderr.decode()
     assert rcode == 1
+
+
+def test_toml_nodes_loaded_lazily(tmpdir):
+    make_repo(tmpdir)
+    makedirs(join(tmpdir, "nodes"))
+    with open(join(tmpdir, "nodes.py"), 'w') as f:
+        f.write("nodes['node1']['hostname'] = 'node1.example.com'\n")
+    with open(join(tmpdir, "nodes", "node1.toml"), 'w') as f:
+        f.write("os = 'ubuntu'\n")
+    with open(join(tmpdir, "nodes", "node2.toml"), 'w') as f:
+        f.write("os = 'debian'\n")
+    repo = Repository(tmpdir)
+    node2 = repo.get_node("node2")
+    assert '_lazy_attributes' in node2.__dict__
+    assert node2.os == "debian"
+    assert node2.file_path == join(tmpdir, "nodes", "node2.toml")
+    assert '_lazy_attributes' not in node2.__dict__
+    node1 = repo.get_node("node1")
+    assert node1.hostname == "node1.example.com"
+    assert node1.os == "ubuntu"
+    assert node1.file_path == join(tmpdir, "nodes", "node1.toml")
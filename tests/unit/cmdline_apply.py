@@ -0,0 +1,91 @@
+from threading import Event, Lock
+from time import sleep
+
+from bundlewrap.cmdline import apply
+from bundlewrap.cmdline.parser import build_parser_bw
+from bundlewrap.concurrency import WorkerPool
+
+from pytest import raises
+
+
+class FakeHooks:
+    def apply_start(self, *args, **kwargs):
+        pass
+
+    def apply_end(self, *args, **kwargs):
+        pass
+
+
+class FakeRepo:
+    hooks = FakeHooks()
+
+
+class FakeNode:
+    items = ()
+
+    def __init__(self, name, tasks):
+        self.name = name
+        self.lock = Lock()
+        self.running = 0
+        self.max_running = 0
+        self.tasks = tasks
+
+    def apply(self, scheduler=None, workers=1, **kwargs):
+        def run_task(task):
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            task()
+            with self.lock:
+                self.running -= 1
+
+        tasks = list(self.tasks)
+        WorkerPool(
+            lambda: bool(tasks),
+            lambda: {'target': run_task, 'args': [tasks.pop()]},
+            pool_id=self.name,
+            scheduler=scheduler,
+            workers=workers,
+        ).run()
+
+
+def run_fast_and_slow_node(monkeypatch, cmdline):
+    slow_task_started = Event()
+    fast_tasks_done = Event()
+
+    def slow_task():
+        slow_task_started.set()
+        fast_tasks_done.wait(10)
+
+    fast_tasks = [lambda: sleep(0.05) for i in range(20)]
+
+    def fast_task_last():
+        fast_tasks_done.set()
+
+    slow_node = FakeNode("slow", [slow_task])
+    # wait until the slow node is busy, so the fast node can't get
+    # more than its share while both of them are
+    fast_node = FakeNode("fast", [fast_task_last] + fast_tasks + [slow_task_started.wait])
+
+    monkeypatch.setattr(apply, 'get_target_nodes', lambda *args: [fast_node, slow_node])
+    args = vars(build_parser_bw().parse_args(cmdline))
+    with raises(SystemExit) as exc:
+        apply.bw_apply(FakeRepo(), args)
+    assert exc.value.code == 0
+    assert slow_node.max_running == 1
+    return fast_node.max_running
+
+
+def test_nodes_keep_to_item_workers(monkeypatch):
+    assert run_fast_and_slow_node(
+        monkeypatch,
+        ["apply", "-p", "2", "-P", "2", "*"],
+    ) == 2
+
+
+def test_nodes_borrow_idle_workers(monkeypatch):
+    # the fast node gets to use the worker the slow node doesn't need
+    assert run_fast_and_slow_node(
+        monkeypatch,
+        ["apply", "-p", "2", "-P", "2", "--parallel-items-max", "4", "*"],
+    ) == 3
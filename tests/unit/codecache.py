@@ -0,0 +1,65 @@
+from os import listdir, utime
+
+from bundlewrap.codecache import CodeCache
+
+
+class FakeRepo:
+    def __init__(self, path):
+        self.path = path
+
+
+def _run(code):
+    env = {}
+    exec(code, env)
+    return env['x']
+
+
+def test_code_cache(tmpdir):
+    cache = CodeCache(FakeRepo(str(tmpdir)))
+    source = tmpdir.join("nodes.py")
+    source.write("x = 1\n")
+    assert _run(cache.compile(str(source))) == 1
+    assert len(listdir(cache.path)) == 1
+
+    # a fresh instance must get the code from disk
+    cache = CodeCache(FakeRepo(str(tmpdir)))
+    cache_file = cache._cache_file(str(source))
+    with open(cache_file, 'rb') as f:
+        data = f.read()
+    with open(cache_file, 'wb') as f:
+        f.write(data.replace(b"nodes.py", b"nodes.pX"))
+    assert cache.compile(str(source)).co_filename.endswith("nodes.pX")
+
+
+def test_code_cache_invalidated(tmpdir):
+    cache = CodeCache(FakeRepo(str(tmpdir)))
+    source = tmpdir.join("nodes.py")
+    source.write("x = 1\n")
+    assert _run(cache.compile(str(source))) == 1
+    source.write("x = 23\n")
+    assert _run(cache.compile(str(source))) == 23
+    # same size, different mtime
+    source.write("x = 42\n")
+    utime(str(source), ns=(1, 1))
+    assert _run(cache.compile(str(source))) == 42
+
+
+def test_code_cache_corrupt(tmpdir):
+    cache = CodeCache(FakeRepo(str(tmpdir)))
+    source = tmpdir.join("nodes.py")
+    source.write("x = 1\n")
+    cache.compile(str(source))
+    cache_file = cache._cache_file(str(source))
+    with open(cache_file, 'rb') as f:
+        data = f.read()
+    with open(cache_file, 'wb') as f:
+        f.write(data[:-5])
+    assert _run(cache.compile(str(source))) == 1
+
+
+def test_code_cache_gitignore(tmpdir):
+    cache = CodeCache(FakeRepo(str(tmpdir)))
+    source = tmpdir.join("nodes.py")
+    source.write("x = 1\n")
+    cache.compile(str(source))
+    assert tmpdir.join(".cache", ".gitignore").read() == "*\n"
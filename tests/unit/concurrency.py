@@ -0,0 +1,133 @@
+from threading import Event, Lock, Thread
+from time import sleep
+
+from bundlewrap.concurrency import Scheduler, WorkerPool
+
+
+def test_scheduler_budget():
+    scheduler = Scheduler(workers=2)
+    assert scheduler.acquire("a") is None
+    assert scheduler.acquire("b") is None
+    wakeup = scheduler.acquire("a")
+    assert not wakeup.done()
+    scheduler.release("b")
+    assert wakeup.done()
+    assert scheduler.acquire("a") is None
+    scheduler.shutdown()
+
+
+def test_scheduler_fairness():
+    scheduler = Scheduler(workers=3)
+    assert scheduler.acquire("a") is None
+    assert scheduler.acquire("a") is None
+    assert scheduler.acquire("a") is None
+    assert scheduler.acquire("b") is not None
+    scheduler.release("a")
+    # b is waiting and has fewer tasks running than a
+    assert scheduler.acquire("a") is not None
+    assert scheduler.acquire("b") is None
+    scheduler.stop_waiting("a")
+    scheduler.shutdown()
+
+
+def test_shared_workers():
+    scheduler = Scheduler(workers=4)
+    lock = Lock()
+    running = {'b': 0, 'max_b': 0}
+    long_task_started = Event()
+    long_task_done = Event()
+
+    def long_task():
+        long_task_started.set()
+        long_task_done.wait()
+
+    def short_task():
+        with lock:
+            running['b'] += 1
+            running['max_b'] = max(running['max_b'], running['b'])
+        sleep(0.05)
+        with lock:
+            running['b'] -= 1
+
+    def run_pool(pool_id, tasks, workers):
+        WorkerPool(
+            lambda: bool(tasks),
+            lambda: {'target': tasks.pop()},
+            pool_id=pool_id,
+            scheduler=scheduler,
+            workers=workers,
+        ).run()
+
+    thread_a = Thread(target=run_pool, args=("a", [long_task], 2))
+    thread_a.start()
+    long_task_started.wait()
+    # b may use the worker a doesn't need, but no more than that
+    run_pool("b", [short_task for i in range(20)], 8)
+    long_task_done.set()
+    thread_a.join()
+    scheduler.shutdown()
+    assert running['max_b'] == 3
+
+
+def test_wakeup_without_tasks():
+    scheduler = Scheduler(workers=2)
+    a_started = Event()
+    a_done = Event()
+    b_started = Event()
+    b_done = Event()
+
+    def a_task():
+        a_started.set()
+        a_done.wait()
+
+    def b_task():
+        b_started.set()
+        b_done.wait()
+
+    b_tasks = [lambda: None, b_task]
+
+    def run_pool(pool_id, tasks_available, next_task):
+        WorkerPool(
+            tasks_available,
+            next_task,
+            pool_id=pool_id,
+            scheduler=scheduler,
+            workers=2,
+        ).run()
+
+    def wait_for(condition):
+        for i in range(200):
+            if condition():
+                return True
+            sleep(0.01)
+        return False
+
+    thread_a = Thread(target=run_pool, args=(
+        "a",
+        lambda: not a_started.is_set(),
+        lambda: {'target': a_task},
+    ))
+    thread_b = Thread(target=run_pool, args=(
+        "b",
+        lambda: bool(b_tasks),
+        lambda: {'target': b_tasks.pop()},
+    ))
+    try:
+        thread_a.start()
+        a_started.wait()
+        thread_b.start()
+        b_started.wait()
+        # b has to wait for a worker to run its other task
+        assert wait_for(lambda: "b" in scheduler._waiting)
+        # ...which it no longer needs by the time a is done
+        b_tasks.clear()
+        a_done.set()
+        thread_a.join()
+        # b must not hold back other pools while its first task runs
+        assert wait_for(lambda: "b" not in scheduler._waiting)
+    finally:
+        a_done.set()
+        b_done.set()
+        thread_a.join()
+        thread_b.join()
+        scheduler.shutdown()
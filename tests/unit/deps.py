@@ -0,0 +1,79 @@
+from bundlewrap.deps import find_item, ItemIndex, resolve_selector
+from bundlewrap.exceptions import NoSuchItem
+from pytest import raises
+
+
+class FakeBundle:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeItem:
+    def __init__(self, item_type, name, bundle, tags=()):
+        self.ITEM_TYPE_NAME = item_type
+        self.bundle = FakeBundle(bundle)
+        self.id = f"{item_type}:{name}"
+        self.tags = set(tags)
+
+    def __repr__(self):
+        return self.id
+
+
+ITEMS = [
+    FakeItem("file", "/foo", "b1", tags={"t1"}),
+    FakeItem("file", "/bar", "b2", tags={"t1", "t2"}),
+    FakeItem("pkg_apt", "foo", "b1"),
+    FakeItem("action", "foo", "b2", tags={"t2"}),
+]
+
+
+def _ids(items):
+    return sorted(item.id for item in items)
+
+
+def test_resolve_selector_index_equivalence():
+    index = ItemIndex(ITEMS)
+    for selector in (
+        "bundle:b1",
+        "bundle:b3",
+        "!bundle:b1",
+        "tag:t1",
+        "tag:t3",
+        "!tag:t2",
+        "tag:",
+        "file:",
+        "!file:",
+        "action:",
+        "file:/bar",
+        "!file:/bar",
+    ):
+        for originating_item_id in (None, "file:/foo"):
+            assert _ids(resolve_selector(
+                selector,
+                index,
+                originating_item_id=originating_item_id,
+            )) == _ids(resolve_selector(
+                selector,
+                ITEMS,
+                originating_item_id=originating_item_id,
+            )), selector
+
+
+def test_find_item():
+    index = ItemIndex(ITEMS)
+    assert find_item("pkg_apt:foo", index) is ITEMS[2]
+    assert find_item("pkg_apt:foo", ITEMS) is ITEMS[2]
+    with raises(NoSuchItem):
+        find_item("pkg_apt:bar", index)
+    with raises(NoSuchItem):
+        find_item("pkg_apt:bar", ITEMS)
+
+
+def test_index_add():
+    item = FakeItem("pkg_apt", "bar", "b1")
+    index = ItemIndex(ITEMS)
+    index.add(item)
+    assert find_item("pkg_apt:bar", index) is item
+    item.tags.add("t3")
+    index.add_tags(item, {"t3"})
+    assert _ids(resolve_selector("tag:t3", index)) == ["pkg_apt:bar"]
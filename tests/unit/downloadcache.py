@@ -0,0 +1,107 @@
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import listdir
+from os.path import exists, join
+from threading import Thread
+
+from bundlewrap.downloadcache import DownloadCache
+
+from pytest import fixture, raises
+
+
+FILES = {
+    "/a": b"a" * 1000,
+    "/b": b"b" * 1000,
+    "/c": b"c" * 1000,
+    "/copy_of_a": b"a" * 1000,
+    "/d": b"d" * 1000,
+}
+
+
+@fixture
+def http_server():
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            if self.path not in FILES:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(FILES[self.path])))
+            self.end_headers()
+            self.wfile.write(FILES[self.path])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = "http://127.0.0.1:{}".format(server.server_address[1])
+    server.requests = requests
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_once(tmpdir, http_server):
+    cache = DownloadCache(str(tmpdir))
+    path, content_hash = cache.get(http_server.url + "/a")
+    assert content_hash == sha1(FILES["/a"]).hexdigest()
+    with open(path, 'rb') as f:
+        assert f.read() == FILES["/a"]
+    assert cache.get(http_server.url + "/a") == (path, content_hash)
+    # as if from another process
+    assert DownloadCache(str(tmpdir)).get(http_server.url + "/a") == (path, content_hash)
+    assert http_server.requests == ["/a"]
+
+
+def test_prefetch(tmpdir, http_server):
+    cache = DownloadCache(str(tmpdir))
+    cache.prefetch(http_server.url + "/a")
+    cache.prefetch(http_server.url + "/a")
+    path, content_hash = cache.get(http_server.url + "/a")
+    assert exists(path)
+    assert http_server.requests == ["/a"]
+
+
+def test_content_addressed(tmpdir, http_server):
+    cache = DownloadCache(str(tmpdir))
+    path, content_hash = cache.get(http_server.url + "/a")
+    assert DownloadCache(str(tmpdir)).get(
+        http_server.url + "/copy_of_a",
+        content_hash=content_hash,
+    ) == (path, content_hash)
+    assert http_server.requests == ["/a"]
+
+
+def test_failed_download_retried(tmpdir, http_server):
+    cache = DownloadCache(str(tmpdir))
+    for i in range(2):
+        with raises(Exception):
+            cache.get(http_server.url + "/nonexistent")
+    assert http_server.requests == ["/nonexistent", "/nonexistent"]
+    assert listdir(join(tmpdir, "objects")) == []
+    assert listdir(join(tmpdir, "tmp")) == []
+
+
+def test_eviction(tmpdir, http_server):
+    cache_a = DownloadCache(str(tmpdir))
+    cache_a.get(http_server.url + "/a")
+    cache_b = DownloadCache(str(tmpdir))
+    cache_b.get(http_server.url + "/b")
+    DownloadCache(str(tmpdir), max_size=2500).get(http_server.url + "/c")
+    # /a and /b are still in use by the other instances
+    assert len(listdir(join(tmpdir, "objects"))) == 3
+    del cache_a, cache_b
+
+    cache = DownloadCache(str(tmpdir), max_size=2500)
+    cache.get(http_server.url + "/b")
+    cache.get(http_server.url + "/d")
+    # /a and /c are the least recently used and no longer in use
+    assert sorted(listdir(join(tmpdir, "objects"))) == sorted([
+        sha1(FILES["/b"]).hexdigest(),
+        sha1(FILES["/d"]).hexdigest(),
+    ])
@@ -0,0 +1,126 @@
+from re import compile
+
+from bundlewrap.exceptions import RepositoryError
+from bundlewrap.group import _combine_patterns, Group
+from bundlewrap.node import _flatten_group_hierarchy, Node
+from bundlewrap.repo import Repository
+from bundlewrap.utils import names
+
+from pytest import raises
+
+
+def _repo(groups, nodes):
+    repo = Repository()
+    for group_name, attributes in groups.items():
+        repo.add_group(Group(group_name, attributes))
+    for node_name, attributes in nodes.items():
+        repo.add_node(Node(node_name, attributes))
+    return repo
+
+
+def test_combine_patterns():
+    combined = _combine_patterns([compile("^a"), compile("b$")])
+    assert combined.search("ax")
+    assert combined.search("xb")
+    assert not combined.search("xa")
+
+
+def test_combine_patterns_uncombinable():
+    assert _combine_patterns([]) is None
+    assert _combine_patterns([compile(r"(a)\1"), compile("b")]) is None
+    assert _combine_patterns([compile("(?P<x>a)"), compile("(?P<x>b)")]) is None
+
+
+def test_membership():
+    repo = _repo(
+        groups={
+            "all": {'subgroups': ["web", "db"]},
+            "web": {'member_patterns': [r"^web\d+$"], 'subgroups': ["lb"]},
+            "lb": {'members': ["lb1"]},
+            "db": {'member_patterns': [r"(a)\1", "^db"]},
+            "empty": {},
+        },
+        nodes={
+            "web1": {},
+            "lb1": {},
+            "db1": {},
+            "aa": {},
+            "other": {'groups': ["empty"]},
+        },
+    )
+    assert set(names(repo.get_node("web1").groups)) == {"all", "web"}
+    assert set(names(repo.get_node("lb1").groups)) == {"all", "lb", "web"}
+    assert set(names(repo.get_node("lb1").immediate_groups)) == {"lb"}
+    assert set(names(repo.get_node("aa").groups)) == {"all", "db"}
+    assert set(names(repo.get_node("other").groups)) == {"empty"}
+    assert repo.get_node("db1").in_group("db")
+    assert not repo.get_node("db1").in_group("web")
+    assert not repo.get_node("db1").in_group("nonexistent")
+
+    assert set(names(repo.get_group("all").nodes)) == {"aa", "db1", "lb1", "web1"}
+    assert set(names(repo.get_group("all").subgroups)) == {"db", "lb", "web"}
+    assert set(names(repo.get_group("lb").parent_groups)) == {"all", "web"}
+    assert set(names(repo.get_group("lb").immediate_parent_groups)) == {"web"}
+    assert set(names(repo.get_group("empty").nodes)) == {"other"}
+
+
+def test_membership_after_adding_node():
+    repo = _repo(groups={"web": {'member_patterns': ["^web"]}}, nodes={"web1": {}})
+    assert list(names(repo.nodes_in_group("web"))) == ["web1"]
+    repo.add_node(Node("web2", {}))
+    assert set(names(repo.get_node("web2").groups)) == {"web"}
+
+
+def test_subgroup_loop():
+    repo = _repo(
+        groups={
+            "a": {'subgroups': ["b"]},
+            "b": {'subgroups': ["c"]},
+            "c": {'subgroups': ["a"]},
+        },
+        nodes={},
+    )
+    with raises(RepositoryError):
+        repo.get_group("a").subgroups
+
+
+def test_missing_group():
+    repo = _repo(groups={}, nodes={"node1": {'groups': ["nope"]}})
+    with raises(RepositoryError):
+        repo.get_node("node1").groups
+
+
+def test_group_order():
+    repo = _repo(
+        groups={
+            "z": {'subgroups': ["b"]},
+            "a": {'subgroups': ["c"]},
+            "b": {'subgroups': ["c"]},
+            "c": {},
+        },
+        nodes={"node1": {'groups': ["c"]}},
+    )
+    node = repo.get_node("node1")
+    assert _flatten_group_hierarchy(node.groups) == ["a", "z", "b", "c"]
+    # memoized per set of groups
+    _flatten_group_hierarchy(repo.get_group("c").parent_groups | {repo.get_group("c")})
+    assert len(repo._group_membership._order) == 1
+
+
+def test_group_attributes():
+    repo = _repo(
+        groups={
+            "all": {'subgroups': ["web"], 'os': "debian", 'username': "foo"},
+            "web": {'os': "ubuntu"},
+        },
+        nodes={
+            "node1": {'groups': ["web"]},
+            "node2": {'groups': ["web"], 'username': "bar"},
+            "node3": {},
+        },
+    )
+    assert repo.get_node("node1").os == "ubuntu"
+    assert repo.get_node("node1").username == "foo"
+    assert repo.get_node("node2").username == "bar"
+    assert repo.get_node("node3").os == "linux"
+    assert repo.get_node("node1")._group_attributes is repo.get_node("node2")._group_attributes
@@ -0,0 +1,84 @@
+from bundlewrap import itemqueue
+from bundlewrap.itemqueue import ItemQueue, ItemTestQueue
+from pytest import raises
+
+
+class FakeBundle:
+    name = "bundle"
+
+
+class FakeItem:
+    ITEM_TYPE_NAME = "action"
+
+    def __init__(self, name, after=(), needs=(), cascade_skip=True):
+        self.bundle = FakeBundle()
+        self.cascade_skip = cascade_skip
+        self.id = f"action:{name}"
+        self.tags = set()
+        self.triggers = set()
+        self._deps_needs = set(needs)
+        self._deps_needed_by = set()
+        self._deps = set(after) | set(needs)
+
+    def __repr__(self):
+        return self.id
+
+
+def _queue(monkeypatch, queue_class, items):
+    monkeypatch.setattr(itemqueue, 'prepare_dependencies', lambda node: set(items))
+    return queue_class(None)
+
+
+def test_item_ok_frees_dependents(monkeypatch):
+    a = FakeItem("a")
+    b = FakeItem("b", after={a})
+    c = FakeItem("c", needs={a, b})
+    queue = _queue(monkeypatch, ItemQueue, [a, b, c])
+    assert queue.pop() is a
+    with raises(KeyError):
+        queue.pop()
+    queue.item_ok(a)
+    assert queue.pop() is b
+    queue.item_ok(b)
+    assert queue.pop() is c
+    queue.item_ok(c)
+    assert not queue.all_items
+    assert not queue.pending_items
+
+
+def test_item_skipped_cascades(monkeypatch):
+    a = FakeItem("a")
+    b = FakeItem("b", needs={a})
+    c = FakeItem("c", needs={b})
+    d = FakeItem("d", after={a})
+    e = FakeItem("e", needs={b}, cascade_skip=False)
+    f = FakeItem("f", needs={e})
+    queue = _queue(monkeypatch, ItemQueue, [a, b, c, d, e, f])
+    assert queue.pop() is a
+    assert set(queue.item_failed(a)) == {b, c, e}
+    # d only runs after a, f needs e, which doesn't cascade
+    assert queue.items_without_deps == {d, f}
+    assert not queue.items_with_deps
+
+
+def test_dependents(monkeypatch):
+    a = FakeItem("a")
+    b = FakeItem("b", after={a})
+    c = FakeItem("c", needs={b})
+    d = FakeItem("d")
+    queue = _queue(monkeypatch, ItemQueue, [a, b, c, d])
+    assert queue.dependents(a) == {b, c}
+    assert queue.dependents(c) == set()
+
+
+def test_test_queue_loop(monkeypatch):
+    a = FakeItem("a")
+    b = FakeItem("b", after={a})
+    c = FakeItem("c")
+    d = FakeItem("d", needs={c})
+    c._deps.add(d)
+    queue = _queue(monkeypatch, ItemTestQueue, [a, b, c, d])
+    assert {queue.pop(), queue.pop()} == {a, b}
+    with raises(KeyError):
+        queue.pop()
+    assert queue.items_with_deps == {c, d}
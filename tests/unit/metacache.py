@@ -0,0 +1,15 @@
+from bundlewrap.metacache import make_cache_dir
+
+
+def test_make_cache_dir(tmpdir):
+    path = make_cache_dir(str(tmpdir), "foo", "bar")
+    assert path == str(tmpdir.join(".cache", "foo", "bar"))
+    assert tmpdir.join(".cache", "foo", "bar").isdir()
+    assert tmpdir.join(".cache", ".gitignore").read() == "*\n"
+
+
+def test_make_cache_dir_keeps_gitignore(tmpdir):
+    tmpdir.join(".cache").mkdir()
+    tmpdir.join(".cache", ".gitignore").write("custom\n")
+    make_cache_dir(str(tmpdir), "foo")
+    assert tmpdir.join(".cache", ".gitignore").read() == "custom\n"
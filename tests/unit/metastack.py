@@ -236,3 +236,72 @@ def test_as_blame():
         ('something', 'a_value'): ['base'],
         ('something', 'another_value'): ['unrelated'],
     }
+
+
+def test_get_after_set_layer():
+    stack = Metastack()
+    stack.set_layer(0, 'base', {'something': {'a': 1}})
+    stack.set_layer(1, 'reactor', {'something': {'b': 2}, 'other': 1})
+    assert stack.get(('something',)) == {'a': 1, 'b': 2}
+    assert stack.get(()) == {'something': {'a': 1, 'b': 2}, 'other': 1}
+    stack.set_layer(1, 'reactor', {'something': {'b': 3}, 'other': 1})
+    assert stack.get(('something',)) == {'a': 1, 'b': 3}
+    assert stack.get(()) == {'something': {'a': 1, 'b': 3}, 'other': 1}
+    stack.pop_layer(1, 'reactor')
+    assert stack.get(('something',)) == {'a': 1}
+    with raises(KeyError):
+        stack.get(('other',))
+
+
+def test_get_after_set_layer_atomic():
+    stack = Metastack()
+    stack.set_layer(2, 'defaults', {'something': [1]})
+    stack.set_layer(1, 'reactor', {'something': [2]})
+    assert stack.get(('something',)) == [1, 2]
+    stack.set_layer(1, 'reactor', {'something': atomic([2])})
+    assert stack.get(('something',)) == [2]
+
+
+def test_get_returns_copy():
+    stack = Metastack()
+    stack.set_layer(0, 'base', {'something': {'a_list': [1]}})
+    stack.get(('something', 'a_list')).append(2)
+    stack.get(('something',))['foo'] = 'bar'
+    assert stack.get(('something',)) == {'a_list': [1]}
+
+
+def test_set_layer_copies():
+    stack = Metastack()
+    layer = {'something': {'a_list': [1]}}
+    stack.set_layer(0, 'base', layer)
+    assert stack.get(('something', 'a_list')) == [1]
+    layer['something']['a_list'].append(2)
+    assert stack.get(('something', 'a_list')) == [1]
+
+
+def test_get_cost_independent_of_layers(monkeypatch):
+    from bundlewrap.utils import metastack
+
+    lookups = []
+    original_value_at_key_path = metastack.value_at_key_path
+
+    def counting_value_at_key_path(*args):
+        lookups.append(args)
+        return original_value_at_key_path(*args)
+
+    monkeypatch.setattr(metastack, 'value_at_key_path', counting_value_at_key_path)
+
+    stack = Metastack()
+    for i in range(100):
+        stack.set_layer(1, f'reactor{i}', {'something': {f'key{i}': i}})
+
+    assert len(stack.get(('something',))) == 100
+    assert len(lookups) == 100
+    for i in range(1000):
+        stack.get(('something',))
+    assert len(lookups) == 100
+
+    # only paths below the changed key are merged again
+    stack.set_layer(1, 'reactor0', {'something': {'key0': -1}})
+    assert stack.get(('something', 'key0')) == -1
+    assert len(lookups) == 200
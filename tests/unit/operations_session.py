@@ -0,0 +1,99 @@
+from bundlewrap import operations
+from bundlewrap.exceptions import TransportException
+from bundlewrap.operations import SSHSession
+
+from pytest import fixture, raises
+
+
+@fixture
+def session():
+    # no need for SSH, a local shell speaks the same protocol
+    session = SSHSession(["sh"])
+    assert session.start()
+    yield session
+    session.close()
+
+
+def test_run(session):
+    result = session.run("echo foo; echo bar >&2")
+    assert result.return_code == 0
+    assert result.stdout == b"foo\n"
+    assert result.stderr == b"bar\n"
+
+
+def test_return_code(session):
+    assert session.run("exit 47").return_code == 47
+    # session must survive the command exiting
+    assert session.run("true").return_code == 0
+
+
+def test_binary_stdout(session):
+    result = session.run("printf 'a\\000b\\377'")
+    assert result.stdout == b"a\x00b\xff"
+
+
+def test_data_stdin(session):
+    data = bytes(range(256)) * 4
+    result = session.run("cat", data_stdin=data)
+    assert result.stdout == data
+
+
+def test_no_stdin(session):
+    # must not consume the script the session is reading
+    result = session.run("cat")
+    assert result.stdout == b""
+    assert session.run("echo ok").stdout == b"ok\n"
+
+
+def test_multiline_and_broken_quoting(session):
+    assert session.run("echo 'a\nb'").stdout == b"a\nb\n"
+    assert session.run("echo 'unterminated").return_code != 0
+    assert session.run("echo still alive").stdout == b"still alive\n"
+
+
+def test_start_failure():
+    assert not SSHSession(["false"]).start()
+
+
+def test_session_died():
+    session = SSHSession(["sh"])
+    assert session.start()
+    with raises(TransportException):
+        session.run("kill -9 $PPID")
+    assert session.broken
+    session.close()
+
+
+def test_session_died_while_idle():
+    session = SSHSession(["sh"])
+    assert session.start()
+    # e.g. sshd closing the connection after ClientAliveInterval
+    session._process.kill()
+    session._process.wait()
+    assert session.run("true") is None
+    assert session.broken
+    session.close()
+
+
+def test_run_falls_back_when_idle_session_died(monkeypatch):
+    monkeypatch.setenv("BW_SSH_SESSIONS", "1")
+    monkeypatch.setattr(operations, 'SSH_SESSIONS', {})
+    # no need for SSH, `sh -c` runs commands just like it would
+    monkeypatch.setattr(operations, '_ssh_command', lambda *args, **kwargs: ["sh", "-c"])
+    run_kwargs = {'wrapper_outer': "sh -c {}"}
+
+    assert operations.run("node1", "echo foo", **run_kwargs).stdout == b"foo\n"
+    pool = operations.SSH_SESSIONS[("node1", False, None)]
+    session, = pool['idle']
+    session._process.kill()
+    session._process.wait()
+
+    assert operations.run("node1", "echo bar", **run_kwargs).stdout == b"bar\n"
+    assert session.broken
+    assert not pool['idle']
+
+    # a new session replaces the dead one
+    assert operations.run("node1", "echo baz", **run_kwargs).stdout == b"baz\n"
+    assert len(pool['idle']) == 1
+    assert pool['idle'][0] is not session
+    operations.close_ssh_sessions()
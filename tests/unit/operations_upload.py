@@ -0,0 +1,142 @@
+from grp import getgrgid
+from os import getgid, getuid, mkdir, stat
+from os.path import join
+from pwd import getpwuid
+from re import sub
+
+from bundlewrap import operations
+from bundlewrap.operations import run_local, SSH_SESSION_MAX_STDIN, upload, upload_multiple
+
+from pytest import fixture
+
+
+@fixture
+def commands(monkeypatch):
+    # no need for SSH, run the upload commands in a local shell
+    commands = []
+
+    def run(hostname, command, data_stdin=None, **kwargs):
+        commands.append(command)
+        return run_local(["sh", "-c", command], data_stdin=data_stdin)
+
+    monkeypatch.setattr(operations, "run", run)
+    return commands
+
+
+def _write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_upload(tmpdir, commands):
+    local_path = join(str(tmpdir), "local")
+    remote_path = join(str(tmpdir), "remote")
+    _write(local_path, b"foo\x00bar")
+    _write(remote_path, b"old")
+
+    assert upload(
+        "localhost",
+        local_path,
+        remote_path,
+        group=getgrgid(getgid()).gr_name,
+        mode="0640",
+        owner=getpwuid(getuid()).pw_name,
+    )
+    assert len(commands) == 1
+    assert _read(remote_path) == b"foo\x00bar"
+    assert oct(stat(remote_path).st_mode & 0o7777) == "0o640"
+    assert sorted(tmpdir.listdir()) == sorted([tmpdir.join("local"), tmpdir.join("remote")])
+
+
+def test_upload_failure(tmpdir, commands):
+    local_path = join(str(tmpdir), "local")
+    _write(local_path, b"foo")
+
+    assert not upload(
+        "localhost",
+        local_path,
+        join(str(tmpdir), "remote"),
+        mode="not a mode",
+        ignore_failure=True,
+    )
+    # temporary file has been cleaned up
+    assert tmpdir.listdir() == [tmpdir.join("local")]
+
+
+def test_upload_temp_mode(tmpdir, monkeypatch):
+    modes_path = join(str(tmpdir), "modes")
+
+    def run(hostname, command, data_stdin=None, **kwargs):
+        # record the mode of each temporary file just before it is
+        # chmodded, starting from a permissive umask
+        command = sub(
+            r"chmod (\S+) (\S+) ",
+            r"stat -c %a \2 >> {} && chmod \1 \2 ".format(modes_path),
+            command,
+        )
+        return run_local(["sh", "-c", "umask 022; " + command], data_stdin=data_stdin)
+
+    monkeypatch.setattr(operations, "run", run)
+    local_path = join(str(tmpdir), "local")
+    _write(local_path, b"secret")
+
+    assert upload("localhost", local_path, join(str(tmpdir), "remote1"))
+    assert upload_multiple(
+        "localhost",
+        [{'local_path': local_path, 'remote_path': join(str(tmpdir), "remote2")}],
+    )
+    assert _read(modes_path) == b"600\n600\n"
+    # without an explicit mode, uploads end up with the usual default
+    for name in ("remote1", "remote2"):
+        assert oct(stat(join(str(tmpdir), name)).st_mode & 0o7777) == "0o644"
+
+
+def test_upload_large(tmpdir, commands):
+    local_path = join(str(tmpdir), "local")
+    remote_path = join(str(tmpdir), "remote")
+    content = b"x" * (SSH_SESSION_MAX_STDIN * 4 + 1)
+    _write(local_path, content)
+
+    assert upload("localhost", local_path, remote_path)
+    assert _read(remote_path) == content
+
+
+def test_upload_missing_dir(tmpdir, commands):
+    local_path = join(str(tmpdir), "local")
+    _write(local_path, b"foo")
+    remote_path = join(str(tmpdir), "missing", "remote")
+
+    assert not upload("localhost", local_path, remote_path, ignore_failure=True)
+    assert not upload_multiple(
+        "localhost",
+        [{'local_path': local_path, 'remote_path': remote_path}],
+        ignore_failure=True,
+    )
+    assert tmpdir.listdir() == [tmpdir.join("local")]
+
+
+def test_upload_multiple(tmpdir, commands):
+    mkdir(join(str(tmpdir), "sub"))
+    uploads = []
+    for i in range(10):
+        local_path = join(str(tmpdir), f"local{i}")
+        # one of them is too large to fit into a pipe buffer
+        _write(local_path, f"content {i}".encode() * (100000 if i == 5 else 1))
+        uploads.append({
+            'local_path': local_path,
+            'remote_path': join(str(tmpdir), "sub", f"remote{i}"),
+            'mode': "0600" if i % 2 else "0644",
+        })
+
+    assert upload_multiple("localhost", uploads)
+    assert len(commands) == 1
+    for i in range(10):
+        remote_path = join(str(tmpdir), "sub", f"remote{i}")
+        assert _read(remote_path) == f"content {i}".encode() * (100000 if i == 5 else 1)
+        assert oct(stat(remote_path).st_mode & 0o777) == ("0o600" if i % 2 else "0o644")
+    assert len(tmpdir.join("sub").listdir()) == 10
@@ -0,0 +1,165 @@
+from re import match
+from shlex import split
+
+from bundlewrap.exceptions import RemoteException
+from bundlewrap.items import Item
+from bundlewrap.operations import RunResult
+from bundlewrap.repo import Repository
+from bundlewrap.utils.testing import apply_sequentially, make_repo
+
+
+class FakeApt:
+    def __init__(self, installed=(), broken=(), ghosts=()):
+        self.broken = set(broken)
+        self.commands = []
+        # installed without complaint, but never show up as installed
+        self.ghosts = set(ghosts)
+        self.installed = set(installed)
+
+    def run(self, command, may_fail=False, **kwargs):
+        self.commands.append(command)
+        result = RunResult()
+        result.return_code = 0
+        result.stderr = b""
+        stdout = ""
+        if command == "true":
+            pass
+        elif command.startswith("dpkg -l"):
+            stdout = "".join(f"ii  {pkg}  1.0  all  desc\n" for pkg in sorted(self.installed))
+        elif command.startswith("for pkg in "):
+            pkgs = split(match(r"for pkg in (.*?); do", command).group(1))
+            stdout = "".join(f"{pkg}\n" for pkg in pkgs if pkg in self.installed)
+        elif " install " in command or " purge " in command:
+            pkgs = command.split(" install " if " install " in command else " purge ", 1)[1]
+            pkgs = set(split(pkgs))
+            if pkgs & self.broken:
+                # apt gives up on the whole transaction
+                result.return_code = 100
+                if not may_fail:
+                    raise RemoteException(command)
+            elif " install " in command:
+                self.installed.update(pkgs - self.ghosts)
+            else:
+                self.installed.difference_update(pkgs)
+        else:
+            raise AssertionError(f"unexpected command: {command}")
+        result.stdout = stdout.encode()
+        return result
+
+
+def test_coalesced_install(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'pkg_apt': {
+                        "a": {},
+                        "b": {},
+                        "c": {'after': {"action:x"}},
+                        "d": {'installed': False},
+                        "e": {},
+                    },
+                    'actions': {
+                        "x": {'command': "true", 'needs': {"pkg_apt:a"}},
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    apt = FakeApt(installed={"d", "e"})
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', apt.run)
+
+    results = apply_sequentially(node)
+
+    assert apt.installed == {"a", "b", "c", "e"}
+    # c has to wait for an item that can only be applied after a
+    install_commands = [c for c in apt.commands if " install " in c]
+    assert len(install_commands) == 2
+    assert install_commands[0].endswith(" install a b")
+    assert install_commands[1].endswith(" install c")
+    assert results["pkg_apt:a"] == Item.STATUS_FIXED
+    assert results["pkg_apt:b"] == Item.STATUS_FIXED
+    assert results["pkg_apt:c"] == Item.STATUS_FIXED
+    assert results["pkg_apt:d"] == Item.STATUS_FIXED
+    assert results["pkg_apt:e"] == Item.STATUS_OK
+    # packages missing from `dpkg -l` have been probed in one go
+    probe_commands = [c for c in apt.commands if c.startswith("for pkg in ")]
+    assert set(split(match(r"for pkg in (.*?); do", probe_commands[0]).group(1))) >= \
+        {"a", "b", "c"}
+
+
+def test_broken_package_in_transaction(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'pkg_apt': {
+                        "a": {},
+                        "broken": {},
+                        "c": {'installed': False},
+                        "d": {'installed': False},
+                        "e": {'installed': False},
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    apt = FakeApt(installed={"c", "d", "e"}, broken={"broken", "e"})
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', apt.run)
+
+    results = apply_sequentially(node)
+
+    # the good packages have been retried on their own
+    assert apt.installed == {"a", "e"}
+    assert results["pkg_apt:a"] == Item.STATUS_FIXED
+    assert results["pkg_apt:broken"] == Item.STATUS_FAILED
+    assert results["pkg_apt:c"] == Item.STATUS_FIXED
+    assert results["pkg_apt:d"] == Item.STATUS_FIXED
+    assert results["pkg_apt:e"] == Item.STATUS_FAILED
+
+
+def test_no_batch_with_dependencies(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'pkg_apt': {
+                        "a": {},
+                        "b": {'needs': {"pkg_apt:ghost"}},
+                        "c": {'needs': {"pkg_apt:a"}},
+                        "ghost": {},
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    apt = FakeApt(installed={"z"}, ghosts={"ghost"})
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', apt.run)
+
+    results = apply_sequentially(node)
+
+    install_commands = [c for c in apt.commands if " install " in c]
+    assert install_commands[0].endswith(" install a ghost")
+    # b must not be installed along with ghost, which it needs
+    for command in install_commands:
+        assert "b" not in split(command.rsplit(" install ", 1)[1])
+    assert apt.installed == {"a", "c", "z"}
+    assert results["pkg_apt:a"] == Item.STATUS_FIXED
+    assert results["pkg_apt:b"] == Item.STATUS_SKIPPED
+    assert results["pkg_apt:c"] == Item.STATUS_FIXED
+    assert results["pkg_apt:ghost"] == Item.STATUS_FAILED
@@ -0,0 +1,131 @@
+from json import dumps
+from re import fullmatch
+
+from bundlewrap.exceptions import RemoteException
+from bundlewrap.items import Item
+from bundlewrap.items.postgres_dbs import create_db_statement
+from bundlewrap.operations import RunResult
+from bundlewrap.repo import Repository
+from bundlewrap.utils.testing import apply_sequentially, make_repo
+
+
+class FakePostgres:
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+        self.databases = {"postgres": {'owner': "postgres"}}
+        self.roles = {"postgres": {'can_login': True, 'superuser': True, 'password_hash': ""}}
+        self.sessions = []
+
+    def run(self, command, data_stdin=None, may_fail=False, user="root", **kwargs):
+        assert user == "postgres"
+        result = RunResult()
+        result.return_code = 0
+        result.stderr = b""
+        result.stdout = b""
+        if command == "psql -AnqtwX":
+            result.stdout = dumps({'databases': self.databases, 'roles': self.roles}).encode()
+            return result
+        assert command == "psql -nqwX -v ON_ERROR_STOP=1"
+        statements = data_stdin.decode().splitlines()
+        self.sessions.append(statements)
+        for statement in statements:
+            if any(f'"{name}"' in statement for name in self.broken):
+                # ON_ERROR_STOP
+                result.return_code = 3
+                if not may_fail:
+                    raise RemoteException(statement)
+                return result
+            match = fullmatch(r'CREATE DATABASE "(.*)" OWNER "(.*)";', statement)
+            if match:
+                self.databases[match.group(1)] = {'owner': match.group(2)}
+                continue
+            match = fullmatch(
+                r'CREATE ROLE "(.*)" WITH LOGIN (NO)?SUPERUSER PASSWORD \'(.*)\';',
+                statement,
+            )
+            if match:
+                self.roles[match.group(1)] = {
+                    'can_login': True,
+                    'superuser': not match.group(2),
+                    'password_hash': match.group(3),
+                }
+                continue
+            raise AssertionError(f"unexpected statement: {statement}")
+        return result
+
+
+def test_create_db_statement():
+    assert create_db_statement("my\"db", "me", {'encoding': "UTF8"}) == \
+        "CREATE DATABASE \"my\"\"db\" OWNER \"me\" ENCODING 'UTF8' TEMPLATE template0"
+
+
+def test_batched(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'postgres_dbs': {
+                        "db1": {'owner': "app"},
+                        "db2": {'owner': "app"},
+                        "postgres": {},
+                    },
+                    'postgres_roles': {
+                        "app": {'password_hash': "md5foo"},
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    fake_postgres = FakePostgres()
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', fake_postgres.run)
+
+    results = apply_sequentially(node)
+
+    assert results == {
+        "postgres_db:db1": Item.STATUS_FIXED,
+        "postgres_db:db2": Item.STATUS_FIXED,
+        "postgres_db:postgres": Item.STATUS_OK,
+        "postgres_role:app": Item.STATUS_FIXED,
+    }
+    assert fake_postgres.sessions == [[
+        "CREATE ROLE \"app\" WITH LOGIN NOSUPERUSER PASSWORD 'md5foo';",
+        "CREATE DATABASE \"db1\" OWNER \"app\";",
+        "CREATE DATABASE \"db2\" OWNER \"app\";",
+    ]]
+
+
+def test_batch_failed(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'postgres_dbs': {
+                        "db1": {'owner': "app"},
+                        "db2": {'owner': "app"},
+                    },
+                    'postgres_roles': {
+                        "app": {'password_hash': "md5foo"},
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    fake_postgres = FakePostgres(broken={"app"})
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', fake_postgres.run)
+
+    assert apply_sequentially(node) == {
+        "postgres_db:db1": Item.STATUS_SKIPPED,
+        "postgres_db:db2": Item.STATUS_SKIPPED,
+        "postgres_role:app": Item.STATUS_FAILED,
+    }
+    assert set(fake_postgres.databases) == {"postgres"}
@@ -0,0 +1,62 @@
+from os import listdir
+from os.path import join
+
+from bundlewrap import items
+from bundlewrap.exceptions import MissingRepoDependency
+from bundlewrap.repo import check_requirements, Repository
+
+from pytest import raises
+
+
+def test_builtin_item_types_manifest():
+    repo = Repository()
+    found = {}
+    for filename in listdir(items.__path__[0]):
+        if not filename.endswith(".py") or filename.startswith("_"):
+            continue
+        for item_class in repo.items_from_file(join(items.__path__[0], filename)):
+            if item_class.BUNDLE_ATTRIBUTE_NAME is not None:
+                found[item_class.BUNDLE_ATTRIBUTE_NAME] = filename
+    assert found == items.BUILTIN_ITEM_TYPES
+
+
+def test_item_class_loaded_on_demand():
+    repo = Repository()
+    assert repo._item_classes == {}
+    item_class = repo.item_class('k8s_namespaces')
+    assert item_class.ITEM_TYPE_NAME == "k8s_namespace"
+    assert 'files' not in repo._item_classes
+    # the same file defines all the other k8s_* item types
+    assert 'k8s_secrets' in repo._item_classes
+    assert repo.item_class('k8s_namespaces') is item_class
+
+
+def test_item_class_unknown():
+    with raises(KeyError):
+        Repository().item_class('nonexistent')
+
+
+def test_check_requirements():
+    check_requirements([
+        "# comment\n",
+        "\n",
+        "bundlewrap\n",
+        "bundlewrap >= 1.0, < 9999 # comment\n",
+        "bundlewrap>=1.0.0.dev1\n",
+        "bundlewrap~=1.0 ; python_version < '3'\n",
+        "Bundlewrap[foo]>0.1\n",
+    ])
+
+
+def test_check_requirements_missing():
+    with raises(MissingRepoDependency):
+        check_requirements(["bundlewrap-nonexistent-package\n"])
+
+
+def test_check_requirements_version_conflict():
+    with raises(MissingRepoDependency):
+        check_requirements(["bundlewrap>=9999\n"])
+    with raises(MissingRepoDependency):
+        check_requirements(["bundlewrap==1.0\n"])
+    with raises(MissingRepoDependency):
+        check_requirements(["bundlewrap~=1.0\n"])
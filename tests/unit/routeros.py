@@ -0,0 +1,160 @@
+from functools import partial
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Thread
+
+import librouteros
+from librouteros.protocol import decode_length, determine_length, encode_sentence
+
+from bundlewrap import operations
+from bundlewrap.items import ItemRun
+from bundlewrap.repo import Repository
+from bundlewrap.utils.testing import make_repo
+
+from pytest import fixture
+
+
+class FakeRouterOS(StreamRequestHandler):
+    def _read_sentence(self):
+        words = []
+        while True:
+            length = self.rfile.read(1)
+            if not length:
+                return None
+            length += self.rfile.read(determine_length(length))
+            length = decode_length(length)
+            if not length:
+                return words
+            words.append(self.rfile.read(length).decode())
+
+    def _reply(self, *words):
+        self.wfile.write(encode_sentence(*words, encoding="ASCII"))
+
+    def handle(self):
+        tables = self.server.tables
+        while True:
+            sentence = self._read_sentence()
+            if sentence is None:
+                return
+            command, words = sentence[0], sentence[1:]
+            self.server.sentences.append(sentence)
+            tag = [word for word in words if word.startswith(".tag=")]
+            attributes = dict(
+                word[1:].split("=", 1) for word in words if word.startswith("=")
+            )
+            path, action = command.rsplit("/", 1)
+            rows = tables.setdefault(path, [])
+            if action == "print":
+                conditions = [word[2:].split("=", 1) for word in words if word.startswith("?=")]
+                for row in rows:
+                    if all(row.get(key) == value for key, value in conditions):
+                        self._reply("!re", *[f"={key}={value}" for key, value in row.items()], *tag)
+            elif action == "add":
+                self.server.next_id += 1
+                attributes['.id'] = "*{:X}".format(self.server.next_id)
+                rows.append(attributes)
+                self._reply("!done", "=ret=" + attributes['.id'], *tag)
+                continue
+            elif action == "set":
+                if attributes.get('disabled') == "maybe":
+                    self._reply("!trap", "=message=invalid value", *tag)
+                else:
+                    for row in rows:
+                        if row['.id'] == attributes.get('.id', row['.id']):
+                            row.update(attributes)
+            elif command not in ("/login", "/nothing"):
+                self._reply("!trap", "=message=no such command", *tag)
+            self._reply("!done", *tag)
+
+
+@fixture
+def routeros_server(monkeypatch):
+    server = ThreadingTCPServer(("127.0.0.1", 0), FakeRouterOS)
+    server.daemon_threads = True
+    server.next_id = 0
+    server.sentences = []
+    server.tables = {
+        "/interface/vlan": [
+            {'.id': "*1", 'name': "vlan1", 'vlan-id': "1", 'disabled': "false"},
+        ],
+    }
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(librouteros, 'connect', partial(
+        librouteros.connect,
+        port=server.server_address[1],
+    ))
+    monkeypatch.setattr(operations, 'ROUTEROS_CONNECTIONS', {})
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _node(tmpdir, items):
+    make_repo(
+        tmpdir,
+        bundles={"test": {'items': {'routeros': items}}},
+        nodes={
+            "switch": {
+                'bundles': ["test"],
+                'hostname': "127.0.0.1",
+                'os': "routeros",
+                'username': "admin",
+            },
+        },
+    )
+    return Repository(str(tmpdir)).get_node("switch")
+
+
+def test_print_cached(tmpdir, routeros_server):
+    node = _node(tmpdir, {
+        "/interface/vlan?name=vlan1": {'vlan-id': 1, 'disabled': False},
+        "/interface/vlan?name=vlan2": {'vlan-id': 2},
+    })
+    items = {item.id: item for item in node.items}
+    for cached in (True, False):
+        with ItemRun(node, None, {}):
+            assert items["routeros:/interface/vlan?name=vlan1"].get_status(
+                cached=cached,
+            ).correct
+            assert items["routeros:/interface/vlan?name=vlan2"].get_status(
+                cached=cached,
+            ).must_be_created
+    # once per run
+    assert [sentence[0] for sentence in routeros_server.sentences] == [
+        "/login",
+        "/interface/vlan/print",
+        "/interface/vlan/print",
+    ]
+
+
+def test_writes_pipelined(tmpdir, routeros_server):
+    node = _node(tmpdir, {
+        f"/interface/vlan?name=vlan{i}": {'vlan-id': i} for i in range(1, 21)
+    })
+
+    results = node.apply(interactive=False, workers=1)
+
+    assert (results.correct, results.fixed, results.failed) == (1, 19, 0)
+    assert node._item_run is None
+    assert sorted(row['name'] for row in routeros_server.tables["/interface/vlan"]) == \
+        sorted(f"vlan{i}" for i in range(1, 21))
+    commands = [sentence[0] for sentence in routeros_server.sentences]
+    assert commands.count("/interface/vlan/add") == 19
+    # before and after the batch
+    assert commands.count("/interface/vlan/print") == 2
+    for sentence in routeros_server.sentences:
+        if sentence[0] == "/interface/vlan/add":
+            assert sentence[-1].startswith(".tag=")
+
+
+def test_failed_write(tmpdir, routeros_server):
+    node = _node(tmpdir, {
+        "/interface/vlan?name=vlan1": {'disabled': "maybe"},
+        "/interface/vlan?name=vlan2": {'vlan-id': 2},
+    })
+
+    results = node.apply(interactive=False, workers=1)
+
+    assert (results.correct, results.fixed, results.failed) == (0, 1, 1)
+    assert {row['name'] for row in routeros_server.tables["/interface/vlan"]} == \
+        {"vlan1", "vlan2"}
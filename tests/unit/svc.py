@@ -0,0 +1,140 @@
+from shlex import split
+
+from bundlewrap.items import Item
+from bundlewrap.items.svc import svc_run_multiple
+from bundlewrap.operations import run_local, RunResult
+from bundlewrap.repo import Repository
+from bundlewrap.utils.testing import make_repo
+
+
+class FakeNode:
+    def run(self, command, may_fail=False):
+        return run_local(["sh", "-c", command])
+
+
+class FakeSystemd:
+    def __init__(self):
+        self.commands = []
+        self.running = {"a.service"}
+        self.enabled = {"a.service", "c.service"}
+        # SysV init scripts wrapped by systemd
+        self.sysv = set()
+
+    def run(self, command, may_fail=False, **kwargs):
+        self.commands.append(command)
+        args = split(command)
+        result = RunResult()
+        result.return_code = 0
+        result.stderr = b""
+        stdout = ""
+        unit = args[-1] + ".service"
+        if args[1] == "show":
+            stdout = "\n\n".join(
+                "Id={}.service\nActiveState={}\nUnitFileState={}".format(
+                    name,
+                    "active" if name + ".service" in self.running else "inactive",
+                    "generated" if name + ".service" in self.sysv else
+                    "enabled" if name + ".service" in self.enabled else "disabled",
+                )
+                for name in args[args.index("--") + 1:]
+            ) + "\n"
+        elif args[1] == "status":
+            result.return_code = 0 if unit in self.running else 3
+        elif args[1] == "is-enabled":
+            stdout = "enabled\n" if unit in self.enabled else "disabled\n"
+            result.return_code = 0 if unit in self.enabled else 1
+        elif args[1] == "start":
+            self.running.add(unit)
+        elif args[1] == "enable":
+            self.enabled.add(unit)
+        elif args[1] == "disable":
+            self.enabled.discard(unit)
+        else:
+            raise AssertionError(f"unexpected command: {command}")
+        result.stdout = stdout.encode()
+        return result
+
+
+def test_svc_run_multiple():
+    assert svc_run_multiple(FakeNode(), 'test "$svc" = "a b" && echo "$svc ok"', ["a b", "c"]) == {
+        "a b": (0, "a b ok"),
+        "c": (1, ""),
+    }
+
+
+def test_systemd_status_batched(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'svc_systemd': {
+                        "a": {},
+                        "b": {},
+                        "c": {},
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    systemd = FakeSystemd()
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', systemd.run)
+
+    results = {item.id: item.apply()[0] for item in sorted(node.items, key=lambda i: i.id)}
+
+    assert results == {
+        "svc_systemd:a": Item.STATUS_OK,
+        "svc_systemd:b": Item.STATUS_FIXED,
+        "svc_systemd:c": Item.STATUS_FIXED,
+    }
+    assert systemd.running == {"a.service", "b.service", "c.service"}
+    assert systemd.enabled == {"a.service", "b.service", "c.service"}
+    show_commands = [c for c in systemd.commands if " show " in c]
+    # one for all items, one for each item after fixing it
+    assert len(show_commands) == 3
+    assert show_commands[0].endswith(" -- a b c")
+    # nothing is shared with other instances of the same node
+    assert Repository(str(tmpdir)).get_node("node1")._item_caches == {}
+
+
+def test_systemd_status_sysv(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'svc_systemd': {
+                        "a": {},
+                        "d": {'enabled': False, 'running': False},
+                        "e": {'enabled': False, 'running': False},
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    systemd = FakeSystemd()
+    systemd.enabled.add("e.service")
+    systemd.sysv = {"d.service", "e.service"}
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', systemd.run)
+
+    results = {item.id: item.apply()[0] for item in sorted(node.items, key=lambda i: i.id)}
+
+    assert results == {
+        "svc_systemd:a": Item.STATUS_OK,
+        "svc_systemd:d": Item.STATUS_OK,
+        "svc_systemd:e": Item.STATUS_FIXED,
+    }
+    assert systemd.enabled == {"a.service", "c.service"}
+    # only the SysV services had to be checked individually
+    assert {c for c in systemd.commands if " is-enabled " in c} == {
+        "systemctl is-enabled -- d",
+        "systemctl is-enabled -- e",
+    }
@@ -0,0 +1,54 @@
+from os import listdir
+from os.path import join
+
+from bundlewrap import templatecache
+from bundlewrap.templatecache import jinja2_template, mako_template
+
+
+def _forget_templates():
+    templatecache._JINJA2_ENVIRONMENTS.clear()
+    templatecache._JINJA2_TEMPLATES.clear()
+    templatecache._MAKO_LOOKUPS.clear()
+    templatecache._MAKO_TEMPLATES.clear()
+
+
+def test_jinja2_template_shared(tmpdir):
+    with open(join(tmpdir, "inc"), 'w') as f:
+        f.write("included")
+    template = jinja2_template("{{ foo }} {% include 'inc' %}", [str(tmpdir)])
+    assert template.render(foo="bar") == "bar included"
+    assert jinja2_template("{{ foo }} {% include 'inc' %}", [str(tmpdir)]) is template
+    assert jinja2_template("{{ foo }}", [str(tmpdir)]) is not template
+
+
+def test_jinja2_template_disk_cache(tmpdir):
+    cache_dir = join(tmpdir, "cache")
+    jinja2_template("{{ foo }}", [str(tmpdir)], cache_dir=cache_dir)
+    assert len(listdir(join(cache_dir, "jinja2"))) == 1
+    _forget_templates()
+    template = jinja2_template("{{ foo }}", [str(tmpdir)], cache_dir=cache_dir)
+    assert template.render(foo="bar") == "bar"
+
+
+def test_mako_template_shared(tmpdir):
+    with open(join(tmpdir, "inc"), 'w') as f:
+        f.write("included")
+    template = mako_template("${foo} <%include file='inc'/>", [str(tmpdir)], 'utf-8')
+    assert template.render(foo="bär") == "bär included".encode('utf-8')
+    assert mako_template("${foo} <%include file='inc'/>", [str(tmpdir)], 'utf-8') is template
+    assert mako_template("${foo} <%include file='inc'/>", [str(tmpdir)], 'latin-1') \
+        is not template
+
+
+def test_mako_template_disk_cache(tmpdir):
+    cache_dir = join(tmpdir, "cache")
+    with open(join(tmpdir, "inc"), 'w') as f:
+        f.write("included")
+    mako_template("${foo} <%include file='inc'/>", [str(tmpdir)], 'utf-8', cache_dir=cache_dir)
+    assert len(listdir(join(cache_dir, "mako", "_text"))) == 1
+    _forget_templates()
+    template = mako_template(
+        "${foo} <%include file='inc'/>", [str(tmpdir)], 'utf-8', cache_dir=cache_dir,
+    )
+    assert type(template).__name__ == "ModuleTemplate"
+    assert template.render(foo="bär") == "bär included".encode('utf-8')
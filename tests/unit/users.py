@@ -0,0 +1,75 @@
+from threading import Lock
+
+from bundlewrap.items import clear_node_caches
+from bundlewrap.items.users import (
+    _account_database,
+    _group_name_for_gid,
+    _groups_for_user,
+    forget_account_database,
+)
+from bundlewrap.operations import RunResult
+
+
+PASSWD = """root:x:0:0:root:/root:/bin/bash
+jdoe:x:1000:1000:John Doe,,,:/home/jdoe:/bin/bash
+jdoe:x:1001:1001:duplicate:/home/jdoe2:/bin/sh
+"""
+SHADOW = """root:!:19000:0:99999:7:::
+jdoe:$6$foo$bar:19000:0:99999:7:::
+"""
+GROUP = """root:x:0:
+jdoe:x:1000:jdoe
+sudo:x:27:jdoe,other
+docker:x:999:other,jdoe
+"""
+
+
+class FakeNode:
+    name = "node1"
+    os = "linux"
+    OS_FAMILY_BSD = ()
+
+    def __init__(self):
+        self._item_caches = {}
+        self._item_caches_lock = Lock()
+        self.commands = []
+
+    def run(self, command, may_fail=False):
+        self.commands.append(command)
+        result = RunResult()
+        result.return_code = 0
+        result.stdout = "\0".join((PASSWD, SHADOW, GROUP)).encode()
+        result.stderr = b""
+        return result
+
+
+def test_account_database():
+    node = FakeNode()
+    database = _account_database(node)
+    assert database['users']['jdoe']['uid'] == "1000"
+    assert database['users']['jdoe']['full_name'] == "John Doe"
+    assert database['shadow']['jdoe'] == "$6$foo$bar"
+    assert database['groups']['sudo'] == "sudo:x:27:jdoe,other"
+    assert _group_name_for_gid(node, "999") == "docker"
+    assert _group_name_for_gid(node, "4711") is None
+    assert _groups_for_user(node, "jdoe") == {"docker", "sudo"}
+    assert _groups_for_user(node, "nobody") == set()
+    assert len(node.commands) == 1
+
+
+def test_forget_account_database():
+    node = FakeNode()
+    _account_database(node)
+    _account_database(node)
+    assert len(node.commands) == 1
+    forget_account_database(node)
+    _account_database(node)
+    assert len(node.commands) == 2
+
+
+def test_account_database_cleared_between_runs():
+    node = FakeNode()
+    _account_database(node)
+    clear_node_caches(node)
+    _account_database(node)
+    assert len(node.commands) == 2
@@ -0,0 +1,42 @@
+from hashlib import sha1
+from os import listdir, utime
+from os.path import join
+
+from bundlewrap import utils
+from bundlewrap.utils import hash_local_file
+
+
+def test_hash_local_file(tmpdir):
+    path = join(tmpdir, "file")
+    content = b"x" * (utils.HASH_CHUNK_SIZE * 2 + 17)
+    with open(path, 'wb') as f:
+        f.write(content)
+    assert hash_local_file(path) == sha1(content).hexdigest()
+
+
+def test_hash_local_file_changed(tmpdir):
+    path = join(tmpdir, "file")
+    with open(path, 'wb') as f:
+        f.write(b"foo")
+    utime(path, ns=(1, 1))
+    assert hash_local_file(path) == sha1(b"foo").hexdigest()
+    with open(path, 'wb') as f:
+        f.write(b"bar")
+    utime(path, ns=(2, 2))
+    assert hash_local_file(path) == sha1(b"bar").hexdigest()
+
+
+def test_hash_local_file_persistent_cache(tmpdir, monkeypatch):
+    cache_dir = join(tmpdir, "cache")
+    monkeypatch.setenv("BW_LOCAL_HASH_CACHE", cache_dir)
+    path = join(tmpdir, "file")
+    with open(path, 'wb') as f:
+        f.write(b"foo")
+    assert hash_local_file(path) == sha1(b"foo").hexdigest()
+    assert len(listdir(cache_dir)) == 1
+
+    utils._LOCAL_FILE_HASHES.clear()
+    cache_file = join(cache_dir, listdir(cache_dir)[0])
+    with open(cache_file, 'w') as f:
+        f.write("from cache")
+    assert hash_local_file(path) == "from cache"
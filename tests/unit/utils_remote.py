@@ -0,0 +1,105 @@
+from os import symlink
+from os.path import join
+from threading import Lock
+
+from bundlewrap.operations import run_local
+from bundlewrap.utils.remote import forget_path_info, PathInfo, prefetch_path_info
+
+
+class FakeNode:
+    name = "node1"
+    os = "linux"
+    OS_FAMILY_BSD = ()
+
+    def __init__(self):
+        self._item_caches = {}
+        self._item_caches_lock = Lock()
+        self._item_run = None
+        self.commands = []
+
+    def run(self, command, may_fail=False):
+        self.commands.append(command)
+        return run_local(["sh", "-c", command])
+
+
+def test_prefetch(tmpdir):
+    tmpdir = str(tmpdir)
+    with open(join(tmpdir, "file"), 'w') as f:
+        f.write("hi\n")
+    with open(join(tmpdir, "we ird'"), 'w') as f:
+        f.write("")
+    symlink("file", join(tmpdir, "link"))
+    paths = [join(tmpdir, name) for name in ("file", "we ird'", "link", "missing")]
+
+    node = FakeNode()
+    prefetch_path_info(node, paths + [tmpdir], hash_paths=paths[:2])
+    assert len(node.commands) == 1
+
+    path_info = PathInfo(node, paths[0])
+    assert path_info.is_file
+    assert path_info.size == 3
+    assert path_info.sha1 == "55ca6286e3e4f4fba5d0448333fa99fc5a404a73"
+
+    path_info = PathInfo(node, paths[1])
+    assert path_info.is_file
+    assert path_info.sha1 == "da39a3ee5e6b4b0d3255bfef95601890afd80709"
+
+    path_info = PathInfo(node, paths[2])
+    assert path_info.is_symlink
+    assert path_info.symlink_target == "file"
+
+    assert not PathInfo(node, paths[3]).exists
+    assert PathInfo(node, tmpdir).is_directory
+    assert len(node.commands) == 1
+
+    # prefetched info is only used once
+    assert PathInfo(node, paths[0]).sha1 == "55ca6286e3e4f4fba5d0448333fa99fc5a404a73"
+    assert len(node.commands) == 3
+
+
+def test_forget(tmpdir):
+    node = FakeNode()
+    prefetch_path_info(node, [str(tmpdir)])
+    forget_path_info(node)
+    assert PathInfo(node, str(tmpdir)).is_directory
+    assert len(node.commands) == 2
+
+
+def test_prefetch_without_hash(tmpdir):
+    path = join(str(tmpdir), "file")
+    with open(path, 'w') as f:
+        f.write("hi\n")
+
+    node = FakeNode()
+    prefetch_path_info(node, [path])
+    path_info = PathInfo(node, path)
+    assert path_info.is_file
+    assert len(node.commands) == 1
+    assert path_info.sha1 == "55ca6286e3e4f4fba5d0448333fa99fc5a404a73"
+    assert len(node.commands) == 2
+
+
+class FakeItem:
+    def __init__(self, item_type, name):
+        self.ITEM_TYPE_NAME = item_type
+        self.name = name
+
+
+def test_forget_changed_path(tmpdir):
+    tmpdir = str(tmpdir)
+    paths = [
+        tmpdir,
+        join(tmpdir, "a"),
+        join(tmpdir, "a", "b"),
+        join(tmpdir, "a", "b", "c"),
+        join(tmpdir, "ab"),
+    ]
+    node = FakeNode()
+    prefetch_path_info(node, paths)
+    forget_path_info(node, FakeItem("directory", paths[2]))
+    # parents and children are gone, siblings are kept
+    assert set(node._item_caches['path_info']) == {paths[4]}
+
+    prefetch_path_info(node, paths)
+    forget_path_info(node, FakeItem("action", "foo"))
+    assert node._item_caches['path_info'] == {}
@@ -0,0 +1,137 @@
+from shlex import split
+
+from bundlewrap.items import Item, zfs
+from bundlewrap.operations import RunResult
+from bundlewrap.repo import Repository
+from bundlewrap.utils.testing import make_repo
+
+
+class FakeZFS:
+    def __init__(self):
+        self.commands = []
+        self.datasets = {
+            "tank": {'compression': "off", 'mounted': "yes", 'mountpoint': "/tank"},
+            "tank/a": {'compression': "off", 'mounted': "yes", 'mountpoint': "/tank/a"},
+        }
+        self.pools = {"tank": {'autotrim': "off"}}
+
+    def _get(self, names, properties):
+        return "".join(
+            f"{name}\t{prop}\t{value}\n"
+            for name in names
+            for prop, value in self.datasets[name].items()
+            if properties == "all" or prop in properties.split(",")
+        )
+
+    def run(self, command, may_fail=False, **kwargs):
+        self.commands.append(command)
+        result = RunResult()
+        result.return_code = 0
+        result.stderr = b""
+        stdout = ""
+        if command.startswith("zfs get -Hp -o name,property,value -t filesystem,volume all "):
+            stdout = self._get(self.datasets, "all") + "\0" + "".join(
+                f"{name}\t{prop}\t{value}\n"
+                for name, properties in self.pools.items()
+                for prop, value in properties.items()
+            )
+        else:
+            args = split(command)
+            if args[:2] == ["zfs", "get"]:
+                path = args[-1]
+                names = [
+                    name for name in self.datasets
+                    if name == path or ("-r" in args and name.startswith(path + "/"))
+                ]
+                stdout = self._get(names, args[-2])
+            elif args[:2] == ["zfs", "set"]:
+                prop, value = args[2].split("=")
+                prop = zfs.PROPERTY_ALIASES.get(prop, prop)
+                for name in self.datasets:
+                    if name == args[3] or name.startswith(args[3] + "/"):
+                        self.datasets[name][prop] = value
+            elif args[:2] == ["zfs", "unmount"]:
+                self.datasets[args[2]]['mounted'] = "no"
+            elif args[:2] == ["zfs", "create"]:
+                self.datasets[args[-1]] = {'mounted': "no", 'mountpoint': "none"}
+            else:
+                raise AssertionError(f"unexpected command: {command}")
+        result.stdout = stdout.encode()
+        return result
+
+
+def test_zfs_state(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'zfs_datasets': {
+                        "tank": {'compression': "lz4", 'mountpoint': "/tank"},
+                        "tank/a": {'compression': "lz4", 'mountpoint': "/tank/a"},
+                        "tank/b": {},
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    fake_zfs = FakeZFS()
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', fake_zfs.run)
+
+    items = {item.id: item for item in node.items}
+    assert items["zfs_dataset:tank"].apply()[0] == Item.STATUS_FIXED
+    # tank/a inherited the new compression from tank
+    assert items["zfs_dataset:tank/a"].apply()[0] == Item.STATUS_OK
+    assert items["zfs_dataset:tank/b"].apply()[0] == Item.STATUS_FIXED
+    assert fake_zfs.commands == [
+        "zfs get -Hp -o name,property,value -t filesystem,volume all 2>/dev/null; "
+        "printf '\\0'; zpool get -H -o name,property,value all 2>/dev/null; true",
+        "zfs set compression=lz4 tank",
+        "zfs get -Hp -o name,property,value -t filesystem,volume -r compression,mounted tank",
+        "zfs create  tank/b",
+        "zfs get -Hp -o name,property,value -t filesystem,volume all tank/b",
+        "zfs unmount tank/b",
+        "zfs get -Hp -o name,property,value -t filesystem,volume -r mounted tank/b",
+    ]
+
+
+def test_zfs_aliases(tmpdir, monkeypatch):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'zfs_datasets': {
+                        "tank/a": {
+                            'compress': "off",
+                            'mountpoint': "/tank/a",
+                            'org:comment': "foo",
+                        },
+                    },
+                },
+            },
+        },
+        nodes={
+            "node1": {'bundles': ["test"]},
+        },
+    )
+    fake_zfs = FakeZFS()
+    node = Repository(str(tmpdir)).get_node("node1")
+    monkeypatch.setattr(node, 'run', fake_zfs.run)
+
+    item = node.get_item("zfs_dataset:tank/a")
+    assert item.sdict() == {
+        'compress': "off",
+        'mounted': "yes",
+        'mountpoint': "/tank/a",
+        'org:comment': "-",
+    }
+    assert item.apply()[0] == Item.STATUS_FIXED
+    assert fake_zfs.commands[1:] == [
+        "zfs set org:comment=foo tank/a",
+        "zfs get -Hp -o name,property,value -t filesystem,volume -r mounted,org:comment tank/a",
+    ]